@@ -4,11 +4,14 @@ Exposes API endpoints as MCP tools for AI agents
 """
 
 import os
+import asyncio
 import logging
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 from datetime import datetime
-from fastapi import FastAPI, HTTPException, Depends, Security, status
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Depends, Security, Request, WebSocket, WebSocketDisconnect, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from fastapi_mcp import FastApiMCP
 from pydantic import BaseModel, Field
@@ -18,6 +21,25 @@ import uvicorn
 # Load environment variables
 load_dotenv()
 
+from services.admission import AdmissionMiddleware, admission_controller
+from services.analytics_engine import GRANULARITIES, TABLE_SCHEMAS, analytics_engine, latest_growth
+from services.agent_streams import agent_stream_service, format_sse
+from services.attachments import AttachmentTooLarge, InvalidUpload, attachment_store
+from services.capacity import capacity_service
+from services.check_in import gate_check_in
+from services.event_geo import event_geo_index, geocoder
+from services.event_search import event_search_index
+from services.fieldsets import parse_fields, project, project_all, select_clause
+from services.ids import new_id
+from services.invalidation import invalidation_bus
+from services.job_queue import job_queue
+from services.leaderboard import leaderboard_service
+from services.live_feed import event_feed_hub
+from services.memory_store import memory_store
+from services.reconciliation import payment_reconciler
+from services.resilience import BackendUnavailable, DeadlineMiddleware, database_reader
+from services.supabase_service import supabase_service
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -25,15 +47,47 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start background services and shut them down with the server"""
+    # Build the search and geo indexes in the background so startup isn't blocked
+    background_tasks = [
+        asyncio.create_task(event_search_index.build(supabase_service)),
+        asyncio.create_task(event_geo_index.build(supabase_service)),
+        asyncio.create_task(capacity_service.run()),
+        asyncio.create_task(gate_check_in.run()),
+        asyncio.create_task(memory_store.run())
+    ]
+    job_queue.start()
+    invalidation_bus.start()
+    yield
+    for task in background_tasks:
+        task.cancel()
+    await job_queue.stop()
+    await agent_stream_service.close()
+    invalidation_bus.close()
+    gate_check_in.close()
+    if memory_store.dirty:
+        memory_store.save()
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Car Audio Events MCP API",
     description="MCP Server for Car Audio Events Platform - AI Agent Integration",
     version="1.0.0",
     docs_url="/docs",
-    redoc_url="/redoc"
+    redoc_url="/redoc",
+    lifespan=lifespan
 )
 
+# Add admission control (rate limits, concurrency caps, load shedding).
+# Added before CORS so rejections still carry CORS headers.
+app.add_middleware(AdmissionMiddleware, controller=admission_controller)
+
+# Give each request a deadline that database retries and hedges budget against.
+# Added after admission control so time spent queued there counts against it.
+app.add_middleware(DeadlineMiddleware, seconds=database_reader.default_budget)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -60,6 +114,13 @@ def verify_token(credentials: HTTPAuthorizationCredentials = Security(security))
         )
     return True
 
+def requested_fields(resource: str, fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """Validate a fields= parameter, answering 400 for fields the resource does not allow"""
+    try:
+        return parse_fields(resource, fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 # =====================
 # Pydantic Models
 # =====================
@@ -76,6 +137,8 @@ class EventCreate(BaseModel):
     early_bird_price: float = Field(..., description="Early bird registration price")
     regular_price: float = Field(..., description="Regular registration price")
     description: Optional[str] = Field(None, description="Event description")
+    latitude: Optional[float] = Field(None, description="Venue latitude; geocoded from location if omitted")
+    longitude: Optional[float] = Field(None, description="Venue longitude; geocoded from location if omitted")
 
 class CompetitorRegistration(BaseModel):
     """Model for registering a competitor"""
@@ -87,6 +150,23 @@ class CompetitorRegistration(BaseModel):
     class_id: str = Field(..., description="Competition class ID")
     team_name: Optional[str] = Field(None, description="Team name if applicable")
 
+class CheckInScan(BaseModel):
+    """Model for a gate check-in"""
+    code: str = Field(..., description="Scanned QR payload or typed registration ID")
+    gate: Optional[str] = Field(None, description="Gate or scanner name, kept in the local check-in log")
+    manual: bool = Field(False, description="Staff typed a registration ID; accepted without a QR signature")
+
+class ScoreSubmission(BaseModel):
+    """Model for posting a competitor's score"""
+    event_id: str = Field(..., description="Event ID")
+    class_id: str = Field(..., description="Competition class ID")
+    competitor_id: str = Field(..., description="Competitor ID, stable across events for season points")
+    competitor_name: Optional[str] = Field(None, description="Competitor name")
+    format: Optional[str] = Field(None, description="Scoring format (SPL, SQ, Show); set by the class's first score, default SPL")
+    score: float = Field(..., description="Score (dB for SPL, points for SQ/Show)")
+    tie_breaker: Optional[float] = Field(None, description="Tie-breaker, e.g. second SPL run or SQ install score")
+    season: Optional[str] = Field(None, description="Season the class counts towards (defaults to current year)")
+
 class EventAnalytics(BaseModel):
     """Model for event analytics request"""
     event_id: Optional[str] = Field(None, description="Specific event ID or None for all")
@@ -94,8 +174,10 @@ class EventAnalytics(BaseModel):
     end_date: Optional[str] = Field(None, description="Analytics end date")
     metrics: List[str] = Field(
         default=["registrations", "revenue", "attendance"],
-        description="Metrics to retrieve"
+        description="Metrics to retrieve: registrations, revenue, attendance, retention (cohorts), forecast"
     )
+    granularity: str = Field("month", description="Trend bucket size: day, week or month")
+    event_type: Optional[str] = Field(None, description="Event type (SPL, SQ, Show) to forecast attendance for when no event_id is given")
 
 class PaymentProcess(BaseModel):
     """Model for processing payments"""
@@ -105,6 +187,10 @@ class PaymentProcess(BaseModel):
     payment_method: str = Field(..., description="Payment method (stripe/paypal)")
     metadata: Optional[Dict[str, Any]] = Field(None, description="Additional metadata")
 
+class ReconciliationRun(BaseModel):
+    """Model for starting a payment reconciliation"""
+    full: bool = Field(False, description="Recheck every payment instead of only those since the last run")
+
 class SupportTicket(BaseModel):
     """Model for support ticket creation"""
     subject: str = Field(..., description="Ticket subject")
@@ -113,6 +199,13 @@ class SupportTicket(BaseModel):
     category: str = Field(..., description="Ticket category")
     user_email: str = Field(..., description="User email address")
     attachments: Optional[List[str]] = Field(None, description="Attachment URLs")
+    attachment_ids: Optional[List[str]] = Field(None, description="IDs of files uploaded to /api/attachments")
+
+class AgentQuery(BaseModel):
+    """Model for a streamed agent query"""
+    query: str = Field(..., description="The task or question for the agent")
+    profile: Optional[str] = Field(None, description="Tool profile (events/analytics/support) or None for all tools")
+    max_steps: Optional[int] = Field(None, description="Override the agent's maximum steps")
 
 # =====================
 # API Endpoints
@@ -130,7 +223,11 @@ async def root():
             "registrations": "/api/registrations",
             "analytics": "/api/analytics",
             "payments": "/api/payments",
-            "support": "/api/support"
+            "support": "/api/support",
+            "agent_stream": "/api/agent/stream"
+        },
+        "mcp_profiles": {
+            name: f"/mcp/{name}" for name in MCP_TOOL_PROFILES
         }
     }
 
@@ -143,8 +240,45 @@ async def health_check():
         "service": "Car Audio Events MCP Server"
     }
 
+@app.get("/api/admission/metrics", operation_id="get_admission_metrics", tags=["Operations"])
+async def get_admission_metrics(authenticated: bool = Depends(verify_token)):
+    """
+    Get admission control metrics: in-flight and queued requests, rejections and queue times per priority class.
+    MCP tool calls are admitted like direct API calls and counted separately.
+    """
+    return {
+        "success": True,
+        **admission_controller.snapshot()
+    }
+
+@app.get("/api/resilience/metrics", operation_id="get_resilience_metrics", tags=["Operations"])
+async def get_resilience_metrics(authenticated: bool = Depends(verify_token)):
+    """
+    Get database read resilience metrics: circuit breaker state, and per-read
+    retries, hedged requests, timeouts, stale answers and latency percentiles.
+    """
+    return {
+        "success": True,
+        **database_reader.snapshot()
+    }
+
+@app.get("/api/invalidation/metrics", operation_id="get_invalidation_metrics", tags=["Operations"])
+async def get_invalidation_metrics(authenticated: bool = Depends(verify_token)):
+    """
+    Get cross-worker invalidation metrics: peer workers, messages sent, received and dropped,
+    the shared write generation per topic, and event listing cache hits.
+    """
+    return {
+        "success": True,
+        **invalidation_bus.snapshot(),
+        "events_cache": {
+            "hits": supabase_service.events_cache.hits,
+            "misses": supabase_service.events_cache.misses
+        }
+    }
+
 # Event Management Endpoints
-@app.post("/api/events", tags=["Events"])
+@app.post("/api/events", operation_id="create_event", tags=["Events"])
 async def create_event(
     event: EventCreate,
     authenticated: bool = Depends(verify_token)
@@ -154,20 +288,20 @@ async def create_event(
     This endpoint allows authorized users to create new events with all necessary details.
     """
     try:
-        # In production, this would interact with your Supabase database
         logger.info(f"Creating event: {event.name}")
         
-        # Simulate event creation
+        # Persisting through the service also adds the event to the search index
+        record = await supabase_service.create_event({**event.model_dump(), "status": "draft"})
         created_event = {
-            "id": f"evt_{datetime.now().timestamp()}",
+            "id": record["id"],
             "name": event.name,
             "type": event.event_type,
             "start_date": event.start_date,
             "end_date": event.end_date,
             "location": event.location,
             "venue": event.venue_name,
-            "status": "draft",
-            "created_at": datetime.now().isoformat()
+            "status": record.get("status", "draft"),
+            "created_at": record.get("created_at", datetime.now().isoformat())
         }
         
         return {
@@ -179,56 +313,123 @@ async def create_event(
         logger.error(f"Error creating event: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
-@app.get("/api/events", tags=["Events"])
+@app.get("/api/events", operation_id="list_events", tags=["Events"])
 async def list_events(
     status: Optional[str] = None,
     event_type: Optional[str] = None,
-    limit: int = 10
+    limit: int = 10,
+    offset: int = 0,
+    fields: Optional[str] = None
 ):
     """
     List all events with optional filtering.
-    Returns a list of car audio competition events.
+    Returns a list of car audio competition events. Pass fields (e.g. "name,start_date,location")
+    to return only those columns; id is always included.
     """
+    columns = requested_fields("events", fields)
     try:
-        # Simulate fetching events
-        events = [
-            {
-                "id": "evt_001",
-                "name": "Summer Bass Championship 2025",
-                "type": "SPL",
-                "start_date": "2025-06-15",
-                "location": "Miami, FL",
-                "status": "published",
-                "registrations": 45
-            },
-            {
-                "id": "evt_002",
-                "name": "SQ Masters Series",
-                "type": "SQ",
-                "start_date": "2025-07-20",
-                "location": "Atlanta, GA",
-                "status": "published",
-                "registrations": 32
-            }
-        ]
-        
-        # Apply filters
-        if status:
-            events = [e for e in events if e["status"] == status]
-        if event_type:
-            events = [e for e in events if e["type"] == event_type]
-        
+        # Only the requested columns are selected from the database
+        events = await supabase_service.get_events(
+            status=status,
+            event_type=event_type,
+            limit=limit,
+            offset=offset,
+            columns=select_clause(columns)
+        )
         return {
             "success": True,
             "count": len(events),
-            "events": events[:limit]
+            "events": events
         }
+    except BackendUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"Error listing events: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/events/search", operation_id="search_events", tags=["Events"])
+async def search_events(
+    q: str,
+    status: Optional[str] = None,
+    event_type: Optional[str] = None,
+    start_after: Optional[str] = None,
+    start_before: Optional[str] = None,
+    limit: int = 10,
+    fields: Optional[str] = None
+):
+    """
+    Search events by free text across name, venue, location, formats and description.
+    Results are ranked by relevance; prefixes and single typos still match.
+    Pass fields (e.g. "name,start_date,score") to return only those fields.
+    """
+    columns = requested_fields("event_search", fields)
+    try:
+        events = event_search_index.search(
+            q,
+            limit=limit,
+            status=status,
+            event_type=event_type,
+            start_after=start_after,
+            start_before=start_before
+        )
+        return {
+            "success": True,
+            "count": len(events),
+            "index_ready": event_search_index.ready,
+            "events": project_all(events, columns)
+        }
+    except Exception as e:
+        logger.error(f"Error searching events: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/events/nearby", operation_id="find_events_nearby", tags=["Events"])
+async def find_events_nearby(
+    lat: Optional[float] = None,
+    lon: Optional[float] = None,
+    near: Optional[str] = None,
+    radius_miles: Optional[float] = None,
+    status: Optional[str] = None,
+    event_type: Optional[str] = None,
+    limit: int = 10,
+    fields: Optional[str] = None
+):
+    """
+    Find events near a point, nearest first, with their distance in miles.
+    Give lat/lon or a place to geocode in near ("Tampa, FL"); without radius_miles
+    the nearest events are returned regardless of distance.
+    Pass fields (e.g. "name,start_date,distance_miles") to return only those fields.
+    """
+    columns = requested_fields("events_nearby", fields)
+    if lat is not None and lon is not None:
+        origin = (lat, lon)
+    else:
+        origin = geocoder.geocode_text(near)
+        if origin is None:
+            raise HTTPException(status_code=400, detail="Provide lat and lon, or a known place in near")
+
+    try:
+        if radius_miles is not None:
+            events = event_geo_index.within(*origin, radius_miles, limit=limit, status=status, event_type=event_type)
+        else:
+            events = event_geo_index.nearest(*origin, k=limit, status=status, event_type=event_type)
+        return {
+            "success": True,
+            "count": len(events),
+            "origin": {"latitude": origin[0], "longitude": origin[1]},
+            "index_ready": event_geo_index.ready,
+            "events": project_all(events, columns)
+        }
+    except Exception as e:
+        logger.error(f"Error finding nearby events: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Registration Endpoints
-@app.post("/api/registrations", tags=["Registrations"])
+# Capacity holds are reconciled with confirmed registrations in the database
+capacity_service.snapshot_loader = supabase_service.get_event_capacity
+capacity_service.status_writer = supabase_service.update_registration_status
+capacity_service.event_resolver = supabase_service.get_registration_event_id
+
+@app.post("/api/registrations", operation_id="register_competitor", tags=["Registrations"])
 async def register_competitor(
     registration: CompetitorRegistration,
     authenticated: bool = Depends(verify_token)
@@ -240,163 +441,776 @@ async def register_competitor(
     try:
         logger.info(f"Registering {registration.competitor_name} for event {registration.event_id}")
         
-        # Simulate registration
+        # Take a slot hold (or a waitlist place) before writing anything
+        reservation = await capacity_service.reserve(registration.event_id, registration.class_id)
+        registration_status = "pending_payment" if reservation["status"] == "held" else "waitlisted"
+        try:
+            # Persisting through the service also publishes to the live event feed
+            record = await supabase_service.create_registration({**registration.model_dump(), "status": registration_status})
+        except Exception:
+            await capacity_service.release(reservation["reservation_id"])
+            raise
+        capacity_service.bind(reservation["reservation_id"], record["id"])
+        
         created_registration = {
-            "id": f"reg_{datetime.now().timestamp()}",
+            "id": record["id"],
             "event_id": registration.event_id,
             "competitor": registration.competitor_name,
             "email": registration.email,
             "class": registration.class_id,
-            "status": "pending_payment",
-            "created_at": datetime.now().isoformat()
+            "status": record.get("status", registration_status),
+            "created_at": record.get("created_at", datetime.now().isoformat()),
+            "reservation": reservation
         }
         
         return {
             "success": True,
-            "message": "Registration created successfully",
+            "message": "Registration created successfully" if registration_status == "pending_payment" else "Event is full; registration added to the waitlist",
             "registration": created_registration
         }
+    except BackendUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"Error creating registration: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/events/{event_id}/capacity", operation_id="get_event_capacity", tags=["Registrations"])
+async def get_event_capacity(event_id: str, registration_id: Optional[str] = None):
+    """
+    Get an event's remaining slots, live payment holds and waitlist length.
+    Pass registration_id to see that registration's hold expiry or waitlist position.
+    """
+    try:
+        capacity = await capacity_service.status(event_id, registration_id)
+        return {
+            "success": True,
+            **capacity
+        }
+    except BackendUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error fetching event capacity: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Check-in Endpoints
+# Codes are validated against a preloaded index; check-ins reach the database in batches
+gate_check_in.page_loader = supabase_service.get_page
+gate_check_in.batch_writer = supabase_service.sync_check_ins
+gate_check_in.recorded_listener = supabase_service.on_check_in_recorded
+
+@app.post("/api/events/{event_id}/check-in/preload", operation_id="preload_check_in", tags=["Check-in"])
+async def preload_check_in(event_id: str, authenticated: bool = Depends(verify_token)):
+    """
+    Load an event's registrations and existing check-ins for the gate.
+    Run before gates open, while connected; the index is kept on disk for offline restarts.
+    """
+    try:
+        return {
+            "success": True,
+            **await gate_check_in.preload(event_id)
+        }
+    except BackendUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error preloading check-in for event {event_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/events/{event_id}/check-ins", operation_id="check_in_competitor", tags=["Check-in"])
+async def check_in_competitor(
+    event_id: str,
+    scan: CheckInScan,
+    authenticated: bool = Depends(verify_token)
+):
+    """
+    Check a competitor in at the gate from a QR code or registration ID.
+    Rejections (already_checked_in, not_registered, not_confirmed, invalid_code) return accepted: false.
+    """
+    try:
+        return {
+            "success": True,
+            **await gate_check_in.check_in(event_id, scan.code, scan.gate, scan.manual)
+        }
+    except BackendUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error checking in for event {event_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/events/{event_id}/check-in", operation_id="get_check_in_status", tags=["Check-in"])
+async def get_check_in_status(event_id: str, authenticated: bool = Depends(verify_token)):
+    """
+    Get an event's check-in progress and how many check-ins are waiting to sync.
+    """
+    return {
+        "success": True,
+        **gate_check_in.status(event_id)
+    }
+
+@app.get("/api/events/{event_id}/check-in/filter", operation_id="get_check_in_filter", tags=["Check-in"])
+async def get_check_in_filter(event_id: str, authenticated: bool = Depends(verify_token)):
+    """
+    Get a Bloom filter of the event's confirmed registrations for handheld scanners.
+    A scanner that cannot reach the server rejects codes not in the filter; it never rejects a valid one.
+    """
+    try:
+        return {
+            "success": True,
+            **await gate_check_in.scanner_filter(event_id)
+        }
+    except BackendUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error building check-in filter for event {event_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/api/check-ins/sync", operation_id="sync_check_ins", tags=["Check-in"])
+async def sync_check_ins(authenticated: bool = Depends(verify_token)):
+    """
+    Sync locally recorded check-ins to the database now instead of waiting for the background sync.
+    """
+    try:
+        result = await gate_check_in.sync()
+        return {
+            "success": result["pending"] == 0,
+            **result,
+            "last_error": gate_check_in.last_sync_error
+        }
+    except Exception as e:
+        logger.error(f"Error syncing check-ins: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/registrations/{registration_id}/check-in-code", operation_id="get_check_in_code", tags=["Check-in"])
+async def get_check_in_code(registration_id: str, authenticated: bool = Depends(verify_token)):
+    """
+    Get the QR payload for a registration's ticket, signed when CHECK_IN_SECRET is set.
+    """
+    event_id = await supabase_service.get_registration_event_id(registration_id)
+    if event_id is None:
+        raise HTTPException(status_code=404, detail="Registration not found")
+    return {
+        "success": True,
+        "registration_id": registration_id,
+        "event_id": event_id,
+        "code": gate_check_in.check_in_code(event_id, registration_id)
+    }
+
+# Results Endpoints
+leaderboard_service.results_loader = supabase_service.get_competition_results
+leaderboard_service.results_writer = supabase_service.create_competition_result
+leaderboard_service.event_ids_loader = supabase_service.get_results_event_ids
+invalidation_bus.subscribe("results", leaderboard_service.apply_remote)
+
+@app.post("/api/results", operation_id="submit_score", tags=["Results"])
+async def submit_score(
+    submission: ScoreSubmission,
+    authenticated: bool = Depends(verify_token)
+):
+    """
+    Post a competitor's score and get their updated class standing.
+    Standings update incrementally; formats keep the best (SPL/SQ) or latest (Show) score.
+    """
+    try:
+        standing = await leaderboard_service.submit(submission.model_dump())
+        return {
+            "success": True,
+            "standing": standing
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except BackendUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error submitting score: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/events/{event_id}/leaderboard", operation_id="get_leaderboard", tags=["Results"])
+async def get_leaderboard(
+    event_id: str,
+    class_id: Optional[str] = None,
+    competitor_id: Optional[str] = None,
+    limit: int = 10,
+    offset: int = 0,
+    fields: Optional[str] = None
+):
+    """
+    Get current standings for an event, per class.
+    Pass class_id for one class, and competitor_id to include that competitor's rank.
+    Pass fields (e.g. "rank,competitor_name,score") to trim each standing.
+    """
+    columns = requested_fields("standings", fields)
+    try:
+        classes = await leaderboard_service.event_standings(
+            event_id,
+            class_id=class_id,
+            limit=limit,
+            offset=offset,
+            competitor_id=competitor_id
+        )
+        if columns:
+            for board in classes:
+                board["standings"] = project_all(board["standings"], columns)
+                board["competitor"] = project(board["competitor"], columns)
+        return {
+            "success": True,
+            "event_id": event_id,
+            "classes": classes
+        }
+    except BackendUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error fetching leaderboard: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/seasons/{season}/standings", operation_id="get_season_standings", tags=["Results"])
+async def get_season_standings(
+    season: str,
+    competitor_id: Optional[str] = None,
+    limit: int = 10,
+    offset: int = 0,
+    fields: Optional[str] = None
+):
+    """
+    Get season points standings.
+    Points are awarded by finishing position in each event class.
+    Pass fields (e.g. "rank,competitor_name,points") to trim each standing.
+    """
+    columns = requested_fields("season_standings", fields)
+    try:
+        standings = await leaderboard_service.season_standings(
+            season,
+            limit=limit,
+            offset=offset,
+            competitor_id=competitor_id
+        )
+        return {
+            "success": True,
+            **standings,
+            "standings": project_all(standings["standings"], columns),
+            "competitor": project(standings["competitor"], columns)
+        }
+    except BackendUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error fetching season standings: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Analytics Endpoints
-@app.post("/api/analytics", tags=["Analytics"])
+@app.post("/api/analytics", operation_id="get_analytics", tags=["Analytics"])
 async def get_analytics(
     request: EventAnalytics,
     authenticated: bool = Depends(verify_token)
 ):
     """
     Get analytics for events.
-    Provides detailed analytics and metrics for events.
+    Provides registrations, revenue and attendance with day/week/month trends
+    and period-over-period growth, cohort retention, and attendance forecasts
+    from similar past events.
     """
+    if request.granularity not in GRANULARITIES:
+        raise HTTPException(status_code=400, detail=f"granularity must be one of {', '.join(GRANULARITIES)}")
     try:
         logger.info(f"Fetching analytics for metrics: {request.metrics}")
         
-        # Simulate analytics data
+        await analytics_engine.refresh(supabase_service)
+        breakdown = analytics_engine.breakdown(request.event_id, request.start_date, request.end_date)
+        trends = analytics_engine.trends(request.granularity, request.event_id, request.start_date, request.end_date)
+        
         analytics_data = {
             "period": {
                 "start": request.start_date or "2025-01-01",
-                "end": request.end_date or datetime.now().strftime("%Y-%m-%d")
+                "end": request.end_date or datetime.now().strftime("%Y-%m-%d"),
+                "granularity": request.granularity
             },
             "metrics": {}
         }
         
+        # Headline growth compares the latest complete period in range with the one before it
         if "registrations" in request.metrics:
             analytics_data["metrics"]["registrations"] = {
-                "total": 156,
-                "growth": "+12%",
-                "by_class": {
-                    "SPL": 89,
-                    "SQ": 45,
-                    "Show": 22
-                }
+                "total": breakdown["registrations"]["total"],
+                "growth": latest_growth(trends["registrations"]),
+                "by_class": breakdown["registrations"]["by_class"],
+                "by_status": breakdown["registrations"]["by_status"],
+                "trend": trends["registrations"]
             }
         
         if "revenue" in request.metrics:
             analytics_data["metrics"]["revenue"] = {
-                "total": 15600.00,
-                "average_per_event": 3120.00,
-                "by_payment_method": {
-                    "stripe": 12000.00,
-                    "paypal": 3600.00
-                }
+                **breakdown["revenue"],
+                "growth": latest_growth(trends["revenue"]),
+                "trend": trends["revenue"]
             }
         
         if "attendance" in request.metrics:
+            retention = analytics_engine.retention(request.granularity, request.event_id, request.start_date, request.end_date)
             analytics_data["metrics"]["attendance"] = {
-                "total_attendees": 450,
-                "average_per_event": 90,
-                "retention_rate": "78%"
+                **breakdown["attendance"],
+                "retention_rate": retention["retention_rate"],
+                "trend": trends["check_ins"]
             }
         
+        if "retention" in request.metrics:
+            analytics_data["metrics"]["retention"] = analytics_engine.retention(
+                request.granularity, request.event_id, request.start_date, request.end_date
+            )
+        
+        if "forecast" in request.metrics:
+            analytics_data["metrics"]["forecast"] = analytics_engine.forecast(request.event_id, request.event_type)
+        
         return {
             "success": True,
             "analytics": analytics_data
         }
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except BackendUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
     except Exception as e:
         logger.error(f"Error fetching analytics: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/api/analytics/export/{table}", operation_id="export_analytics_table", tags=["Analytics"])
+async def export_analytics_table(
+    table: str,
+    format: str = "parquet",
+    authenticated: bool = Depends(verify_token)
+):
+    """
+    Download an analytics table (registrations, payments or event_check_ins)
+    as Parquet or Arrow IPC, or as NumPy .npz when pyarrow is not installed.
+    """
+    if table not in TABLE_SCHEMAS:
+        raise HTTPException(status_code=404, detail=f"Unknown analytics table: {table}")
+    if format not in ("parquet", "arrow", "npz"):
+        raise HTTPException(status_code=400, detail="format must be parquet, arrow or npz")
+    try:
+        await analytics_engine.refresh(supabase_service)
+        path = analytics_engine.export_table(table, format)
+        return FileResponse(path, filename=path.name, media_type="application/octet-stream")
+    except BackendUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error exporting analytics table {table}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 # Payment Endpoints
-@app.post("/api/payments", tags=["Payments"])
+@app.post(
+    "/api/payments",
+    operation_id="process_payment",
+    tags=["Payments"],
+    status_code=status.HTTP_202_ACCEPTED
+)
 async def process_payment(
     payment: PaymentProcess,
     authenticated: bool = Depends(verify_token)
 ):
     """
     Process a payment for registration.
-    Handles payment processing through Stripe or PayPal.
+    Handles payment processing through Stripe or PayPal in the background; poll the returned job.
     """
+    # Pin the registration's slot until the payment job confirms or releases it
+    try:
+        payment_state = await capacity_service.start_payment(payment.registration_id)
+    except BackendUnavailable as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    except Exception as e:
+        logger.error(f"Error checking capacity for payment: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    if payment_state == "unavailable":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Registration has no slot: its hold expired or it is waitlisted"
+        )
+    if payment_state != "started":
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Registration is already paid or its payment is processing"
+        )
+    
     try:
-        logger.info(f"Processing payment of {payment.amount} {payment.currency} via {payment.payment_method}")
+        logger.info(f"Queueing payment of {payment.amount} {payment.currency} via {payment.payment_method}")
         
-        # Simulate payment processing
-        payment_result = {
-            "id": f"pay_{datetime.now().timestamp()}",
-            "registration_id": payment.registration_id,
-            "amount": payment.amount,
-            "currency": payment.currency,
-            "status": "succeeded",
-            "payment_method": payment.payment_method,
-            "processed_at": datetime.now().isoformat()
-        }
+        # The payment job persists through the service, which also publishes to the live event feed;
+        # its idempotency key stops a retried job from recording the payment twice
+        payload = payment.model_dump()
+        payload["metadata"] = {**(payload["metadata"] or {}), "idempotency_key": new_id("pay")}
+        try:
+            job = job_queue.enqueue("payment", payload)
+        except Exception:
+            await capacity_service.fail_payment(payment.registration_id)
+            raise
         
         return {
             "success": True,
-            "message": "Payment processed successfully",
-            "payment": payment_result
+            "message": "Payment accepted for processing",
+            "job_id": job["id"],
+            "status_url": f"/api/jobs/{job['id']}",
+            "payment": {
+                "registration_id": payment.registration_id,
+                "amount": payment.amount,
+                "currency": payment.currency,
+                "status": "processing",
+                "payment_method": payment.payment_method
+            }
         }
     except Exception as e:
         logger.error(f"Error processing payment: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+payment_reconciler.page_loader = supabase_service.get_page
+
+@app.post(
+    "/api/payments/reconciliation",
+    operation_id="run_payment_reconciliation",
+    tags=["Payments"],
+    status_code=status.HTTP_202_ACCEPTED
+)
+async def run_payment_reconciliation(
+    run: ReconciliationRun,
+    authenticated: bool = Depends(verify_token)
+):
+    """
+    Reconcile succeeded payments against registrations in the background; poll the returned job.
+    Reports orphan payments, unpaid confirmed registrations, amount drift, duplicate payments
+    and paid registrations that are not confirmed. Runs are incremental unless full is set.
+    """
+    try:
+        job = job_queue.enqueue("payment_reconciliation", run.model_dump())
+        return {
+            "success": True,
+            "message": "Reconciliation started",
+            "job_id": job["id"],
+            "status_url": f"/api/jobs/{job['id']}"
+        }
+    except Exception as e:
+        logger.error(f"Error starting reconciliation: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/payments/reconciliation", operation_id="get_payment_reconciliation", tags=["Payments"])
+async def get_payment_reconciliation(authenticated: bool = Depends(verify_token)):
+    """
+    Get the report of the most recent payment reconciliation: counts per finding,
+    up to RECONCILIATION_MAX_FINDINGS examples of each, and the payment watermark.
+    """
+    report = payment_reconciler.latest_report()
+    if report is None:
+        raise HTTPException(status_code=404, detail="No reconciliation has run yet")
+    return {
+        "success": True,
+        "report": report
+    }
+
 # Support Endpoints
-@app.post("/api/support", tags=["Support"])
+@app.post(
+    "/api/support",
+    operation_id="create_support_ticket",
+    tags=["Support"],
+    status_code=status.HTTP_202_ACCEPTED
+)
 async def create_support_ticket(
     ticket: SupportTicket,
     authenticated: bool = Depends(verify_token)
 ):
     """
     Create a support ticket.
-    Handles support ticket creation for user issues.
+    Handles support ticket creation for user issues in the background; poll the returned job.
     """
+    attachments = [attachment_store.get(attachment_id) for attachment_id in ticket.attachment_ids or []]
+    if not all(attachments):
+        raise HTTPException(status_code=400, detail="Unknown attachment ID")
+    
     try:
-        logger.info(f"Creating support ticket: {ticket.subject}")
+        logger.info(f"Queueing support ticket: {ticket.subject}")
         
-        # Simulate ticket creation
-        created_ticket = {
-            "id": f"tkt_{datetime.now().timestamp()}",
-            "subject": ticket.subject,
-            "description": ticket.description,
-            "priority": ticket.priority,
-            "category": ticket.category,
-            "status": "open",
-            "created_by": ticket.user_email,
-            "created_at": datetime.now().isoformat()
-        }
+        payload = ticket.model_dump()
+        payload["attachments"] = (ticket.attachments or []) + [a["url"] for a in attachments]
+        job = job_queue.enqueue("support_ticket", payload)
         
         return {
             "success": True,
-            "message": "Support ticket created successfully",
-            "ticket": created_ticket
+            "message": "Support ticket accepted",
+            "job_id": job["id"],
+            "status_url": f"/api/jobs/{job['id']}",
+            "ticket": {
+                "subject": ticket.subject,
+                "priority": ticket.priority,
+                "category": ticket.category,
+                "status": "queued",
+                "created_by": ticket.user_email,
+                "attachments": payload["attachments"],
+                "created_at": job["created_at"]
+            }
         }
     except Exception as e:
         logger.error(f"Error creating support ticket: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post(
+    "/api/attachments",
+    operation_id="upload_attachments",
+    tags=["Support"],
+    status_code=status.HTTP_201_CREATED
+)
+async def upload_attachments(
+    request: Request,
+    ticket_id: Optional[str] = None,
+    authenticated: bool = Depends(verify_token)
+):
+    """
+    Upload files as multipart/form-data, optionally linking them to a ticket.
+    Files are streamed to disk and stored once per distinct content; pass the
+    returned IDs as attachment_ids when creating a ticket.
+    """
+    try:
+        upload = await attachment_store.receive(request.headers.get("content-type", ""), request.stream())
+    except AttachmentTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except InvalidUpload as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error uploading attachments: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    files = upload["files"]
+    ticket_id = ticket_id or upload["fields"].get("ticket_id")
+    if ticket_id:
+        files = [{**f, **linked} for f, linked in zip(files, attachment_store.link([f["id"] for f in files], ticket_id))]
+    return {
+        "success": True,
+        "count": len(files),
+        "attachments": files
+    }
+
+@app.get("/api/attachments/{attachment_id}", operation_id="download_attachment", tags=["Support"])
+async def download_attachment(attachment_id: str, authenticated: bool = Depends(verify_token)):
+    """Download an attachment; supports Range requests"""
+    attachment = attachment_store.get(attachment_id)
+    path = attachment_store.path(attachment_id) if attachment else None
+    if path is None or not path.exists():
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    # FileResponse answers Range requests and uses the server's zero-copy
+    # pathsend extension when available
+    return FileResponse(
+        path,
+        media_type=attachment["content_type"],
+        filename=attachment["filename"],
+        headers={"Cache-Control": "private, max-age=31536000, immutable", "ETag": f'"{attachment["sha256"]}"'}
+    )
+
+@app.get("/api/tickets/{ticket_id}/attachments", operation_id="list_ticket_attachments", tags=["Support"])
+async def list_ticket_attachments(ticket_id: str, authenticated: bool = Depends(verify_token)):
+    """List the files attached to a support ticket"""
+    try:
+        attachments = attachment_store.for_ticket(ticket_id)
+        return {
+            "success": True,
+            "count": len(attachments),
+            "attachments": attachments
+        }
+    except Exception as e:
+        logger.error(f"Error listing ticket attachments: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# Background Job Endpoints
+async def create_support_ticket_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Create the ticket, then link its uploaded attachments to it"""
+    attachment_ids = payload.pop("attachment_ids", None) or []
+    ticket = await supabase_service.create_support_ticket(payload)
+    if ticket and attachment_ids:
+        attachment_store.link(attachment_ids, ticket["id"])
+    return ticket
+
+async def process_payment_job(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Record the payment, then confirm the registration's slot"""
+    payment = await supabase_service.create_payment_record(payload)
+    if not payment or payment.get("status", "succeeded") != "succeeded":
+        raise RuntimeError(f"Payment for registration {payload['registration_id']} did not succeed")
+    await capacity_service.confirm(payload["registration_id"])
+    return payment
+
+async def payment_job_failed(payload: Dict[str, Any], error: str) -> None:
+    """Give the slot of a registration whose payment failed back to the waitlist"""
+    await capacity_service.fail_payment(payload["registration_id"])
+
+job_queue.register(
+    "payment",
+    process_payment_job,
+    concurrency=2,
+    max_attempts=3,
+    on_failure=payment_job_failed
+)
+job_queue.register("support_ticket", create_support_ticket_job, concurrency=4)
+# One reconciliation at a time; each run streams both tables
+job_queue.register("payment_reconciliation", payment_reconciler.run, concurrency=1, max_attempts=2)
+
+@app.get("/api/jobs/{job_id}", operation_id="get_job_status", tags=["Jobs"])
+async def get_job_status(job_id: str, authenticated: bool = Depends(verify_token)):
+    """
+    Get the status of a background job (queued, running, succeeded or failed).
+    Succeeded jobs include their result; queued retries include the next attempt time.
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {
+        "success": True,
+        "job": job
+    }
+
+# Live Event Feed Endpoints
+event_feed_hub.snapshot_loader = supabase_service.get_event_live_totals
+
+@app.get("/api/events/{event_id}/live", operation_id="stream_event_feed", tags=["Events"])
+async def stream_event_feed(
+    event_id: str,
+    request: Request,
+    authenticated: bool = Depends(verify_token)
+):
+    """
+    Stream live registration, payment and check-in deltas for an event as Server-Sent Events.
+    The first message is a snapshot of the running totals.
+    """
+    async def feed():
+        async with event_feed_hub.subscribe(event_id) as queue:
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=15.0)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(message)
+    
+    return StreamingResponse(
+        feed(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@app.websocket("/ws/events/{event_id}/live")
+async def event_feed_websocket(websocket: WebSocket, event_id: str):
+    """WebSocket variant of the live event feed; authenticate with ?token="""
+    expected_token = os.getenv("MCP_API_TOKEN", "car-audio-events-mcp-token")
+    if websocket.query_params.get("token") != expected_token:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    await websocket.accept()
+    async with event_feed_hub.subscribe(event_id) as queue:
+        async def relay():
+            while True:
+                await websocket.send_json(await queue.get())
+        
+        relay_task = asyncio.create_task(relay())
+        try:
+            # Viewers don't send anything; wait here to notice the disconnect
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        except WebSocketDisconnect:
+            pass
+        finally:
+            relay_task.cancel()
+
+# Agent Streaming Endpoints
+@app.post("/api/agent/stream", operation_id="stream_agent_query", tags=["Agent"])
+async def stream_agent_query(
+    agent_query: AgentQuery,
+    request: Request,
+    authenticated: bool = Depends(verify_token)
+):
+    """
+    Run an agent query and stream its progress as Server-Sent Events.
+    Emits start, token, tool_start, tool_end and final events (or error).
+    """
+    if agent_query.profile and agent_query.profile not in MCP_TOOL_PROFILES:
+        raise HTTPException(status_code=400, detail=f"Unknown tool profile: {agent_query.profile}")
+    
+    if not agent_stream_service.try_acquire():
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many concurrent agent streams",
+            headers={"Retry-After": "5"}
+        )
+    
+    try:
+        agent = agent_stream_service.checkout(agent_query.profile)
+    except Exception as e:
+        agent_stream_service.release()
+        logger.error(f"Error starting agent: {str(e)}")
+        raise HTTPException(status_code=503, detail=f"Agent unavailable: {str(e)}")
+    
+    logger.info(f"Streaming agent query ({agent_stream_service.active_streams} active): {agent_query.query}")
+    return StreamingResponse(
+        agent_stream_service.stream(
+            agent,
+            agent_query.query,
+            profile=agent_query.profile,
+            max_steps=agent_query.max_steps,
+            is_disconnected=request.is_disconnected
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # =====================
 # Initialize MCP Server
 # =====================
 
-# Create MCP server instance
-mcp = FastApiMCP(app)
+# Named tool profiles, each mounted at /mcp/{profile}.
+# Specialized agents connect to their profile so every LLM prompt
+# only carries the tool schemas that agent actually needs.
+MCP_TOOL_PROFILES: Dict[str, List[str]] = {
+    "events": [
+        "list_events", "search_events", "find_events_nearby", "create_event",
+        "register_competitor", "get_event_capacity", "submit_score", "get_leaderboard"
+    ],
+    "analytics": [
+        "list_events", "search_events", "get_analytics", "get_leaderboard", "get_season_standings",
+        "run_payment_reconciliation", "get_payment_reconciliation", "get_job_status"
+    ],
+    "support": [
+        "list_events", "search_events", "find_events_nearby", "create_support_ticket",
+        "list_ticket_attachments", "get_job_status"
+    ],
+}
+
+def compact_tool_descriptions(server: FastApiMCP) -> None:
+    """Reduce each tool description to the first line of its docstring"""
+    for tool in server.tools:
+        sections = (tool.description or "").split("\n\n")
+        # sections[0] is the route summary, sections[1] the docstring
+        summary = sections[1] if len(sections) > 1 and not sections[1].startswith("###") else sections[0]
+        tool.description = summary.strip().splitlines()[0]
+
+# Create MCP server instance (agents must not recursively start agent streams,
+# and binary uploads/downloads are not usable as tools)
+mcp = FastApiMCP(
+    app,
+    exclude_operations=[
+        "stream_agent_query", "stream_event_feed", "upload_attachments", "download_attachment",
+        "export_analytics_table"
+    ]
+)
 
 # Mount the MCP server to the FastAPI app
 mcp.mount()
 
 logger.info("MCP Server mounted successfully at /mcp")
 
+# Mount one compact MCP server per tool profile
+mcp_profiles: Dict[str, FastApiMCP] = {}
+for profile_name, operations in MCP_TOOL_PROFILES.items():
+    profile_mcp = FastApiMCP(
+        app,
+        name=f"{app.title} ({profile_name})",
+        include_operations=operations
+    )
+    compact_tool_descriptions(profile_mcp)
+    profile_mcp.mount(mount_path=f"/mcp/{profile_name}")
+    mcp_profiles[profile_name] = profile_mcp
+    logger.info(f"MCP profile '{profile_name}' mounted at /mcp/{profile_name} ({len(profile_mcp.tools)} tools)")
+
 # =====================
 # Main Entry Point
 # =====================
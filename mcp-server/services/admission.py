@@ -0,0 +1,331 @@
+"""
+Admission Control Service for MCP Server
+Per-token rate limits, per-class concurrency caps and priority load shedding
+"""
+
+import os
+import hmac
+import time
+import math
+import hashlib
+import heapq
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, Tuple
+
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class AdmissionClass:
+    """Limits for one priority class; lower priority values are served first"""
+    priority: int
+    max_concurrency: int
+    max_queue_wait: float
+    # Fraction of the global limit in use beyond which new requests are shed
+    shed_at: float
+    # Rate-limit tokens a request costs
+    cost: float = 1.0
+
+ADMISSION_CLASSES: Dict[str, AdmissionClass] = {
+    "payments": AdmissionClass(priority=0, max_concurrency=32, max_queue_wait=8.0, shed_at=1.0),
+    "registrations": AdmissionClass(priority=1, max_concurrency=32, max_queue_wait=4.0, shed_at=0.9),
+    "reads": AdmissionClass(priority=2, max_concurrency=24, max_queue_wait=2.0, shed_at=0.75),
+    "analytics": AdmissionClass(priority=3, max_concurrency=4, max_queue_wait=0.5, shed_at=0.5, cost=5.0),
+}
+
+# Paths never subject to admission control. MCP transport requests are exempt
+# because each tool call re-enters the app as a plain API request and is
+# admitted there.
+EXEMPT_PATHS = ("/", "/health", "/api/admission/metrics", "/api/resilience/metrics", "/api/invalidation/metrics", "/docs", "/redoc", "/openapi.json")
+EXEMPT_PREFIXES = ("/docs/", "/mcp")
+
+# Long-lived streams are rate limited but do not hold a concurrency slot
+STREAMING_SUFFIXES = ("/live", "/api/agent/stream")
+
+# Host fastapi_mcp uses when calling routes in-process for a tool call
+MCP_TOOL_HOST = "apiserver"
+
+def classify(method: str, path: str) -> str:
+    """Priority class of a request"""
+    if path.startswith("/api/payments"):
+        return "payments"
+    if path.startswith("/api/analytics") or path.startswith("/api/agent"):
+        return "analytics"
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return "reads"
+    return "registrations"
+
+class TokenBucket:
+    """Refilling token bucket"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def take(self, cost: float) -> float:
+        """Take cost tokens; returns 0 on success, otherwise seconds until enough are available"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (min(cost, self.capacity) - self.tokens) / self.rate
+
+class PriorityLimiter:
+    """Concurrency limiter whose waiters are granted slots by priority, then arrival"""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.in_use = 0
+        self.waiting = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = 0
+
+    async def acquire(self, priority: int, timeout: float) -> bool:
+        """Take a slot, waiting at most timeout seconds; returns False on timeout"""
+        # Freed slots go straight to waiters, so a free slot means nobody is queued
+        if self.in_use < self.limit:
+            self.in_use += 1
+            return True
+        if timeout <= 0:
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        self._seq += 1
+        self.waiting += 1
+        heapq.heappush(self._waiters, (priority, self._seq, future))
+        try:
+            await asyncio.wait_for(asyncio.shield(future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            if future.done():
+                # Granted just as the wait timed out
+                return True
+            self.waiting -= 1
+            future.cancel()
+            return False
+        except asyncio.CancelledError:
+            if future.done():
+                self.release()
+            else:
+                self.waiting -= 1
+                future.cancel()
+            raise
+
+    def release(self) -> None:
+        self.in_use -= 1
+        while self._waiters and self.in_use < self.limit:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                self.waiting -= 1
+                self.in_use += 1
+                future.set_result(True)
+
+class ClassMetrics:
+    """Counters and a window of recent queue times for one class"""
+
+    def __init__(self, window: int = 1024):
+        self.admitted = 0
+        self.rate_limited = 0
+        self.shed = 0
+        self.timed_out = 0
+        self.mcp_tool_calls = 0
+        self.queue_times: deque = deque(maxlen=window)
+
+    def queue_time_percentile(self, fraction: float) -> float:
+        if not self.queue_times:
+            return 0.0
+        ordered = sorted(self.queue_times)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "admitted": self.admitted,
+            "rate_limited": self.rate_limited,
+            "shed": self.shed,
+            "queue_timeouts": self.timed_out,
+            "mcp_tool_calls": self.mcp_tool_calls,
+            "queue_time_ms": {
+                "p50": round(self.queue_time_percentile(0.5) * 1000, 2),
+                "p95": round(self.queue_time_percentile(0.95) * 1000, 2),
+                "max": round(max(self.queue_times, default=0.0) * 1000, 2)
+            }
+        }
+
+class AdmissionController:
+    """
+    Decides whether a request runs now, waits, or is rejected with 429.
+
+    Each client token has a token bucket. Each priority class has its own
+    concurrency cap, and all classes share a global limit whose free slots
+    go to the highest-priority waiter. As the global limit fills up, lower
+    classes are shed early so payments and registrations keep their slots.
+    """
+
+    def __init__(
+        self,
+        global_limit: int = 64,
+        rate_per_second: float = 20.0,
+        burst: float = 40.0,
+        max_clients: int = 10_000,
+        classes: Optional[Dict[str, AdmissionClass]] = None
+    ):
+        self.global_limit = global_limit
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.max_clients = max_clients
+        self.classes = classes or ADMISSION_CLASSES
+        self._global = PriorityLimiter(global_limit)
+        self._class_limiters = {name: PriorityLimiter(c.max_concurrency) for name, c in self.classes.items()}
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self.metrics = {name: ClassMetrics() for name in self.classes}
+
+    def _bucket(self, client_key: str) -> TokenBucket:
+        bucket = self._buckets.get(client_key)
+        if bucket is None:
+            bucket = self._buckets[client_key] = TokenBucket(self.rate_per_second, self.burst)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(client_key)
+        return bucket
+
+    def _retry_after(self, class_name: str) -> int:
+        return max(1, math.ceil(self.metrics[class_name].queue_time_percentile(0.95) * 2))
+
+    async def admit(self, class_name: str, client_key: str, streaming: bool = False) -> Tuple[bool, int, str]:
+        """
+        Admit a request. Returns (admitted, retry_after, reason); an admitted
+        non-streaming request holds slots until release() is called.
+        """
+        admission_class = self.classes[class_name]
+        metrics = self.metrics[class_name]
+
+        wait = self._bucket(client_key).take(admission_class.cost)
+        if wait:
+            metrics.rate_limited += 1
+            return False, max(1, math.ceil(wait)), "Rate limit exceeded"
+        if streaming:
+            metrics.admitted += 1
+            return True, 0, ""
+
+        if self._global.in_use >= admission_class.shed_at * self.global_limit and admission_class.shed_at < 1.0:
+            metrics.shed += 1
+            return False, self._retry_after(class_name), "Server busy, shedding low-priority requests"
+
+        started = time.monotonic()
+        class_limiter = self._class_limiters[class_name]
+        if not await class_limiter.acquire(admission_class.priority, admission_class.max_queue_wait):
+            metrics.timed_out += 1
+            return False, self._retry_after(class_name), "Too many concurrent requests of this kind"
+
+        remaining = admission_class.max_queue_wait - (time.monotonic() - started)
+        try:
+            admitted = await self._global.acquire(admission_class.priority, remaining)
+        except asyncio.CancelledError:
+            class_limiter.release()
+            raise
+        if not admitted:
+            class_limiter.release()
+            metrics.timed_out += 1
+            return False, self._retry_after(class_name), "Server busy"
+
+        metrics.admitted += 1
+        metrics.queue_times.append(time.monotonic() - started)
+        return True, 0, ""
+
+    def release(self, class_name: str) -> None:
+        self._global.release()
+        self._class_limiters[class_name].release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "global": {
+                "limit": self.global_limit,
+                "in_flight": self._global.in_use,
+                "queued": self._global.waiting
+            },
+            "rate_limit": {
+                "per_second": self.rate_per_second,
+                "burst": self.burst,
+                "tracked_clients": len(self._buckets)
+            },
+            "classes": {
+                name: {
+                    "priority": self.classes[name].priority,
+                    "max_concurrency": self.classes[name].max_concurrency,
+                    "in_flight": self._class_limiters[name].in_use,
+                    "queued": self._class_limiters[name].waiting,
+                    **self.metrics[name].snapshot()
+                }
+                for name in self.classes
+            }
+        }
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an AdmissionController to HTTP requests"""
+
+    def __init__(self, app, controller: AdmissionController):
+        self.app = app
+        self.controller = controller
+
+    def _client_key(self, scope: Dict[str, Any]) -> str:
+        """The configured token's bucket for requests that carry it, otherwise the client IP's"""
+        headers = dict(scope.get("headers") or [])
+        authorization = headers.get(b"authorization", b"").decode("latin-1")
+        if authorization.lower().startswith("bearer "):
+            token = authorization[7:].strip()
+            # Unverified tokens share their IP's bucket, so a fresh random token is not a fresh bucket
+            expected = os.getenv("MCP_API_TOKEN", "car-audio-events-mcp-token")
+            if hmac.compare_digest(token.encode(), expected.encode()):
+                return "token:" + hashlib.sha256(token.encode()).hexdigest()[:16]
+        client = scope.get("client")
+        return "ip:" + (client[0] if client else "unknown")
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if scope["type"] != "http" or path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+            await self.app(scope, receive, send)
+            return
+
+        class_name = classify(scope["method"], path)
+        streaming = path.endswith(STREAMING_SUFFIXES)
+        admitted, retry_after, reason = await self.controller.admit(class_name, self._client_key(scope), streaming)
+
+        headers = dict(scope.get("headers") or [])
+        if headers.get(b"host", b"").decode("latin-1") == MCP_TOOL_HOST:
+            self.controller.metrics[class_name].mcp_tool_calls += 1
+
+        if not admitted:
+            logger.debug(f"Rejected {scope['method']} {path} ({class_name}): {reason}")
+            response = JSONResponse(
+                {"detail": reason, "priority_class": class_name},
+                status_code=429,
+                headers={"Retry-After": str(retry_after)}
+            )
+            await response(scope, receive, send)
+            return
+
+        if streaming:
+            await self.app(scope, receive, send)
+            return
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.controller.release(class_name)
+
+# Create a singleton instance
+admission_controller = AdmissionController(
+    global_limit=int(os.getenv("ADMISSION_GLOBAL_LIMIT", "64")),
+    rate_per_second=float(os.getenv("RATE_LIMIT_PER_SECOND", "20")),
+    burst=float(os.getenv("RATE_LIMIT_BURST", "40"))
+)
@@ -0,0 +1,162 @@
+"""
+Agent Stream Service for MCP Server
+Runs agent queries and relays their events to HTTP clients as Server-Sent Events
+"""
+
+import os
+import sys
+import json
+import asyncio
+import logging
+from pathlib import Path
+from contextlib import suppress
+from typing import Optional, List, Dict, Any, AsyncIterator, Callable
+
+logger = logging.getLogger(__name__)
+
+# The agents live in the sibling mcp-use-agents project
+AGENTS_DIR = os.getenv(
+    "MCP_AGENTS_DIR",
+    str(Path(__file__).resolve().parents[2] / "mcp-use-agents")
+)
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Encode an agent event as an SSE frame named after its type"""
+    payload = json.dumps(event, default=str)
+    return f"event: {event.get('type', 'message')}\ndata: {payload}\n\n"
+
+def load_agent_factory() -> Callable[[Optional[str]], Any]:
+    """Import CarAudioEventsAgent and return a factory taking a tool profile"""
+    if AGENTS_DIR not in sys.path:
+        sys.path.append(AGENTS_DIR)
+    from agents.car_audio_agent import CarAudioEventsAgent
+
+    def create_agent(profile: Optional[str]):
+        return CarAudioEventsAgent(
+            llm_provider=os.getenv("MCP_AGENT_LLM_PROVIDER", "openai"),
+            model=os.getenv("MCP_AGENT_MODEL") or None,
+            config_file=os.getenv("MCP_AGENT_CONFIG") or None,
+            tool_profile=profile
+        )
+
+    return create_agent
+
+class AgentStreamService:
+    """
+    Caps concurrent agent streams and keeps warm agents per tool profile,
+    so a new stream does not pay for LLM client and MCP session setup.
+    """
+
+    def __init__(
+        self,
+        max_streams: int = 8,
+        queue_size: int = 64,
+        heartbeat_interval: float = 15.0,
+        agent_factory: Optional[Callable[[Optional[str]], Any]] = None
+    ):
+        self.max_streams = max_streams
+        self.queue_size = queue_size
+        self.heartbeat_interval = heartbeat_interval
+        self._agent_factory = agent_factory
+        self._active = 0
+        self._idle_agents: Dict[Optional[str], List[Any]] = {}
+
+    @property
+    def active_streams(self) -> int:
+        return self._active
+
+    def try_acquire(self) -> bool:
+        """Reserve a stream slot, returning False when at capacity"""
+        if self._active >= self.max_streams:
+            return False
+        self._active += 1
+        return True
+
+    def release(self) -> None:
+        self._active -= 1
+
+    def checkout(self, profile: Optional[str]):
+        """Take a warm agent for the profile, creating one if none is idle"""
+        idle = self._idle_agents.get(profile)
+        if idle:
+            return idle.pop()
+        if self._agent_factory is None:
+            self._agent_factory = load_agent_factory()
+        return self._agent_factory(profile)
+
+    def _checkin(self, profile: Optional[str], agent: Any) -> None:
+        agent.reset()
+        self._idle_agents.setdefault(profile, []).append(agent)
+
+    async def stream(
+        self,
+        agent: Any,
+        query: str,
+        profile: Optional[str] = None,
+        max_steps: Optional[int] = None,
+        is_disconnected: Optional[Callable[[], Any]] = None
+    ) -> AsyncIterator[str]:
+        """
+        Run a query on a checked-out agent and yield SSE frames. The caller
+        must have reserved a slot with try_acquire; the slot is released and
+        the agent returned to the pool when the stream ends.
+
+        The agent runs in its own task and feeds a bounded queue, so a slow
+        client pauses the agent instead of buffering without limit. If the
+        client goes away the generator is closed and the agent run cancelled.
+        """
+        producer = None
+        completed = False
+        try:
+            queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+            async def produce():
+                try:
+                    async for event in agent.stream_events(query, max_steps=max_steps):
+                        await queue.put(event)
+                except Exception as e:
+                    logger.error(f"Agent stream failed: {str(e)}")
+                    await queue.put({"type": "error", "detail": str(e)})
+                await queue.put(None)
+
+            producer = asyncio.create_task(produce())
+            yield format_sse({"type": "start", "profile": profile})
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=self.heartbeat_interval)
+                except asyncio.TimeoutError:
+                    if is_disconnected and await is_disconnected():
+                        logger.info("Client disconnected, cancelling agent stream")
+                        break
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    completed = True
+                    break
+                yield format_sse(event)
+        finally:
+            if producer and not producer.done():
+                producer.cancel()
+                with suppress(asyncio.CancelledError, Exception):
+                    await producer
+            if completed:
+                self._checkin(profile, agent)
+            else:
+                # A cancelled run may leave the agent mid-step, so don't reuse it
+                with suppress(Exception):
+                    await agent.close()
+            self.release()
+
+    async def close(self) -> None:
+        """Close all warm agents"""
+        for agents in self._idle_agents.values():
+            for agent in agents:
+                with suppress(Exception):
+                    await agent.close()
+        self._idle_agents.clear()
+
+# Create a singleton instance
+agent_stream_service = AgentStreamService(
+    max_streams=int(os.getenv("MCP_MAX_AGENT_STREAMS", "8"))
+)
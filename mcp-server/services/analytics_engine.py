@@ -0,0 +1,815 @@
+"""
+Analytics Engine for MCP Server
+Columnar NumPy tables of registrations, payments and check-ins with vectorized breakdowns
+"""
+
+import os
+import time
+import asyncio
+import logging
+from pathlib import Path
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Iterable, Tuple, Callable
+
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+from services.capacity import CONFIRMED_STATUSES
+from services.invalidation import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+ANALYTICS_EXPORT_DIR = os.getenv(
+    "ANALYTICS_EXPORT_DIR",
+    str(Path(__file__).resolve().parent.parent / "data" / "analytics")
+)
+
+# Sentinel for missing timestamps (same bit pattern as datetime64 NaT)
+NAT = np.iinfo(np.int64).min
+
+# Column kinds per table: (kind, shared category domain, source fields in order of preference)
+TABLE_SCHEMAS: Dict[str, Dict[str, Tuple[str, Optional[str], Tuple[str, ...]]]] = {
+    "events": {
+        "id": ("category", "event", ("id",)),
+        "event_type": ("category", "event_type", ("event_type",)),
+        "start_date": ("timestamp", None, ("start_date",)),
+    },
+    "registrations": {
+        "id": ("category", "registration", ("id",)),
+        "event_id": ("category", "event", ("event_id",)),
+        "class_id": ("category", "class", ("class_id",)),
+        "competitor": ("category", "competitor", ("user_id", "email", "competitor_name")),
+        "status": ("category", "status", ("status",)),
+        "created_at": ("timestamp", None, ("created_at",)),
+    },
+    "payments": {
+        "registration_id": ("category", "registration", ("registration_id",)),
+        "amount": ("float", None, ("amount",)),
+        "payment_method": ("category", "payment_method", ("payment_method",)),
+        "status": ("category", "status", ("status",)),
+        "created_at": ("timestamp", None, ("created_at", "processed_at")),
+    },
+    "event_check_ins": {
+        "registration_id": ("category", "registration", ("registration_id",)),
+        "event_id": ("category", "event", ("event_id",)),
+        "checked_in_at": ("timestamp", None, ("checked_in_at",)),
+    },
+}
+
+GRANULARITIES = ("day", "week", "month")
+
+# Trend metrics: (table, time column, summed column, required payment status)
+TREND_METRICS: Dict[str, Tuple[str, str, Optional[str], Optional[str]]] = {
+    "registrations": ("registrations", "created_at", None, None),
+    "revenue": ("payments", "created_at", "amount", "succeeded"),
+    "check_ins": ("event_check_ins", "checked_in_at", None, None),
+}
+
+def bucket_index(timestamps: np.ndarray, granularity: str) -> np.ndarray:
+    """Consecutive integer bucket numbers: days, Monday-based weeks or months since the epoch"""
+    days = timestamps // 86400
+    if granularity == "day":
+        return days
+    if granularity == "week":
+        # 1970-01-01 was a Thursday
+        return (days + 3) // 7
+    return timestamps.astype("datetime64[s]").astype("datetime64[M]").astype(np.int64)
+
+def bucket_start(index: np.ndarray, granularity: str) -> np.ndarray:
+    """Epoch seconds at which each bucket number begins"""
+    if granularity == "day":
+        return index * 86400
+    if granularity == "week":
+        return (index * 7 - 3) * 86400
+    return index.astype("datetime64[M]").astype("datetime64[s]").astype(np.int64)
+
+def bucket_label(start: int, granularity: str) -> str:
+    day = str(np.datetime64(int(start), "s").astype("datetime64[D]"))
+    return day[:7] if granularity == "month" else day
+
+def growth(current: float, previous: float) -> Optional[str]:
+    """Period-over-period change as a signed percentage, or None without a baseline"""
+    if not previous:
+        return None
+    return f"{(current - previous) / previous * 100:+.1f}%"
+
+def latest_growth(trend: List[Dict[str, Any]]) -> Optional[str]:
+    """Growth of the last complete bucket in a trend, so a period cut short never reads as a drop"""
+    complete = [bucket for bucket in trend if not bucket["partial"]]
+    return complete[-1]["growth"] if complete else None
+
+class Categorical:
+    """Dictionary encoding shared by every column drawing on the same domain"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self._codes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def code(self, value: Any) -> int:
+        """Code of a value, or -1 if it was never seen"""
+        return self._codes.get(str(value), -1) if value is not None else -1
+
+    def encode(self, values: List[Any], count: int) -> np.ndarray:
+        # Intern each distinct value once, then map rows through a plain dict lookup
+        lookup = {None: -1}
+        for value in dict.fromkeys(values):
+            if value is not None:
+                key = str(value)
+                code = self._codes.get(key)
+                if code is None:
+                    code = self._codes[key] = len(self.values)
+                    self.values.append(key)
+                lookup[value] = code
+        return np.fromiter(map(lookup.__getitem__, values), dtype=np.int32, count=count)
+
+def gather(records: List[Dict[str, Any]], sources: Tuple[str, ...]) -> List[Any]:
+    """One field from every record, falling back to later sources where it is missing"""
+    raw = [r.get(sources[0]) for r in records]
+    for source in sources[1:]:
+        missing = [i for i, value in enumerate(raw) if value is None]
+        if not missing:
+            break
+        for i in missing:
+            raw[i] = records[i].get(source)
+    return raw
+
+def parse_timestamps(values: List[Any]) -> np.ndarray:
+    """ISO-8601 strings to int64 epoch seconds, NAT where missing"""
+    # Second resolution is plenty for analytics and lets NumPy parse without timezone handling
+    trimmed = np.array([str(v)[:19] if v else "NaT" for v in values], dtype="datetime64[s]")
+    return trimmed.astype(np.int64)
+
+def to_epoch(value: Optional[str]) -> Optional[int]:
+    if not value:
+        return None
+    return int(np.datetime64(str(value)[:19], "s").astype(np.int64))
+
+def distinct(codes: np.ndarray) -> int:
+    """Number of distinct non-negative category codes"""
+    codes = codes[codes >= 0]
+    return int(np.count_nonzero(np.bincount(codes))) if len(codes) else 0
+
+def date_range(start_date: Optional[str], end_date: Optional[str]) -> Tuple[Optional[int], Optional[int]]:
+    """Epoch bounds of a date range; a bare end date includes that whole day"""
+    start, end = to_epoch(start_date), to_epoch(end_date)
+    if end_date and len(end_date) <= 10:
+        end += 86399
+    return start, end
+
+class ColumnarTable:
+    """A table held as one NumPy array per column"""
+
+    def __init__(self, name: str, columns: Dict[str, np.ndarray], domains: Dict[str, Categorical]):
+        self.name = name
+        self.columns = columns
+        # Column name -> category domain, for categorical columns
+        self.domains = domains
+
+    def __len__(self) -> int:
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    @classmethod
+    def from_records(
+        cls,
+        name: str,
+        records: List[Dict[str, Any]],
+        domains: Dict[str, Categorical]
+    ) -> "ColumnarTable":
+        schema = TABLE_SCHEMAS[name]
+        count = len(records)
+        columns: Dict[str, np.ndarray] = {}
+        column_domains: Dict[str, Categorical] = {}
+
+        for column, (kind, domain, sources) in schema.items():
+            raw = gather(records, sources)
+            if kind == "category":
+                column_domains[column] = domains.setdefault(domain, Categorical())
+                columns[column] = column_domains[column].encode(raw, count)
+            elif kind == "timestamp":
+                columns[column] = parse_timestamps(raw)
+            else:
+                # None becomes NaN
+                columns[column] = np.array(raw, dtype=np.float64)
+        return cls(name, columns, column_domains)
+
+    def mask(
+        self,
+        equals: Optional[Dict[str, Any]] = None,
+        time_column: Optional[str] = None,
+        start: Optional[int] = None,
+        end: Optional[int] = None
+    ) -> np.ndarray:
+        """Boolean row mask for categorical equality filters and a time range"""
+        selected = np.ones(len(self), dtype=bool)
+        for column, value in (equals or {}).items():
+            if value is None:
+                continue
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            codes = [code for code in (self.domains[column].code(v) for v in values) if code >= 0]
+            selected &= np.isin(self.columns[column], codes)
+        if time_column and (start is not None or end is not None):
+            timestamps = self.columns[time_column]
+            selected &= timestamps != NAT
+            if start is not None:
+                selected &= timestamps >= start
+            if end is not None:
+                selected &= timestamps <= end
+        return selected
+
+    def group_by(
+        self,
+        key: str,
+        value: Optional[str] = None,
+        selected: Optional[np.ndarray] = None,
+        codes: Optional[np.ndarray] = None,
+        domain: Optional[Categorical] = None
+    ) -> Dict[str, Dict[str, float]]:
+        """
+        Count, sum and mean of value per category of key. codes/domain may be
+        passed to group by a derived column (e.g. a joined one).
+        """
+        codes = self.columns[key] if codes is None else codes
+        domain = self.domains[key] if domain is None else domain
+        selected = np.ones(len(codes), dtype=bool) if selected is None else selected
+        selected = selected & (codes >= 0)
+        group_codes = codes[selected]
+
+        counts = np.bincount(group_codes, minlength=len(domain))
+        sums = None
+        if value is not None:
+            values = self.columns[value][selected]
+            valid = ~np.isnan(values)
+            sums = np.bincount(group_codes[valid], weights=values[valid], minlength=len(domain))
+
+        result = {}
+        for code in np.flatnonzero(counts):
+            entry = {"count": int(counts[code])}
+            if sums is not None:
+                entry["sum"] = round(float(sums[code]), 2)
+                entry["mean"] = round(float(sums[code] / counts[code]), 2)
+            result[domain.values[code]] = entry
+        return result
+
+    def percentiles(
+        self,
+        value: str,
+        quantiles: Iterable[float] = (50, 90, 95),
+        selected: Optional[np.ndarray] = None
+    ) -> Dict[str, float]:
+        values = self.columns[value] if selected is None else self.columns[value][selected]
+        values = values[~np.isnan(values)]
+        if not len(values):
+            return {}
+        quantiles = list(quantiles)
+        results = np.percentile(values, quantiles)
+        return {f"p{int(q)}": round(float(r), 2) for q, r in zip(quantiles, results)}
+
+    # =====================
+    # Export
+    # =====================
+
+    def to_arrow(self):
+        """Arrow table with categorical columns dictionary-encoded"""
+        if pa is None:
+            raise RuntimeError("pyarrow is not installed")
+        arrays = {}
+        for column, data in self.columns.items():
+            if column in self.domains:
+                dictionary = pa.array(self.domains[column].values, type=pa.string())
+                indices = pa.array(data, mask=data < 0, type=pa.int32())
+                arrays[column] = pa.DictionaryArray.from_arrays(indices, dictionary)
+            elif data.dtype == np.int64:
+                arrays[column] = pa.array(data, mask=data == NAT, type=pa.int64()).cast(pa.timestamp("s"))
+            else:
+                arrays[column] = pa.array(data)
+        return pa.table(arrays)
+
+    def export(self, directory: str, file_format: str = "parquet") -> Path:
+        """
+        Write the table for offline work: Parquet or Arrow IPC when pyarrow is
+        installed, otherwise a NumPy .npz with the same dictionary-encoded columns.
+        """
+        Path(directory).mkdir(parents=True, exist_ok=True)
+        if file_format in ("parquet", "arrow") and pa is not None:
+            table = self.to_arrow()
+            if file_format == "parquet":
+                path = Path(directory) / f"{self.name}.parquet"
+                pq.write_table(table, path)
+            else:
+                path = Path(directory) / f"{self.name}.arrow"
+                with pa.OSFile(str(path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+            return path
+
+        path = Path(directory) / f"{self.name}.npz"
+        arrays = dict(self.columns)
+        for column, domain in self.domains.items():
+            arrays[f"{column}__categories"] = np.array(domain.values, dtype=str)
+        np.savez_compressed(path, **arrays)
+        return path
+
+class TrendSeries:
+    """
+    Per-bucket counts and sums of one metric. Buckets that ended before the
+    latest row are closed and kept across reloads; each update re-buckets only
+    rows from the last open bucket onward, found by binary search on the
+    table's time-sorted row order, so refreshes never rescan history. If the
+    number of rows before the open bucket changed (backfills or deletions),
+    the series is rebuilt. Buckets cut by a window's date range are recounted
+    from the rows inside it.
+    """
+
+    def __init__(self, granularity: str):
+        self.granularity = granularity
+        self.index = np.empty(0, dtype=np.int64)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.sums = np.empty(0, dtype=np.float64)
+        # Table rows (selected or not) timestamped before the open bucket
+        self.closed_rows = 0
+        self.loaded_at: Optional[float] = None
+        # The table the series was last updated from, for recounting clipped buckets
+        self._source: Optional[Tuple[np.ndarray, np.ndarray, Callable[[np.ndarray], np.ndarray], Optional[np.ndarray]]] = None
+
+    def update(self, sorted_times: np.ndarray, sorted_rows: np.ndarray, select: Callable[[np.ndarray], np.ndarray], values: Optional[np.ndarray]) -> None:
+        """
+        Extend the series from a time-sorted table. select(rows) returns the
+        mask of rows that belong to this series.
+        """
+        self._source = (sorted_times, sorted_rows, select, values)
+        begin, keep = int(np.searchsorted(sorted_times, NAT, side="right")), 0
+        if len(self.index):
+            open_start = int(bucket_start(self.index[-1:], self.granularity)[0])
+            closed_rows = int(np.searchsorted(sorted_times, open_start))
+            if closed_rows == self.closed_rows:
+                begin, keep = closed_rows, len(self.index) - 1
+
+        selected = select(sorted_rows[begin:])
+        rows = sorted_rows[begin:][selected]
+        buckets = bucket_index(sorted_times[begin:][selected], self.granularity)
+
+        if len(buckets):
+            # Rows are in time order, so each bucket is one contiguous run
+            edges = np.flatnonzero(np.diff(buckets)) + 1
+            starts = np.concatenate(([0], edges))
+            index = buckets[starts]
+            counts = np.diff(np.concatenate((starts, [len(buckets)])))
+            sums = np.add.reduceat(np.nan_to_num(values[rows]), starts) if values is not None else counts.astype(np.float64)
+        else:
+            index, counts, sums = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64))
+
+        self.index = np.concatenate((self.index[:keep], index))
+        self.counts = np.concatenate((self.counts[:keep], counts))
+        self.sums = np.concatenate((self.sums[:keep], sums))
+        if len(self.index):
+            self.closed_rows = int(np.searchsorted(sorted_times, bucket_start(self.index[-1:], self.granularity)[0]))
+
+    def range_totals(self, low: int, high: int) -> Tuple[int, float]:
+        """Count and sum of the series' rows timestamped in [low, high)"""
+        sorted_times, sorted_rows, select, values = self._source
+        begin, stop = np.searchsorted(sorted_times, [low, high])
+        rows = sorted_rows[begin:stop]
+        rows = rows[select(rows)]
+        return len(rows), float(np.nansum(values[rows])) if values is not None else float(len(rows))
+
+    def window(self, start: Optional[int], end: Optional[int]) -> List[Dict[str, Any]]:
+        """
+        Buckets overlapping [start, end], with empty buckets filled in and
+        growth against the previous bucket. Edge buckets cut by the range count
+        only the rows inside it, so the buckets add up to the range's totals.
+        Buckets cut by the range or still in progress are marked partial, and
+        their growth compares the rate over the covered share of each bucket.
+        """
+        if not len(self.index):
+            return []
+        # Clamped to the buckets that have data
+        first, last = int(self.index[0]), int(self.index[-1])
+        if start is not None:
+            first = max(first, int(bucket_index(np.array([start]), self.granularity)[0]))
+        if end is not None:
+            last = min(last, int(bucket_index(np.array([end]), self.granularity)[0]))
+        if first > last:
+            return []
+        # One bucket earlier so the first bucket in the window has a baseline
+        span = np.arange(first - 1, last + 1, dtype=np.int64)
+        counts = np.zeros(len(span), dtype=np.int64)
+        sums = np.zeros(len(span), dtype=np.float64)
+        present = (self.index >= span[0]) & (self.index <= span[-1])
+        counts[self.index[present] - span[0]] = self.counts[present]
+        sums[self.index[present] - span[0]] = self.sums[present]
+
+        starts = bucket_start(span, self.granularity)
+        ends = bucket_start(span + 1, self.granularity)
+        # The part of each bucket in the range; the baseline bucket before it is kept whole
+        low, high = starts.copy(), ends.copy()
+        if start is not None:
+            low[1:] = np.maximum(low[1:], start)
+        if end is not None:
+            high[1:] = np.minimum(high[1:], end + 1)
+        for i in np.flatnonzero((low > starts) | (high < ends)):
+            counts[i], sums[i] = self.range_totals(int(low[i]), int(high[i]))
+        covered = np.clip((np.minimum(high, time.time()) - low) / (ends - starts), 0.0, 1.0)
+
+        return [
+            {
+                "period": bucket_label(starts[i], self.granularity),
+                "count": int(counts[i]),
+                "total": round(float(sums[i]), 2),
+                "growth": growth(sums[i] / covered[i], sums[i - 1] / covered[i - 1]) if covered[i] > 0 and covered[i - 1] > 0 else None,
+                "partial": bool(covered[i] < 1.0)
+            }
+            for i in range(1, len(span))
+        ]
+
+class AnalyticsEngine:
+    """
+    Loads registrations, payments and check-ins into columnar tables and
+    answers breakdowns with vectorized NumPy operations. Category domains are
+    shared across tables, so codes join without string comparisons.
+    """
+
+    def __init__(self, refresh_interval: float = 300.0, min_reload_interval: float = 30.0, max_cached_series: int = 256):
+        self.refresh_interval = refresh_interval
+        # Writes through any worker make the tables due sooner, but not more often than this
+        self.min_reload_interval = min_reload_interval
+        self.max_cached_series = max_cached_series
+        self.domains: Dict[str, Categorical] = {}
+        self.tables: Dict[str, ColumnarTable] = {}
+        self.loaded_at: Optional[float] = None
+        self.loaded_generation: Optional[int] = None
+        self._payment_registration_rows: Optional[np.ndarray] = None
+        # Table -> (time column sorted ascending, row order that sorts it)
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+        self._trends: "OrderedDict[Tuple[str, str, Optional[str]], TrendSeries]" = OrderedDict()
+        # Retention and forecast results, valid until the next load
+        self._memo: Dict[Tuple, Dict[str, Any]] = {}
+        self._refresh_lock: Optional[asyncio.Lock] = None
+
+    def load(self, rows: Dict[str, List[Dict[str, Any]]]) -> None:
+        """Rebuild the tables from raw rows"""
+        started = time.perf_counter()
+        domains: Dict[str, Categorical] = {}
+        tables = {name: ColumnarTable.from_records(name, rows.get(name, []), domains) for name in TABLE_SCHEMAS}
+
+        # Payments and check-ins carry a registration code; map it to the registration's row
+        registration_rows = np.full(len(domains["registration"]), -1, dtype=np.int64)
+        registration_rows[tables["registrations"].columns["id"]] = np.arange(len(tables["registrations"]))
+        self._payment_registration_rows = np.where(
+            tables["payments"].columns["registration_id"] >= 0,
+            registration_rows[tables["payments"].columns["registration_id"]],
+            -1
+        )
+
+        sorted_tables = {}
+        for table, time_column, _, _ in TREND_METRICS.values():
+            times = tables[table].columns[time_column]
+            order = np.argsort(times, kind="stable")
+            sorted_tables[table] = (times[order], order)
+
+        self.domains, self.tables, self._sorted = domains, tables, sorted_tables
+        self._memo = {}
+        self.loaded_at = time.time()
+        logger.info(
+            f"Analytics engine loaded {sum(len(t) for t in tables.values())} rows "
+            f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+        )
+
+    def _generation(self) -> int:
+        """Sum of the write generations of every source table; changes whenever any worker writes one"""
+        return sum(invalidation_bus.generations.current(topic) for topic in ("events", "registrations", "payments", "check_ins"))
+
+    def _due(self) -> bool:
+        if not self.loaded_at:
+            return True
+        age = time.time() - self.loaded_at
+        if age >= self.refresh_interval:
+            return True
+        return age >= self.min_reload_interval and self._generation() != self.loaded_generation
+
+    async def refresh(self, service, force: bool = False) -> None:
+        """
+        Reload from the service if the tables are older than refresh_interval,
+        or older than min_reload_interval and written to since they were loaded.
+        A forced refresh also drops the trend caches, e.g. after backfilled rows.
+        """
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            # Concurrent callers wait for one reload instead of each starting their own
+            if not force and not self._due():
+                return
+            generation = self._generation()
+            try:
+                rows = {name: await service.get_analytics_rows(name) for name in TABLE_SCHEMAS}
+            except Exception as e:
+                if not self.loaded_at:
+                    raise
+                # Keep answering from the last load while the database recovers
+                logger.warning(f"Analytics refresh failed, serving tables loaded at {self.loaded_at:.0f}: {str(e)}")
+                return
+            if force:
+                self._trends.clear()
+            self.load(rows)
+            self.loaded_generation = generation
+
+    def _payment_column(self, column: str) -> np.ndarray:
+        """A registrations column aligned to payment rows (-1 where unmatched)"""
+        source = self.tables["registrations"].columns[column]
+        rows = self._payment_registration_rows
+        return np.where(rows >= 0, source[np.maximum(rows, 0)], -1)
+
+    def breakdown(
+        self,
+        event_id: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Registration, revenue and attendance breakdowns for one event or all events"""
+        start, end = date_range(start_date, end_date)
+        registrations = self.tables["registrations"]
+        payments = self.tables["payments"]
+        check_ins = self.tables["event_check_ins"]
+        event_domain = self.domains["event"]
+
+        registration_mask = registrations.mask({"event_id": event_id}, "created_at", start, end)
+
+        payment_events = self._payment_column("event_id")
+        payment_mask = payments.mask({"status": "succeeded"}, "created_at", start, end)
+        if event_id is not None:
+            payment_mask &= (payment_events == event_domain.code(event_id)) & (payment_events >= 0)
+        amounts = payments.columns["amount"][payment_mask]
+        revenue_total = float(np.nansum(amounts))
+        revenue_events = distinct(payment_events[payment_mask])
+
+        check_in_mask = check_ins.mask({"event_id": event_id}, "checked_in_at", start, end)
+        check_in_events = check_ins.columns["event_id"][check_in_mask]
+        attendance_events = distinct(check_in_events)
+        total_checked_in = int(check_in_mask.sum())
+
+        return {
+            "registrations": {
+                "total": int(registration_mask.sum()),
+                "by_class": {k: v["count"] for k, v in registrations.group_by("class_id", selected=registration_mask).items()},
+                "by_status": {k: v["count"] for k, v in registrations.group_by("status", selected=registration_mask).items()},
+            },
+            "revenue": {
+                "total": round(revenue_total, 2),
+                "transaction_count": int(payment_mask.sum()),
+                "average_per_event": round(revenue_total / revenue_events, 2) if revenue_events else 0.0,
+                "average_transaction": round(revenue_total / len(amounts), 2) if len(amounts) else 0.0,
+                "percentiles": payments.percentiles("amount", selected=payment_mask),
+                "by_payment_method": {
+                    k: v["sum"] for k, v in payments.group_by("payment_method", "amount", payment_mask).items()
+                },
+                "by_class": {
+                    k: v["sum"] for k, v in payments.group_by(
+                        "registration_id", "amount", payment_mask,
+                        codes=self._payment_column("class_id"), domain=self.domains["class"]
+                    ).items()
+                },
+            },
+            "attendance": {
+                "total_attendees": total_checked_in,
+                "average_per_event": round(total_checked_in / attendance_events, 1) if attendance_events else 0.0,
+            }
+        }
+
+    # =====================
+    # Trends, Retention and Forecasts
+    # =====================
+
+    def _event_codes(self, table: str, rows: np.ndarray) -> np.ndarray:
+        """Event codes of the given rows; payments resolve theirs through the registration"""
+        if table != "payments":
+            return self.tables[table].columns["event_id"][rows]
+        registration_rows = self._payment_registration_rows[rows]
+        event_ids = self.tables["registrations"].columns["event_id"]
+        return np.where(registration_rows >= 0, event_ids[np.maximum(registration_rows, 0)], -1)
+
+    def _series(self, metric: str, granularity: str, event_id: Optional[str]) -> TrendSeries:
+        """The cached series for a metric, brought up to date with the loaded tables"""
+        key = (metric, granularity, event_id)
+        series = self._trends.get(key)
+        if series is None:
+            series = self._trends[key] = TrendSeries(granularity)
+            if len(self._trends) > self.max_cached_series:
+                self._trends.popitem(last=False)
+        else:
+            self._trends.move_to_end(key)
+        if series.loaded_at == self.loaded_at:
+            return series
+
+        table, time_column, value_column, payment_status = TREND_METRICS[metric]
+        columns = self.tables[table].columns
+        event_code = self.domains["event"].code(event_id) if event_id is not None else None
+        status_code = self.domains["status"].code(payment_status) if payment_status else None
+
+        def select(rows: np.ndarray) -> np.ndarray:
+            selected = np.ones(len(rows), dtype=bool)
+            if status_code is not None:
+                selected &= columns["status"][rows] == status_code
+            if event_code is not None:
+                selected &= (self._event_codes(table, rows) == event_code) & (event_code >= 0)
+            return selected
+
+        sorted_times, order = self._sorted[table]
+        series.update(sorted_times, order, select, columns[value_column] if value_column else None)
+        series.loaded_at = self.loaded_at
+        return series
+
+    def trends(
+        self,
+        granularity: str = "month",
+        event_id: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """Registrations, revenue and check-ins per day, week or month, with period-over-period growth"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"granularity must be one of {', '.join(GRANULARITIES)}")
+        start, end = date_range(start_date, end_date)
+        return {
+            metric: self._series(metric, granularity, event_id).window(start, end)
+            for metric in TREND_METRICS
+        }
+
+    def retention(
+        self,
+        granularity: str = "month",
+        event_id: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        periods: int = 12
+    ) -> Dict[str, Any]:
+        """
+        Share of competitors who came back for another event. For one event,
+        the share of its competitors who registered for a later event;
+        otherwise competitors are grouped into cohorts by the period of their
+        first registration, with the share of each cohort registering again
+        in each following period.
+        """
+        key = ("retention", granularity, event_id, start_date, end_date, periods)
+        if key in self._memo:
+            return self._memo[key]
+
+        registrations = self.tables["registrations"]
+        selected = registrations.mask(None, "created_at", *date_range(start_date, end_date))
+        selected &= (registrations.columns["competitor"] >= 0) & (registrations.columns["created_at"] != NAT)
+        cancelled = self.domains["status"].code("cancelled")
+        if cancelled >= 0:
+            selected &= registrations.columns["status"] != cancelled
+        competitors = registrations.columns["competitor"][selected]
+        events = registrations.columns["event_id"][selected]
+        times = registrations.columns["created_at"][selected]
+
+        if event_id is not None:
+            target = self.domains["event"].code(event_id)
+            in_event = (events == target) & (target >= 0)
+            first_time = np.full(len(self.domains["competitor"]), np.iinfo(np.int64).max, dtype=np.int64)
+            np.minimum.at(first_time, competitors[in_event], times[in_event])
+            cohort_size = distinct(competitors[in_event])
+            returned = distinct(competitors[(events != target) & (times > first_time[competitors])])
+            result = {
+                "event_id": event_id,
+                "competitors": cohort_size,
+                "returned": returned,
+                "retention_rate": f"{returned / cohort_size * 100:.1f}%" if cohort_size else None
+            }
+            self._memo[key] = result
+            return result
+
+        if not len(competitors):
+            return {"competitors": 0, "returned": 0, "retention_rate": None, "cohorts": []}
+
+        # Group each competitor's registrations together, in time order
+        order = np.lexsort((times, competitors))
+        competitors, events, times = competitors[order], events[order], times[order]
+        is_first = np.concatenate(([True], competitors[1:] != competitors[:-1]))
+        group = np.cumsum(is_first) - 1
+        first_rows = np.flatnonzero(is_first)
+
+        returned = np.bincount(group, weights=events != events[first_rows][group], minlength=len(first_rows)) > 0
+        cohort_index = bucket_index(times[first_rows], granularity)
+        offsets = bucket_index(times, granularity) - cohort_index[group]
+        in_range = offsets < periods
+        # Each competitor counts once per period they registered in
+        active = np.unique(group[in_range] * periods + offsets[in_range])
+        active_group, active_offset = np.divmod(active, periods)
+
+        cohorts, cohort_of_group = np.unique(cohort_index, return_inverse=True)
+        sizes = np.bincount(cohort_of_group)
+        cohort_returned = np.bincount(cohort_of_group, weights=returned)
+        matrix = np.zeros((len(cohorts), periods), dtype=np.int64)
+        np.add.at(matrix, (cohort_of_group[active_group], active_offset), 1)
+
+        cohort_starts = bucket_start(cohorts, granularity)
+        result = {
+            "competitors": len(first_rows),
+            "returned": int(returned.sum()),
+            "retention_rate": f"{returned.mean() * 100:.1f}%",
+            "cohorts": [
+                {
+                    "cohort": bucket_label(cohort_starts[i], granularity),
+                    "competitors": int(sizes[i]),
+                    "returned": int(cohort_returned[i]),
+                    "active_by_period": [round(float(n) / sizes[i] * 100, 1) for n in matrix[i]]
+                }
+                for i in range(len(cohorts))
+            ]
+        }
+        self._memo[key] = result
+        return result
+
+    def forecast(self, event_id: Optional[str] = None, event_type: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Expected attendance from similar past events: events of the same type
+        that started earlier and had check-ins, weighted towards the most
+        recent. An event with confirmed registrations is forecast from the
+        show-up rate of those events; otherwise from their attendance.
+        """
+        key = ("forecast", event_id, event_type)
+        if key in self._memo:
+            return self._memo[key]
+
+        events = self.tables["events"]
+        event_codes = events.columns["id"]
+        start_dates = events.columns["start_date"]
+        type_codes = events.columns["event_type"]
+        event_count = len(self.domains["event"])
+
+        target = self.domains["event"].code(event_id) if event_id is not None else -1
+        cutoff = int(time.time())
+        type_code = self.domains["event_type"].code(event_type) if event_type else None
+        if event_id is not None:
+            rows = np.flatnonzero((event_codes == target) & (target >= 0))
+            if not len(rows):
+                raise ValueError(f"Event {event_id} not found")
+            type_code = int(type_codes[rows[0]])
+            if start_dates[rows[0]] != NAT:
+                cutoff = int(start_dates[rows[0]])
+            event_type = self.domains["event_type"].values[type_code] if type_code >= 0 else None
+
+        check_in_events = self.tables["event_check_ins"].columns["event_id"]
+        attendance = np.bincount(check_in_events[check_in_events >= 0], minlength=event_count)
+        registrations = self.tables["registrations"]
+        confirmed_mask = registrations.mask({"status": CONFIRMED_STATUSES}) & (registrations.columns["event_id"] >= 0)
+        confirmed = np.bincount(registrations.columns["event_id"][confirmed_mask], minlength=event_count)
+
+        similar = (event_codes >= 0) & (event_codes != target) & (start_dates != NAT) & (start_dates < cutoff)
+        similar &= attendance[np.maximum(event_codes, 0)] > 0
+        if type_code is not None:
+            similar &= type_codes == type_code
+        similar_codes = event_codes[similar]
+
+        result: Dict[str, Any] = {
+            "event_id": event_id,
+            "event_type": event_type,
+            "similar_events": len(similar_codes),
+            "expected_attendance": None
+        }
+        if len(similar_codes):
+            past_attendance = attendance[similar_codes].astype(np.float64)
+            past_confirmed = confirmed[similar_codes].astype(np.float64)
+            # Most recent event has weight 1, halving every three events back
+            recency = np.argsort(np.argsort(-start_dates[similar]))
+            weights = 0.5 ** (recency / 3)
+            show_up_rates = past_attendance / np.maximum(past_confirmed, 1)
+            show_up_rate = float(np.sum(weights * past_attendance) / max(np.sum(weights * past_confirmed), 1))
+            target_confirmed = int(confirmed[target]) if target >= 0 else 0
+
+            if target_confirmed:
+                expected = target_confirmed * show_up_rate
+                low, high = target_confirmed * np.percentile(show_up_rates, [10, 90])
+                basis = "confirmed_registrations"
+            else:
+                expected = float(np.average(past_attendance, weights=weights))
+                low, high = np.percentile(past_attendance, [10, 90])
+                basis = "past_attendance"
+            result.update({
+                "expected_attendance": int(round(expected)),
+                "range": {"low": int(np.floor(low)), "high": int(np.ceil(high))},
+                "basis": basis,
+                "confirmed_registrations": target_confirmed,
+                "show_up_rate": f"{show_up_rate * 100:.1f}%",
+                "similar_average_attendance": round(float(past_attendance.mean()), 1)
+            })
+        self._memo[key] = result
+        return result
+
+    def export_table(self, name: str, file_format: str = "parquet", directory: str = ANALYTICS_EXPORT_DIR) -> Path:
+        """Export one table; returns the written file"""
+        return self.tables[name].export(directory, file_format)
+
+# Create a singleton instance
+analytics_engine = AnalyticsEngine(
+    refresh_interval=float(os.getenv("ANALYTICS_REFRESH_SECONDS", "300")),
+    min_reload_interval=float(os.getenv("ANALYTICS_MIN_RELOAD_SECONDS", "30"))
+)
@@ -0,0 +1,237 @@
+"""
+Attachment Service for MCP Server
+Streaming multipart uploads into a content-addressed, deduplicated file store
+"""
+
+import os
+import time
+import hashlib
+import sqlite3
+import logging
+from pathlib import Path
+from datetime import datetime
+from typing import Optional, List, Dict, Any, AsyncIterator
+
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from services.ids import new_id
+
+logger = logging.getLogger(__name__)
+
+ATTACHMENTS_DIR = os.getenv(
+    "ATTACHMENTS_DIR",
+    str(Path(__file__).resolve().parent.parent / "data" / "attachments")
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS attachments (
+    id TEXT PRIMARY KEY,
+    sha256 TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    content_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    ticket_id TEXT,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS attachments_ticket ON attachments (ticket_id);
+"""
+
+class AttachmentTooLarge(Exception):
+    """An uploaded file exceeded the per-file size limit"""
+
+class InvalidUpload(Exception):
+    """The request body is not a usable multipart upload"""
+
+class _FilePart:
+    """One file part being streamed to a temporary file"""
+
+    def __init__(self, tmp_dir: Path):
+        self.headers: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.field_name: Optional[str] = None
+        self.content_type = "application/octet-stream"
+        self.hash = hashlib.sha256()
+        self.size = 0
+        self.tmp_path = tmp_dir / new_id("upload")
+        self.file = None
+        self.value = bytearray()
+
+class AttachmentStore:
+    """
+    Stores uploads at objects/<sha256[:2]>/<sha256[2:4]>/<sha256>, so a file
+    uploaded twice is kept once. Each upload still gets its own attachment ID
+    carrying its filename, content type and optional ticket link.
+    """
+
+    def __init__(self, root: str = ATTACHMENTS_DIR, max_file_bytes: int = 512 * 1024 * 1024):
+        self.root = Path(root)
+        self.max_file_bytes = max_file_bytes
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            (self.root / "tmp").mkdir(parents=True, exist_ok=True)
+            (self.root / "objects").mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.root / "attachments.db"), isolation_level=None, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.executescript(SCHEMA)
+        return self._conn
+
+    def object_path(self, sha256: str) -> Path:
+        return self.root / "objects" / sha256[:2] / sha256[2:4] / sha256
+
+    # =====================
+    # Uploads
+    # =====================
+
+    async def receive(self, content_type: str, body: AsyncIterator[bytes]) -> Dict[str, Any]:
+        """
+        Parse a multipart body chunk by chunk, writing file parts straight to
+        disk while hashing them. Returns the stored files and any plain form
+        fields. Memory use does not depend on file size.
+        """
+        mime_type, options = parse_options_header(content_type)
+        boundary = options.get(b"boundary")
+        if mime_type != b"multipart/form-data" or not boundary:
+            raise InvalidUpload("Expected a multipart/form-data body")
+
+        self._db()
+        tmp_dir = self.root / "tmp"
+        finished: List[_FilePart] = []
+        fields: Dict[str, str] = {}
+        state: Dict[str, Any] = {"part": None, "header_field": b"", "header_value": b""}
+
+        def on_part_begin():
+            state["part"] = _FilePart(tmp_dir)
+
+        def on_header_field(data, start, end):
+            state["header_field"] += data[start:end]
+
+        def on_header_value(data, start, end):
+            state["header_value"] += data[start:end]
+
+        def on_header_end():
+            part = state["part"]
+            part.headers[state["header_field"].decode("latin-1").lower()] = state["header_value"].decode("latin-1")
+            state["header_field"], state["header_value"] = b"", b""
+
+        def on_headers_finished():
+            part = state["part"]
+            _, disposition = parse_options_header(part.headers.get("content-disposition", ""))
+            part.field_name = disposition.get(b"name", b"").decode("utf-8", "replace")
+            if b"filename" in disposition:
+                part.filename = os.path.basename(disposition[b"filename"].decode("utf-8", "replace")) or "upload"
+                part.content_type = part.headers.get("content-type") or part.content_type
+                part.file = open(part.tmp_path, "wb")
+
+        def on_part_data(data, start, end):
+            part = state["part"]
+            chunk = data[start:end]
+            if part.file is None:
+                part.value += chunk
+                if len(part.value) > 64 * 1024:
+                    raise InvalidUpload(f"Form field {part.field_name} is too large")
+                return
+            part.size += len(chunk)
+            if part.size > self.max_file_bytes:
+                raise AttachmentTooLarge(f"{part.filename} exceeds the {self.max_file_bytes} byte limit")
+            part.hash.update(chunk)
+            part.file.write(chunk)
+
+        def on_part_end():
+            part = state["part"]
+            state["part"] = None
+            if part.file is None:
+                fields[part.field_name] = part.value.decode("utf-8", "replace")
+                return
+            part.file.close()
+            finished.append(part)
+
+        parser = MultipartParser(boundary, {
+            "on_part_begin": on_part_begin,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+        })
+
+        try:
+            async for chunk in body:
+                parser.write(chunk)
+            parser.finalize()
+        except Exception:
+            for part in finished + ([state["part"]] if state["part"] else []):
+                if part.file is not None:
+                    part.file.close()
+                    part.tmp_path.unlink(missing_ok=True)
+            raise
+
+        files = [self._commit(part, fields.get("ticket_id")) for part in finished]
+        return {"files": files, "fields": fields}
+
+    def _commit(self, part: _FilePart, ticket_id: Optional[str]) -> Dict[str, Any]:
+        """Move a finished upload to its content address and record it"""
+        sha256 = part.hash.hexdigest()
+        target = self.object_path(sha256)
+        deduplicated = target.exists()
+        if deduplicated:
+            part.tmp_path.unlink(missing_ok=True)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(part.tmp_path, target)
+
+        attachment_id = new_id("att")
+        self._db().execute(
+            "INSERT INTO attachments (id, sha256, filename, content_type, size, ticket_id, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (attachment_id, sha256, part.filename, part.content_type, part.size, ticket_id, time.time())
+        )
+        logger.info(f"Stored attachment {attachment_id} ({part.size} bytes{', deduplicated' if deduplicated else ''})")
+        return {**self.get(attachment_id), "deduplicated": deduplicated}
+
+    # =====================
+    # Lookup and Linking
+    # =====================
+
+    def get(self, attachment_id: str) -> Optional[Dict[str, Any]]:
+        row = self._db().execute("SELECT * FROM attachments WHERE id = ?", (attachment_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "filename": row["filename"],
+            "content_type": row["content_type"],
+            "size": row["size"],
+            "sha256": row["sha256"],
+            "ticket_id": row["ticket_id"],
+            "url": f"/api/attachments/{row['id']}",
+            "created_at": datetime.fromtimestamp(row["created_at"]).isoformat()
+        }
+
+    def path(self, attachment_id: str) -> Optional[Path]:
+        attachment = self.get(attachment_id)
+        return self.object_path(attachment["sha256"]) if attachment else None
+
+    def link(self, attachment_ids: List[str], ticket_id: str) -> List[Dict[str, Any]]:
+        """Attach uploads to a ticket; returns the attachments that exist"""
+        linked = []
+        for attachment_id in attachment_ids:
+            self._db().execute("UPDATE attachments SET ticket_id = ? WHERE id = ?", (ticket_id, attachment_id))
+            attachment = self.get(attachment_id)
+            if attachment:
+                linked.append(attachment)
+        return linked
+
+    def for_ticket(self, ticket_id: str) -> List[Dict[str, Any]]:
+        rows = self._db().execute(
+            "SELECT id FROM attachments WHERE ticket_id = ? ORDER BY created_at", (ticket_id,)
+        ).fetchall()
+        return [self.get(row["id"]) for row in rows]
+
+# Create a singleton instance
+attachment_store = AttachmentStore(
+    max_file_bytes=int(os.getenv("MAX_ATTACHMENT_BYTES", str(512 * 1024 * 1024)))
+)
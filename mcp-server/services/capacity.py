@@ -0,0 +1,367 @@
+"""
+Capacity Service for MCP Server
+In-process slot counters, payment holds and waitlists enforcing event max_competitors
+"""
+
+import os
+import time
+import heapq
+import asyncio
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple, Callable, Awaitable
+
+from services.ids import new_id
+
+logger = logging.getLogger(__name__)
+
+# Registration statuses that occupy a slot in the database
+CONFIRMED_STATUSES = ("confirmed", "paid")
+
+class EventCapacity:
+    """Slot accounting for one event: confirmed entries, live holds and the waitlist"""
+
+    def __init__(self, event_id: str, snapshot: Dict[str, Any]):
+        self.event_id = event_id
+        self.max_total: Optional[int] = snapshot.get("max_competitors")
+        self.class_limits: Dict[str, int] = dict(snapshot.get("class_limits") or {})
+        self.confirmed = 0
+        self.confirmed_by_class: Dict[str, int] = {}
+        self.held = 0
+        self.held_by_class: Dict[str, int] = {}
+        self.waitlist: "OrderedDict[str, str]" = OrderedDict()
+        self.version = 0
+        self.apply_snapshot(snapshot)
+
+    def apply_snapshot(self, snapshot: Dict[str, Any]) -> None:
+        self.max_total = snapshot.get("max_competitors", self.max_total)
+        self.class_limits.update(snapshot.get("class_limits") or {})
+        self.confirmed = int(snapshot.get("confirmed") or 0)
+        self.confirmed_by_class = dict(snapshot.get("confirmed_by_class") or {})
+
+    def has_room(self, class_id: Optional[str]) -> bool:
+        if self.max_total is not None and self.confirmed + self.held >= self.max_total:
+            return False
+        limit = self.class_limits.get(class_id) if class_id else None
+        if limit is not None:
+            used = self.confirmed_by_class.get(class_id, 0) + self.held_by_class.get(class_id, 0)
+            if used >= limit:
+                return False
+        return True
+
+    def remaining(self) -> Optional[int]:
+        if self.max_total is None:
+            return None
+        return max(self.max_total - self.confirmed - self.held, 0)
+
+    def adjust(self, state: str, class_id: Optional[str], delta: int) -> None:
+        if state == "held":
+            self.held += delta
+            if class_id:
+                self.held_by_class[class_id] = self.held_by_class.get(class_id, 0) + delta
+        elif state == "confirmed":
+            self.confirmed += delta
+            if class_id:
+                self.confirmed_by_class[class_id] = self.confirmed_by_class.get(class_id, 0) + delta
+            self.version += 1
+
+class CapacityService:
+    """
+    Enforces max_competitors without a database round trip per decision.
+    Check-and-take happens synchronously on the event loop, so concurrent
+    registrants can never both take the last slot. A registrant either gets
+    a hold or a place on an ordered waitlist; holds that lapse are released
+    and the waitlist is promoted in order. Starting a payment pins the hold
+    until the payment job finishes: success confirms the slot, failure
+    releases it. Confirmed counts are periodically reconciled with the
+    database.
+    """
+
+    def __init__(
+        self,
+        hold_seconds: float = 900.0,
+        reconcile_interval: float = 60.0,
+        snapshot_loader: Optional[Callable[[str], Awaitable[Dict[str, Any]]]] = None,
+        status_writer: Optional[Callable[[str, str], Awaitable[Any]]] = None,
+        event_resolver: Optional[Callable[[str], Awaitable[Optional[str]]]] = None
+    ):
+        self.hold_seconds = hold_seconds
+        self.reconcile_interval = reconcile_interval
+        self.snapshot_loader = snapshot_loader
+        self.status_writer = status_writer
+        self.event_resolver = event_resolver
+        self._events: Dict[str, EventCapacity] = {}
+        self._loading: Dict[str, asyncio.Event] = {}
+        self._reservations: Dict[str, Dict[str, Any]] = {}
+        self._by_registration: Dict[str, str] = {}
+        # Registrations confirmed by this process -> (event_id, class_id), so repeats are no-ops
+        self._confirmed: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+        self._expiries: List[Tuple[float, str]] = []
+
+    # =====================
+    # Loading and Reconciliation
+    # =====================
+
+    async def _event(self, event_id: str) -> EventCapacity:
+        """Capacity state for an event, loading it from the database on first use"""
+        capacity = self._events.get(event_id)
+        if capacity is not None:
+            return capacity
+        loading = self._loading.get(event_id)
+        if loading is not None:
+            await loading.wait()
+            # The load may have failed; try again rather than enforce nothing
+            return await self._event(event_id)
+
+        loading = self._loading[event_id] = asyncio.Event()
+        try:
+            snapshot = await self.snapshot_loader(event_id) if self.snapshot_loader else {}
+            self._events[event_id] = EventCapacity(event_id, snapshot)
+        except Exception as e:
+            # Nothing is cached, so the next call retries; callers fail rather than grant unlimited slots
+            logger.error(f"Error loading capacity for event {event_id}: {str(e)}")
+            raise
+        finally:
+            del self._loading[event_id]
+            loading.set()
+        return self._events[event_id]
+
+    async def reconcile(self) -> None:
+        """Refresh confirmed counts from the database for every loaded event"""
+        if not self.snapshot_loader:
+            return
+        for event_id, capacity in list(self._events.items()):
+            version = capacity.version
+            try:
+                snapshot = await self.snapshot_loader(event_id)
+            except Exception as e:
+                logger.error(f"Error reconciling capacity for event {event_id}: {str(e)}")
+                continue
+            # A local confirmation during the read may not be in the snapshot yet
+            if capacity.version == version:
+                capacity.apply_snapshot(snapshot)
+                await self._write_statuses(self._promote(capacity))
+
+    async def run(self, tick: float = 1.0) -> None:
+        """Expire lapsed holds every tick and reconcile every reconcile_interval"""
+        last_reconcile = time.monotonic()
+        while True:
+            await asyncio.sleep(tick)
+            try:
+                await self._write_statuses(self.expire())
+                if time.monotonic() - last_reconcile >= self.reconcile_interval:
+                    last_reconcile = time.monotonic()
+                    await self.reconcile()
+            except Exception as e:
+                logger.error(f"Error in capacity maintenance: {str(e)}")
+
+    # =====================
+    # Holds and Waitlist
+    # =====================
+
+    def _view(self, reservation: Dict[str, Any]) -> Dict[str, Any]:
+        capacity = self._events[reservation["event_id"]]
+        view = {
+            "reservation_id": reservation["id"],
+            "status": reservation["state"],
+            "remaining": capacity.remaining()
+        }
+        if reservation["state"] == "held":
+            view["hold_expires_at"] = datetime.fromtimestamp(reservation["expires_at"]).isoformat()
+        elif reservation["state"] == "waitlisted":
+            view["waitlist_position"] = list(capacity.waitlist).index(reservation["id"]) + 1
+        return view
+
+    def _hold(self, capacity: EventCapacity, reservation: Dict[str, Any]) -> None:
+        reservation["state"] = "held"
+        reservation["expires_at"] = time.time() + self.hold_seconds
+        capacity.adjust("held", reservation["class_id"], 1)
+        heapq.heappush(self._expiries, (reservation["expires_at"], reservation["id"]))
+
+    def _discard(self, reservation: Dict[str, Any]) -> None:
+        capacity = self._events[reservation["event_id"]]
+        if reservation["state"] in ("held", "paying"):
+            capacity.adjust("held", reservation["class_id"], -1)
+        elif reservation["state"] == "waitlisted":
+            capacity.waitlist.pop(reservation["id"], None)
+        self._reservations.pop(reservation["id"], None)
+        if reservation.get("registration_id"):
+            self._by_registration.pop(reservation["registration_id"], None)
+
+    def _promote(self, capacity: EventCapacity) -> List[Tuple[str, str]]:
+        """Give freed slots to waitlisted registrants in arrival order"""
+        promoted = []
+        for reservation_id, class_id in list(capacity.waitlist.items()):
+            if not capacity.has_room(None):
+                break
+            if not capacity.has_room(class_id):
+                continue
+            reservation = self._reservations[reservation_id]
+            del capacity.waitlist[reservation_id]
+            self._hold(capacity, reservation)
+            if reservation.get("registration_id"):
+                promoted.append((reservation["registration_id"], "pending_payment"))
+            logger.info(f"Promoted reservation {reservation_id} from the waitlist for event {capacity.event_id}")
+        return promoted
+
+    async def _write_statuses(self, updates: List[Tuple[str, str]]) -> None:
+        if not self.status_writer:
+            return
+        for registration_id, status in updates:
+            try:
+                await self.status_writer(registration_id, status)
+            except Exception as e:
+                logger.error(f"Error updating registration {registration_id} to {status}: {str(e)}")
+
+    async def reserve(self, event_id: str, class_id: Optional[str] = None) -> Dict[str, Any]:
+        """Take a slot hold if one is free, otherwise join the waitlist"""
+        capacity = await self._event(event_id)
+        # No awaits from here on: check-and-take is atomic on the event loop
+        reservation = {
+            "id": new_id("rsv"),
+            "event_id": event_id,
+            "class_id": class_id,
+            "registration_id": None
+        }
+        self._reservations[reservation["id"]] = reservation
+        if capacity.has_room(class_id) and not capacity.waitlist:
+            self._hold(capacity, reservation)
+        else:
+            reservation["state"] = "waitlisted"
+            capacity.waitlist[reservation["id"]] = class_id
+        return self._view(reservation)
+
+    def bind(self, reservation_id: str, registration_id: str) -> None:
+        """Attach the stored registration to its reservation"""
+        reservation = self._reservations.get(reservation_id)
+        if reservation is not None:
+            reservation["registration_id"] = registration_id
+            self._by_registration[registration_id] = reservation_id
+
+    async def release(self, reservation_id: Optional[str] = None, registration_id: Optional[str] = None) -> None:
+        """Give up a hold or waitlist place, e.g. when a registration is cancelled"""
+        reservation_id = reservation_id or self._by_registration.get(registration_id)
+        reservation = self._reservations.get(reservation_id)
+        if reservation is None:
+            return
+        self._discard(reservation)
+        await self._write_statuses(self._promote(self._events[reservation["event_id"]]))
+
+    async def start_payment(self, registration_id: str) -> str:
+        """
+        Pin a registration's slot while its payment is processed. Returns
+        "started", "in_progress" or "confirmed" for repeats, or "unavailable"
+        when the registration has no slot. Registrations without a live hold
+        take a free slot if there is one.
+        """
+        if registration_id in self._confirmed:
+            return "confirmed"
+        reservation = self._reservations.get(self._by_registration.get(registration_id))
+        if reservation is not None:
+            if reservation["state"] == "paying":
+                return "in_progress"
+            if reservation["state"] != "held":
+                return "unavailable"
+            # Paying holds do not lapse; expire() only releases "held"
+            reservation["state"] = "paying"
+            return "started"
+
+        event_id = await self.event_resolver(registration_id) if self.event_resolver else None
+        if event_id is None:
+            # Unknown to this process and the database; nothing to enforce against
+            return "started"
+        capacity = await self._event(str(event_id))
+        # No awaits from here on; a concurrent request for the same registration may have won
+        if registration_id in self._confirmed:
+            return "confirmed"
+        if registration_id in self._by_registration:
+            return "in_progress"
+        if not capacity.has_room(None) or capacity.waitlist:
+            return "unavailable"
+        reservation = {
+            "id": new_id("rsv"),
+            "event_id": capacity.event_id,
+            "class_id": None,
+            "registration_id": registration_id,
+            "state": "paying"
+        }
+        capacity.adjust("held", None, 1)
+        self._reservations[reservation["id"]] = reservation
+        self._by_registration[registration_id] = reservation["id"]
+        return "started"
+
+    async def confirm(self, registration_id: str) -> bool:
+        """Convert a registration's pinned slot into a confirmed one once its payment succeeded"""
+        if registration_id in self._confirmed:
+            return True
+        reservation = self._reservations.get(self._by_registration.get(registration_id))
+        if reservation is not None and reservation["state"] in ("held", "paying"):
+            self._discard(reservation)
+            self._events[reservation["event_id"]].adjust("confirmed", reservation["class_id"], 1)
+            self._confirmed[registration_id] = (reservation["event_id"], reservation["class_id"])
+        else:
+            # Paid without a slot tracked here (e.g. after a restart); reconciliation counts it
+            self._confirmed[registration_id] = (None, None)
+        await self._write_statuses([(registration_id, "confirmed")])
+        return True
+
+    async def fail_payment(self, registration_id: str) -> None:
+        """Release the slot of a registration whose payment failed, or roll back its confirmation"""
+        reservation = self._reservations.get(self._by_registration.get(registration_id))
+        if reservation is not None and reservation["state"] == "paying":
+            capacity = self._events[reservation["event_id"]]
+            self._discard(reservation)
+        elif registration_id in self._confirmed:
+            event_id, class_id = self._confirmed.pop(registration_id)
+            capacity = self._events.get(event_id) if event_id else None
+            if capacity is not None:
+                capacity.adjust("confirmed", class_id, -1)
+        else:
+            return
+        updates = [(registration_id, "payment_failed")]
+        if capacity is not None:
+            updates.extend(self._promote(capacity))
+        await self._write_statuses(updates)
+
+    def expire(self) -> List[Tuple[str, str]]:
+        """Release every lapsed hold and promote the waitlist; returns status updates to write"""
+        now = time.time()
+        updates: List[Tuple[str, str]] = []
+        touched: Dict[str, EventCapacity] = {}
+        while self._expiries and self._expiries[0][0] <= now:
+            expires_at, reservation_id = heapq.heappop(self._expiries)
+            reservation = self._reservations.get(reservation_id)
+            # Skip entries for holds that converted, or were re-issued with a new expiry
+            if reservation is None or reservation["state"] != "held" or reservation["expires_at"] != expires_at:
+                continue
+            self._discard(reservation)
+            touched[reservation["event_id"]] = self._events[reservation["event_id"]]
+            if reservation.get("registration_id"):
+                updates.append((reservation["registration_id"], "expired"))
+        for capacity in touched.values():
+            updates.extend(self._promote(capacity))
+        return updates
+
+    async def status(self, event_id: str, registration_id: Optional[str] = None) -> Dict[str, Any]:
+        """Current capacity for an event, with one registration's reservation if given"""
+        capacity = await self._event(event_id)
+        result = {
+            "event_id": event_id,
+            "max_competitors": capacity.max_total,
+            "confirmed": capacity.confirmed,
+            "held": capacity.held,
+            "waitlisted": len(capacity.waitlist),
+            "remaining": capacity.remaining(),
+            "class_limits": capacity.class_limits
+        }
+        reservation = self._reservations.get(self._by_registration.get(registration_id))
+        if reservation is not None:
+            result["reservation"] = self._view(reservation)
+        return result
+
+# Create a singleton instance
+capacity_service = CapacityService(
+    hold_seconds=float(os.getenv("REGISTRATION_HOLD_SECONDS", "900")),
+    reconcile_interval=float(os.getenv("CAPACITY_RECONCILE_SECONDS", "60"))
+)
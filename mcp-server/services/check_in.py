@@ -0,0 +1,472 @@
+"""
+Gate Check-in for MCP Server
+Preloaded per-event registration indexes, an append-only local check-in log and batched sync to event_check_ins
+"""
+
+import os
+import json
+import hmac
+import math
+import base64
+import time
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple, Callable, Awaitable
+
+try:
+    import fcntl
+except ImportError:  # Windows: one worker per log, no cross-process locking
+    fcntl = None
+
+from services.capacity import CONFIRMED_STATUSES
+from services.ids import new_id
+from services.invalidation import invalidation_bus
+
+logger = logging.getLogger(__name__)
+
+CHECK_IN_DIR = os.getenv(
+    "CHECK_IN_DIR",
+    str(Path(__file__).resolve().parent.parent / "data" / "check_ins")
+)
+
+# QR payloads are "CAE1:<event_id>:<registration_id>:<signature>"; bare registration IDs are accepted
+# only when no secret is configured or staff mark the entry as manual
+QR_PREFIX = "CAE1"
+
+# Columns synced to event_check_ins; the gate name stays in the local log
+SYNCED_COLUMNS = ("id", "event_id", "registration_id", "checked_in_at")
+
+def code_signature(secret: bytes, event_id: str, registration_id: str) -> str:
+    if not secret:
+        return ""
+    return hmac.new(secret, f"{event_id}:{registration_id}".encode(), hashlib.sha256).hexdigest()[:16]
+
+class BloomFilter:
+    """
+    A bit array probed at k positions derived from one blake2b-128 digest
+    (double hashing). Never rejects a member; sized for about 0.1% false
+    positives at capacity. The hashing is stable across processes so the
+    bits can be handed to scanners and checked there.
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        capacity = max(capacity, 1)
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.probes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> List[int]:
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        step = int.from_bytes(digest[8:], "little") | 1
+        return [(first + probe * step) % self.size for probe in range(self.probes)]
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "hash": "blake2b-128, probe i at (low64 + i * (high64 | 1)) mod bits, little-endian halves",
+            "bits": self.size,
+            "probes": self.probes,
+            "filter": base64.b64encode(bytes(self.bits)).decode()
+        }
+
+class GateIndex:
+    """
+    One event's registrations keyed by ID, plus who has checked in, so a
+    code is validated with one dict lookup. A Bloom filter of the confirmed
+    registrations, a few bytes per competitor, lets handheld scanners turn
+    away unknown codes themselves while they cannot reach the server.
+    """
+
+    def __init__(self, event_id: str, registrations: List[Dict[str, Any]], loaded_at: str):
+        self.event_id = event_id
+        self.loaded_at = loaded_at
+        self.registrations: Dict[str, Tuple[Optional[str], Optional[str], Optional[str]]] = {
+            str(r["id"]): (r.get("class_id"), r.get("competitor_name"), r.get("status")) for r in registrations
+        }
+        confirmed = [
+            registration_id for registration_id, (_, _, status) in self.registrations.items() if status in CONFIRMED_STATUSES
+        ]
+        self.confirmed = len(confirmed)
+        self.bloom = BloomFilter(self.confirmed)
+        for registration_id in confirmed:
+            self.bloom.add(registration_id)
+        # registration_id -> checked_in_at
+        self.checked_in: Dict[str, str] = {}
+
+    def to_snapshot(self) -> Dict[str, Any]:
+        return {
+            "event_id": self.event_id,
+            "loaded_at": self.loaded_at,
+            "registrations": [
+                {"id": registration_id, "class_id": class_id, "competitor_name": name, "status": status}
+                for registration_id, (class_id, name, status) in self.registrations.items()
+            ],
+            "checked_in": self.checked_in
+        }
+
+class GateCheckIn:
+    """
+    Validates check-in codes at the gate without a database round trip and
+    keeps working while the venue is offline.
+
+    preload() reads an event's registrations and existing check-ins into a
+    GateIndex and snapshots it to disk, so a restart (or another worker)
+    can rebuild it without the database. Each accepted check-in is appended
+    to a local log, announced to the other workers, and later inserted into
+    event_check_ins in batches by a background sync that tracks a byte
+    offset into the log. Sync skips check-ins already in the database (by
+    ID, or the same registration checked in at another gate), so replaying
+    the log after a failure is harmless.
+    """
+
+    def __init__(
+        self,
+        state_dir: str = CHECK_IN_DIR,
+        secret: str = "",
+        sync_interval: float = 5.0,
+        max_sync_interval: float = 120.0,
+        batch_size: int = 200,
+        fsync: bool = True
+    ):
+        self.state_dir = Path(state_dir)
+        self.secret = secret.encode()
+        self.sync_interval = sync_interval
+        self.max_sync_interval = max_sync_interval
+        self.batch_size = batch_size
+        self.fsync = fsync
+        self.indexes: Dict[str, GateIndex] = {}
+        self.counts = {"checked_in": 0, "already_checked_in": 0, "not_registered": 0, "not_confirmed": 0, "invalid_code": 0}
+        self.last_synced_at: Optional[str] = None
+        self.last_sync_error: Optional[str] = None
+        # Set by the app: async (table, columns, after, page_size, order, filters) -> the rows after row after
+        self.page_loader: Optional[Callable[..., Awaitable[List[Dict[str, Any]]]]] = None
+        # Set by the app: async (check_ins) -> number inserted
+        self.batch_writer: Optional[Callable[[List[Dict[str, Any]]], Awaitable[int]]] = None
+        # Set by the app: (check_in) for this worker's own check-ins; other workers hear them on the bus
+        self.recorded_listener: Optional[Callable[[Dict[str, Any]], Any]] = None
+        self._log_fd: Optional[int] = None
+        # Check-ins waiting for the next fsync, which runs in a thread and covers all of them
+        self._fsync_waiters: List[asyncio.Future] = []
+        self._fsync_task: Optional[asyncio.Task] = None
+        invalidation_bus.subscribe("check_ins", self.apply_remote)
+
+    @property
+    def log_path(self) -> Path:
+        return self.state_dir / "check_ins.log"
+
+    def _snapshot_path(self, event_id: str) -> Path:
+        # Hashed so an event ID can never name a path outside the directory
+        return self.state_dir / f"index-{hashlib.blake2b(event_id.encode(), digest_size=8).hexdigest()}.json"
+
+    def check_in_code(self, event_id: str, registration_id: str) -> str:
+        """The QR payload for a registration's ticket"""
+        return f"{QR_PREFIX}:{event_id}:{registration_id}:{code_signature(self.secret, event_id, registration_id)}"
+
+    def _parse(self, event_id: str, code: str, manual: bool = False) -> Tuple[Optional[str], Optional[str]]:
+        """The registration ID a code names, or an error"""
+        code = code.strip()
+        if not code.startswith(QR_PREFIX + ":"):
+            if not code:
+                return None, "Empty code"
+            # With a secret set, an unsigned ID only passes when staff entered it by hand
+            if self.secret and not manual:
+                return None, "Registration IDs must be entered manually by staff"
+            return code, None
+        parts = code.split(":")
+        if len(parts) != 4:
+            return None, "Malformed QR code"
+        _, code_event_id, registration_id, signature = parts
+        if code_event_id != event_id:
+            return None, "QR code is for another event"
+        if self.secret and not hmac.compare_digest(signature, code_signature(self.secret, event_id, registration_id)):
+            return None, "QR code signature does not match"
+        return registration_id, None
+
+    # =====================
+    # Index
+    # =====================
+
+    async def _pages(self, table: str, columns: str, event_id: str):
+        after, page_size = None, 1000
+        while True:
+            rows = await self.page_loader(table, columns, after, page_size, "id", [("eq", "event_id", event_id)])
+            yield rows
+            if len(rows) < page_size:
+                return
+            after = rows[-1]
+
+    def _replay_log(self, index: GateIndex) -> None:
+        """Mark check-ins from the local log, including any not yet synced"""
+        for record in self._read_log(0)[0]:
+            if record.get("event_id") == index.event_id:
+                index.checked_in.setdefault(record["registration_id"], record["checked_in_at"])
+
+    async def preload(self, event_id: str) -> Dict[str, Any]:
+        """Load an event's registrations and check-ins from the database and snapshot them for offline use"""
+        if self.page_loader is None:
+            raise RuntimeError("Gate check-in has no page loader")
+        started = time.perf_counter()
+        registrations: List[Dict[str, Any]] = []
+        async for rows in self._pages("registrations", "id,class_id,competitor_name,status", event_id):
+            registrations.extend(rows)
+        index = GateIndex(event_id, registrations, datetime.now().isoformat())
+        async for rows in self._pages("event_check_ins", "id,registration_id,checked_in_at", event_id):
+            for row in rows:
+                index.checked_in.setdefault(str(row["registration_id"]), row.get("checked_in_at"))
+        self._replay_log(index)
+
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        path = self._snapshot_path(event_id)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(index.to_snapshot(), default=str))
+        os.replace(tmp, path)
+        self.indexes[event_id] = index
+        logger.info(f"Preloaded {len(index.registrations)} registrations for check-in at event {event_id}")
+        return {
+            **self.status(event_id),
+            "duration_ms": round((time.perf_counter() - started) * 1000, 1)
+        }
+
+    async def _index(self, event_id: str) -> GateIndex:
+        """The event's index from memory, its snapshot on disk, or the database"""
+        index = self.indexes.get(event_id)
+        if index is not None:
+            return index
+        path = self._snapshot_path(event_id)
+        if path.exists():
+            snapshot = json.loads(path.read_text())
+            index = GateIndex(event_id, snapshot["registrations"], snapshot["loaded_at"])
+            index.checked_in.update(snapshot.get("checked_in") or {})
+            self._replay_log(index)
+            self.indexes[event_id] = index
+            return index
+        await self.preload(event_id)
+        return self.indexes[event_id]
+
+    # =====================
+    # Check-in
+    # =====================
+
+    def _append(self, record: Dict[str, Any]) -> None:
+        if self._log_fd is None:
+            self.state_dir.mkdir(parents=True, exist_ok=True)
+            self._log_fd = os.open(self.log_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        line = (json.dumps(record) + "\n").encode()
+        if fcntl is not None:
+            fcntl.flock(self._log_fd, fcntl.LOCK_EX)
+        try:
+            os.write(self._log_fd, line)
+        finally:
+            if fcntl is not None:
+                fcntl.flock(self._log_fd, fcntl.LOCK_UN)
+
+    async def _durable(self) -> None:
+        """Wait until every appended record is on disk; scans arriving together share one fsync"""
+        future = asyncio.get_running_loop().create_future()
+        self._fsync_waiters.append(future)
+        if self._fsync_task is None or self._fsync_task.done():
+            self._fsync_task = asyncio.create_task(self._flush())
+        await future
+
+    async def _flush(self) -> None:
+        while self._fsync_waiters:
+            waiters, self._fsync_waiters = self._fsync_waiters, []
+            try:
+                # Off the event loop, so other scans are validated while the disk syncs
+                await asyncio.to_thread(os.fsync, self._log_fd)
+            except OSError as e:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_exception(e)
+            else:
+                for waiter in waiters:
+                    if not waiter.done():
+                        waiter.set_result(None)
+
+    async def check_in(self, event_id: str, code: str, gate: Optional[str] = None, manual: bool = False) -> Dict[str, Any]:
+        """
+        Validate a scanned or typed code and record the check-in. Returns
+        accepted with status checked_in, or a rejection: already_checked_in,
+        not_registered, not_confirmed or invalid_code. manual marks a
+        registration ID typed by staff, accepted without a signature.
+        """
+        index = await self._index(event_id)
+        started = time.perf_counter()
+        registration_id, error = self._parse(event_id, code, manual)
+        registration = index.registrations.get(registration_id) if registration_id else None
+
+        result: Dict[str, Any] = {"event_id": event_id, "registration_id": registration_id}
+        if error:
+            result.update(status="invalid_code", detail=error)
+        elif registration is None:
+            result.update(status="not_registered")
+        else:
+            class_id, competitor_name, registration_status = registration
+            result.update(class_id=class_id, competitor_name=competitor_name)
+            previous = index.checked_in.get(registration_id)
+            if previous is not None:
+                result.update(status="already_checked_in", checked_in_at=previous)
+            elif registration_status not in CONFIRMED_STATUSES:
+                result.update(status="not_confirmed", registration_status=registration_status)
+            else:
+                result.update(status="checked_in")
+        validated = time.perf_counter()
+
+        if result["status"] == "checked_in":
+            record = {
+                "id": new_id("chk"),
+                "event_id": event_id,
+                "registration_id": registration_id,
+                "checked_in_at": datetime.now().isoformat(),
+                "gate": gate
+            }
+            index.checked_in[registration_id] = record["checked_in_at"]
+            self._append(record)
+            if self.fsync:
+                await self._durable()
+            if self.recorded_listener is not None:
+                self.recorded_listener(record)
+            invalidation_bus.publish("check_ins", "created", record)
+            result.update(check_in_id=record["id"], checked_in_at=record["checked_in_at"])
+
+        self.counts[result["status"]] += 1
+        result["accepted"] = result["status"] == "checked_in"
+        result["timing_us"] = {
+            "validate": round((validated - started) * 1e6, 1),
+            "total": round((time.perf_counter() - started) * 1e6, 1)
+        }
+        return result
+
+    def apply_remote(self, action: str, check_in: Optional[Dict[str, Any]]) -> None:
+        """Mark a check-in recorded by another worker"""
+        if action != "created" or not check_in:
+            return
+        index = self.indexes.get(check_in.get("event_id"))
+        if index is not None:
+            index.checked_in.setdefault(check_in.get("registration_id"), check_in.get("checked_in_at"))
+
+    # =====================
+    # Sync
+    # =====================
+
+    def _read_log(self, offset: int) -> Tuple[List[Dict[str, Any]], List[int]]:
+        """Complete log records after offset, with the offset just past each one"""
+        if not self.log_path.exists():
+            return [], []
+        with open(self.log_path, "rb") as log:
+            log.seek(offset)
+            data = log.read()
+        records, ends = [], []
+        position = offset
+        for line in data.split(b"\n")[:-1]:
+            position += len(line) + 1
+            if line.strip():
+                records.append(json.loads(line))
+                ends.append(position)
+        return records, ends
+
+    def _synced_offset(self) -> int:
+        path = self.state_dir / "sync.json"
+        return json.loads(path.read_text())["offset"] if path.exists() else 0
+
+    def _save_synced_offset(self, offset: int) -> None:
+        tmp = self.state_dir / "sync.json.tmp"
+        tmp.write_text(json.dumps({"offset": offset, "synced_at": self.last_synced_at}))
+        os.replace(tmp, self.state_dir / "sync.json")
+
+    def pending(self) -> int:
+        return len(self._read_log(self._synced_offset())[0])
+
+    async def sync(self) -> Dict[str, Any]:
+        """Insert unsynced check-ins in batches; stops at the first failure and resumes from there next time"""
+        if self.batch_writer is None:
+            raise RuntimeError("Gate check-in has no batch writer")
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        with open(self.state_dir / "sync.lock", "w") as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    # Another worker is syncing the same log
+                    return {"synced": 0, "inserted": 0, "pending": None, "busy": True}
+
+            records, ends = self._read_log(self._synced_offset())
+            synced = inserted = 0
+            try:
+                for start in range(0, len(records), self.batch_size):
+                    batch = records[start:start + self.batch_size]
+                    inserted += await self.batch_writer([
+                        {column: record.get(column) for column in SYNCED_COLUMNS} for record in batch
+                    ])
+                    synced += len(batch)
+                    self.last_synced_at = datetime.now().isoformat()
+                    self._save_synced_offset(ends[start + len(batch) - 1])
+                self.last_sync_error = None
+            except Exception as e:
+                self.last_sync_error = str(e)
+                logger.warning(f"Check-in sync stopped with {len(records) - synced} pending: {str(e)}")
+            if synced:
+                logger.info(f"Synced {synced} check-ins ({inserted} new)")
+            return {"synced": synced, "inserted": inserted, "pending": len(records) - synced, "busy": False}
+
+    async def run(self) -> None:
+        """Sync in the background, backing off while the database is unreachable"""
+        delay = self.sync_interval
+        while True:
+            await asyncio.sleep(delay)
+            if self.batch_writer is None or not self.log_path.exists():
+                continue
+            if self.log_path.stat().st_size <= self._synced_offset():
+                delay = self.sync_interval
+                continue
+            result = await self.sync()
+            delay = self.sync_interval if not result["pending"] else min(delay * 2, self.max_sync_interval)
+
+    def close(self) -> None:
+        if self._fsync_task is not None and not self._fsync_task.done():
+            # Shutdown: the remaining records were written, only not yet synced
+            self._fsync_task.cancel()
+        if self._log_fd is not None:
+            os.close(self._log_fd)
+            self._log_fd = None
+
+    async def scanner_filter(self, event_id: str) -> Dict[str, Any]:
+        """The event's Bloom filter of confirmed registrations, for scanners working offline"""
+        index = await self._index(event_id)
+        return {"event_id": event_id, "loaded_at": index.loaded_at, "registrations": index.confirmed, **index.bloom.to_dict()}
+
+    def status(self, event_id: str) -> Dict[str, Any]:
+        index = self.indexes.get(event_id)
+        return {
+            "event_id": event_id,
+            "preloaded": index is not None,
+            "loaded_at": index.loaded_at if index else None,
+            "registrations": len(index.registrations) if index else 0,
+            "confirmed": index.confirmed if index else 0,
+            "checked_in": len(index.checked_in) if index else 0,
+            "sync": {
+                "pending": self.pending(),
+                "last_synced_at": self.last_synced_at,
+                "last_error": self.last_sync_error
+            },
+            "counts": self.counts
+        }
+
+# Create a singleton instance
+gate_check_in = GateCheckIn(
+    secret=os.getenv("CHECK_IN_SECRET", ""),
+    sync_interval=float(os.getenv("CHECK_IN_SYNC_SECONDS", "5")),
+    batch_size=int(os.getenv("CHECK_IN_SYNC_BATCH_SIZE", "200")),
+    fsync=os.getenv("CHECK_IN_FSYNC", "true").lower() == "true"
+)
@@ -0,0 +1,269 @@
+"""
+Event Geo Service for MCP Server
+Offline geocoding of event locations and a grid-bucketed spatial index for proximity queries
+"""
+
+import os
+import csv
+import math
+import logging
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple
+
+from services.event_search import tokenize
+
+logger = logging.getLogger(__name__)
+
+GEOCODE_TABLE = os.getenv(
+    "GEOCODE_TABLE",
+    str(Path(__file__).resolve().parent.parent / "data" / "geocode_places.csv")
+)
+
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LAT = 69.0
+
+COUNTRY_ALIASES: Dict[str, str] = {
+    "us": "usa",
+    "united states": "usa",
+    "united states of america": "usa",
+}
+
+Coordinates = Tuple[float, float]
+
+def haversine_miles(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in miles"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_MILES * math.asin(min(1.0, math.sqrt(a)))
+
+def _key(value: Any) -> str:
+    return " ".join(tokenize(value))
+
+def _country_key(value: Any) -> str:
+    key = _key(value)
+    return COUNTRY_ALIASES.get(key, key)
+
+class Geocoder:
+    """
+    Offline geocoder backed by a CSV lookup table of
+    city, state, postal_code, country, latitude, longitude.
+    Lookups go from most to least specific key.
+    """
+
+    def __init__(self, table_path: str = GEOCODE_TABLE):
+        self._by_postal: Dict[Tuple[str, str], Coordinates] = {}
+        self._by_city_state_country: Dict[Tuple[str, str, str], Coordinates] = {}
+        self._by_city_state: Dict[Tuple[str, str], Coordinates] = {}
+        self._by_city_country: Dict[Tuple[str, str], Coordinates] = {}
+        self._by_city: Dict[str, Optional[Coordinates]] = {}
+        self._load(table_path)
+
+    def _load(self, table_path: str) -> None:
+        try:
+            with open(table_path, newline="", encoding="utf-8") as f:
+                rows = list(csv.DictReader(f))
+        except OSError as e:
+            logger.warning(f"Geocode table {table_path} not available: {str(e)}")
+            return
+
+        for row in rows:
+            coords = (float(row["latitude"]), float(row["longitude"]))
+            city, state = _key(row.get("city")), _key(row.get("state"))
+            country, postal = _country_key(row.get("country")), _key(row.get("postal_code"))
+            if postal:
+                self._by_postal.setdefault((postal, country), coords)
+            if city:
+                self._by_city_state_country.setdefault((city, state, country), coords)
+                self._by_city_state.setdefault((city, state), coords)
+                self._by_city_country.setdefault((city, country), coords)
+                existing = self._by_city.get(city, coords)
+                # A bare city name is only usable if it is unambiguous
+                if existing is None or haversine_miles(*existing, *coords) > 50:
+                    self._by_city[city] = None
+                else:
+                    self._by_city.setdefault(city, coords)
+        logger.info(f"Loaded {len(rows)} places from geocode table")
+
+    def lookup(
+        self,
+        city: Optional[str] = None,
+        state: Optional[str] = None,
+        postal_code: Optional[str] = None,
+        country: Optional[str] = None
+    ) -> Optional[Coordinates]:
+        """Geocode structured address parts"""
+        city, state = _key(city), _key(state)
+        postal, country = _key(postal_code), _country_key(country)
+
+        if postal and (postal, country) in self._by_postal:
+            return self._by_postal[(postal, country)]
+        if not city:
+            return None
+        for found in (
+            self._by_city_state_country.get((city, state, country)) if state and country else None,
+            self._by_city_state.get((city, state)) if state else None,
+            self._by_city_country.get((city, country)) if country else None,
+            self._by_city.get(city),
+        ):
+            if found:
+                return found
+        return None
+
+    def geocode_text(self, text: Optional[str]) -> Optional[Coordinates]:
+        """Geocode free text such as "Miami, FL", "Espoo, Uusimaa, Finland" or a postal code"""
+        if not text:
+            return None
+        parts = [part.strip() for part in str(text).split(",") if part.strip()]
+        if not parts:
+            return None
+        if len(parts) == 1:
+            return self.lookup(city=parts[0], postal_code=parts[0])
+        if len(parts) == 2:
+            return self.lookup(city=parts[0], state=parts[1]) or self.lookup(city=parts[0], country=parts[1])
+        return self.lookup(city=parts[0], state=parts[1], country=parts[-1])
+
+    def geocode_event(self, event: Dict[str, Any]) -> Optional[Coordinates]:
+        """Geocode an event from its structured address fields or its location text"""
+        coords = self.lookup(
+            city=event.get("city"),
+            state=event.get("state") or event.get("state_province"),
+            postal_code=event.get("zip_code") or event.get("postal_code"),
+            country=event.get("country")
+        )
+        return coords or self.geocode_text(event.get("location"))
+
+    def with_coordinates(self, event: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the event with latitude/longitude filled in when they can be geocoded"""
+        if event.get("latitude") is not None and event.get("longitude") is not None:
+            return event
+        coords = self.geocode_event(event)
+        if coords is None:
+            return event
+        return {**event, "latitude": coords[0], "longitude": coords[1]}
+
+class EventGeoIndex:
+    """
+    Spatial index of events bucketed into a grid of cell_degrees cells.
+    Radius queries only scan the cells overlapping the query's bounding box.
+    """
+
+    def __init__(self, geocoder: Geocoder, cell_degrees: float = 1.0):
+        self.geocoder = geocoder
+        self.cell_degrees = cell_degrees
+        self._lon_cells = int(round(360 / cell_degrees))
+        self._cells: Dict[Tuple[int, int], Dict[str, Tuple[float, float, Dict[str, Any]]]] = {}
+        self._event_cells: Dict[str, Tuple[int, int]] = {}
+        self.ready = False
+
+    def __len__(self) -> int:
+        return len(self._event_cells)
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (
+            int(math.floor(lat / self.cell_degrees)),
+            int(math.floor(lon / self.cell_degrees)) % self._lon_cells
+        )
+
+    def upsert(self, event: Dict[str, Any]) -> bool:
+        """Index an event, geocoding it if it has no coordinates. Returns False if it can't be placed."""
+        event_id = event.get("id")
+        if event_id is None:
+            return False
+        event_id = str(event_id)
+        self.remove(event_id)
+
+        if event.get("latitude") is not None and event.get("longitude") is not None:
+            coords = (float(event["latitude"]), float(event["longitude"]))
+        else:
+            coords = self.geocoder.geocode_event(event)
+        if coords is None:
+            return False
+
+        cell = self._cell(*coords)
+        self._cells.setdefault(cell, {})[event_id] = (coords[0], coords[1], dict(event))
+        self._event_cells[event_id] = cell
+        return True
+
+    def remove(self, event_id: str) -> None:
+        cell = self._event_cells.pop(str(event_id), None)
+        if cell is not None:
+            bucket = self._cells[cell]
+            bucket.pop(str(event_id), None)
+            if not bucket:
+                del self._cells[cell]
+
+    async def build(self, service, page_size: int = 1000) -> int:
+        """Index every event from the service, one page at a time"""
+        offset = 0
+        while True:
+            page = await service.get_events(limit=page_size, offset=offset)
+            for event in page:
+                self.upsert(event)
+            if len(page) < page_size:
+                break
+            offset += page_size
+        self.ready = True
+        logger.info(f"Event geo index built with {len(self)} located events")
+        return len(self)
+
+    def within(
+        self,
+        lat: float,
+        lon: float,
+        radius_miles: float,
+        limit: int = 10,
+        status: Optional[str] = None,
+        event_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Events within radius_miles of a point, nearest first"""
+        lat_span = radius_miles / MILES_PER_DEGREE_LAT
+        cos_lat = max(math.cos(math.radians(min(abs(lat) + lat_span, 90.0))), 1e-6)
+        lon_span = lat_span / cos_lat
+
+        min_row, max_row = self._cell(max(lat - lat_span, -90.0), lon)[0], self._cell(min(lat + lat_span, 90.0), lon)[0]
+        if lon_span >= 180:
+            columns = range(self._lon_cells)
+        else:
+            first = int(math.floor((lon - lon_span) / self.cell_degrees))
+            last = int(math.floor((lon + lon_span) / self.cell_degrees))
+            columns = {column % self._lon_cells for column in range(first, last + 1)}
+
+        matches = []
+        for row in range(min_row, max_row + 1):
+            for column in columns:
+                for event_lat, event_lon, event in self._cells.get((row, column), {}).values():
+                    if status and event.get("status") != status:
+                        continue
+                    if event_type and event.get("event_type") != event_type:
+                        continue
+                    distance = haversine_miles(lat, lon, event_lat, event_lon)
+                    if distance <= radius_miles:
+                        matches.append((distance, event))
+
+        matches.sort(key=lambda match: match[0])
+        return [
+            {**event, "distance_miles": round(distance, 1)}
+            for distance, event in matches[:limit]
+        ]
+
+    def nearest(
+        self,
+        lat: float,
+        lon: float,
+        k: int = 10,
+        status: Optional[str] = None,
+        event_type: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """The k events nearest to a point, found by widening the search radius"""
+        radius = 50.0
+        while True:
+            results = self.within(lat, lon, radius, limit=k, status=status, event_type=event_type)
+            if len(results) >= k or radius >= math.pi * EARTH_RADIUS_MILES:
+                return results
+            radius *= 2
+
+# Create singleton instances
+geocoder = Geocoder()
+event_geo_index = EventGeoIndex(geocoder)
@@ -0,0 +1,357 @@
+"""
+Event Search Service for MCP Server
+In-process inverted index over events with BM25 ranking, prefix and typo-tolerant matching
+"""
+
+import re
+import math
+import bisect
+import heapq
+import logging
+import unicodedata
+from collections import defaultdict
+from typing import Optional, List, Dict, Any, Set, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Field weights for BM25F-style scoring
+FIELD_WEIGHTS: Dict[str, float] = {
+    "name": 3.0,
+    "formats": 2.0,
+    "event_type": 2.0,
+    "location": 2.0,
+    "city": 2.0,
+    "state": 2.0,
+    "state_province": 2.0,
+    "country": 2.0,
+    "venue_name": 1.5,
+    "venue": 1.5,
+    "description": 1.0,
+}
+
+# Location fields get US state abbreviations expanded, so "florida" finds "Miami, FL"
+LOCATION_FIELDS = {"location", "city", "state", "state_province"}
+
+US_STATES: Dict[str, str] = {
+    "al": "alabama", "ak": "alaska", "az": "arizona", "ar": "arkansas", "ca": "california",
+    "co": "colorado", "ct": "connecticut", "de": "delaware", "fl": "florida", "ga": "georgia",
+    "hi": "hawaii", "id": "idaho", "il": "illinois", "in": "indiana", "ia": "iowa",
+    "ks": "kansas", "ky": "kentucky", "la": "louisiana", "me": "maine", "md": "maryland",
+    "ma": "massachusetts", "mi": "michigan", "mn": "minnesota", "ms": "mississippi", "mo": "missouri",
+    "mt": "montana", "ne": "nebraska", "nv": "nevada", "nh": "new hampshire", "nj": "new jersey",
+    "nm": "new mexico", "ny": "new york", "nc": "north carolina", "nd": "north dakota", "oh": "ohio",
+    "ok": "oklahoma", "or": "oregon", "pa": "pennsylvania", "ri": "rhode island", "sc": "south carolina",
+    "sd": "south dakota", "tn": "tennessee", "tx": "texas", "ut": "utah", "vt": "vermont",
+    "va": "virginia", "wa": "washington", "wv": "west virginia", "wi": "wisconsin", "wy": "wyoming",
+}
+
+def state_term(name: str) -> str:
+    """
+    The index term for a state name. Multi-word names become one term, so
+    "mexico" does not match New Mexico and "north carolina" does not match
+    South Carolina. The "~" keeps the term out of prefix matches of typed words.
+    """
+    return name if " " not in name else "~" + name.replace(" ", "")
+
+# Multi-word state names as token sequences, matched as phrases in queries and location fields
+STATE_PHRASES: Dict[Tuple[str, ...], str] = {
+    tuple(name.split()): state_term(name) for name in US_STATES.values() if " " in name
+}
+MAX_STATE_WORDS = max(len(words) for words in STATE_PHRASES)
+
+# Weight of a query term matched by prefix or with one typo, relative to an exact match
+PREFIX_WEIGHT = 0.7
+TYPO_WEIGHT = 0.5
+MAX_EXPANSIONS = 50
+
+# Documents seeded per query token, and the candidate count after which
+# more common tokens only rescore existing candidates
+CANDIDATE_POOL = 1000
+MIN_CANDIDATES = 200
+TOKEN_CACHE_SIZE = 1024
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+def tokenize(text: Any) -> List[str]:
+    """Lowercase, strip accents and split into alphanumeric tokens"""
+    if text is None:
+        return []
+    if isinstance(text, (list, tuple)):
+        text = " ".join(str(t) for t in text)
+    normalized = unicodedata.normalize("NFKD", str(text).lower())
+    ascii_text = normalized.encode("ascii", "ignore").decode("ascii")
+    return _TOKEN_RE.findall(ascii_text)
+
+def merge_state_names(tokens: List[str]) -> List[str]:
+    """Replace each multi-word state name in a token list with its single term"""
+    merged, position = [], 0
+    while position < len(tokens):
+        for length in range(MAX_STATE_WORDS, 1, -1):
+            term = STATE_PHRASES.get(tuple(tokens[position:position + length]))
+            if term is not None:
+                merged.append(term)
+                position += length
+                break
+        else:
+            merged.append(tokens[position])
+            position += 1
+    return merged
+
+def _deletes(term: str) -> Set[str]:
+    """All strings one deletion away from term"""
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+def _within_one_edit(a: str, b: str) -> bool:
+    """True if a and b differ by at most one insertion, deletion, substitution or transposition"""
+    if a == b:
+        return True
+    la, lb = len(a), len(b)
+    if abs(la - lb) > 1:
+        return False
+    if la == lb:
+        diffs = [i for i in range(la) if a[i] != b[i]]
+        if len(diffs) == 1:
+            return True
+        return len(diffs) == 2 and diffs[1] == diffs[0] + 1 and a[diffs[0]] == b[diffs[1]] and a[diffs[1]] == b[diffs[0]]
+    if la > lb:
+        a, b = b, a
+    return any(b[:i] + b[i + 1:] == a for i in range(len(b)))
+
+class EventSearchIndex:
+    """
+    Inverted index over event name, venue, location, formats and description.
+    Documents are added or replaced one at a time, so the index can be filled
+    from paged reads and kept current from create_event.
+    """
+
+    def __init__(self):
+        self._doc_ids: Dict[str, int] = {}
+        self._docs: List[Optional[Dict[str, Any]]] = []
+        self._doc_lengths: List[float] = []
+        self._doc_terms: List[Dict[str, float]] = []
+        self._postings: Dict[str, Dict[int, float]] = defaultdict(dict)
+        self._vocabulary: List[str] = []
+        self._deletes: Dict[str, Set[str]] = defaultdict(set)
+        self._total_length = 0.0
+        self._live_docs = 0
+        self._token_cache: Dict[str, Tuple[Dict[int, float], List[Tuple[float, int]]]] = {}
+        self.ready = False
+
+    def __len__(self) -> int:
+        return self._live_docs
+
+    # =====================
+    # Indexing
+    # =====================
+
+    def _add_term(self, term: str) -> None:
+        index = bisect.bisect_left(self._vocabulary, term)
+        if index == len(self._vocabulary) or self._vocabulary[index] != term:
+            self._vocabulary.insert(index, term)
+            for variant in _deletes(term):
+                self._deletes[variant].add(term)
+
+    def _document_terms(self, event: Dict[str, Any]) -> Dict[str, float]:
+        terms: Dict[str, float] = defaultdict(float)
+        for field, weight in FIELD_WEIGHTS.items():
+            tokens = tokenize(event.get(field))
+            if field in LOCATION_FIELDS:
+                tokens = merge_state_names(tokens)
+            for token in tokens:
+                terms[token] += weight
+                if field in LOCATION_FIELDS and token in US_STATES:
+                    terms[state_term(US_STATES[token])] += weight
+        return terms
+
+    def upsert(self, event: Dict[str, Any]) -> None:
+        """Add an event, replacing any previous version with the same ID"""
+        event_id = event.get("id")
+        if event_id is None:
+            return
+        event_id = str(event_id)
+        if event_id in self._doc_ids:
+            self.remove(event_id)
+
+        self._token_cache.clear()
+        terms = self._document_terms(event)
+        doc = len(self._docs)
+        self._doc_ids[event_id] = doc
+        self._docs.append(dict(event))
+        self._doc_terms.append(terms)
+        length = sum(terms.values())
+        self._doc_lengths.append(length)
+        self._total_length += length
+        self._live_docs += 1
+
+        for term, weighted_tf in terms.items():
+            if term not in self._postings:
+                self._add_term(term)
+            self._postings[term][doc] = weighted_tf
+
+    def remove(self, event_id: str) -> None:
+        """Remove an event from the index"""
+        doc = self._doc_ids.pop(str(event_id), None)
+        if doc is None:
+            return
+        self._token_cache.clear()
+        for term in self._doc_terms[doc]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc, None)
+        self._total_length -= self._doc_lengths[doc]
+        self._docs[doc] = None
+        self._doc_terms[doc] = {}
+        self._live_docs -= 1
+
+    async def build(self, service, page_size: int = 1000) -> int:
+        """Index every event from the service, one page at a time"""
+        offset = 0
+        while True:
+            page = await service.get_events(limit=page_size, offset=offset)
+            for event in page:
+                self.upsert(event)
+            if len(page) < page_size:
+                break
+            offset += page_size
+        self.ready = True
+        logger.info(f"Event search index built with {len(self)} events")
+        return len(self)
+
+    # =====================
+    # Querying
+    # =====================
+
+    def _expand(self, token: str) -> List[Tuple[str, float]]:
+        """Index terms matching a query token, with their match weight"""
+        expansions: Dict[str, float] = {}
+        if self._postings.get(token):
+            expansions[token] = 1.0
+
+        if len(token) >= 2:
+            start = bisect.bisect_left(self._vocabulary, token)
+            for term in self._vocabulary[start:start + MAX_EXPANSIONS]:
+                if not term.startswith(token):
+                    break
+                if term != token and self._postings.get(term):
+                    expansions.setdefault(term, PREFIX_WEIGHT)
+
+        if len(token) >= 4 and token not in expansions:
+            candidates = set(self._deletes.get(token, ()))
+            for variant in _deletes(token):
+                if variant in self._postings:
+                    candidates.add(variant)
+                candidates |= self._deletes.get(variant, set())
+            for term in candidates:
+                if term not in expansions and self._postings.get(term) and _within_one_edit(token, term):
+                    expansions[term] = TYPO_WEIGHT
+
+        return list(expansions.items())
+
+    def _matches_filters(self, event: Dict[str, Any], filters: Dict[str, Any]) -> bool:
+        if filters.get("status") and event.get("status") != filters["status"]:
+            return False
+        if filters.get("event_type") and event.get("event_type") != filters["event_type"]:
+            return False
+        start_date = str(event.get("start_date") or "")
+        if filters.get("start_after") and start_date < filters["start_after"]:
+            return False
+        if filters.get("start_before") and start_date > filters["start_before"]:
+            return False
+        return True
+
+    def _token_scores(self, token: str) -> Tuple[Dict[int, float], List[Tuple[float, int]]]:
+        """
+        BM25 contribution of a query token per document, best over its expansions,
+        plus the same scores sorted by impact. Cached until the index changes.
+        """
+        cached = self._token_cache.get(token)
+        if cached is not None:
+            return cached
+
+        avg_length = self._total_length / self._live_docs
+        best: Dict[int, float] = {}
+        for term, match_weight in self._expand(token):
+            postings = self._postings[term]
+            idf = math.log(1 + (self._live_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc, tf in postings.items():
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._doc_lengths[doc] / avg_length)
+                score = match_weight * idf * tf * (BM25_K1 + 1) / (tf + norm)
+                if score > best.get(doc, 0.0):
+                    best[doc] = score
+
+        impacts = sorted(((score, doc) for doc, score in best.items()), reverse=True)
+        if len(self._token_cache) >= TOKEN_CACHE_SIZE:
+            self._token_cache.pop(next(iter(self._token_cache)))
+        self._token_cache[token] = (best, impacts)
+        return best, impacts
+
+    def search(
+        self,
+        query: str,
+        limit: int = 10,
+        status: Optional[str] = None,
+        event_type: Optional[str] = None,
+        start_after: Optional[str] = None,
+        start_before: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Rank events for a free-text query. Events matching more query terms
+        rank first, then by BM25 score.
+
+        Query tokens are evaluated rarest first. Candidates are seeded from the
+        highest-impact documents of each token until there are enough of them;
+        more common tokens then only add to the scores of existing candidates.
+        """
+        filters = {
+            "status": status,
+            "event_type": event_type,
+            "start_after": start_after,
+            "start_before": start_before
+        }
+        has_filters = any(filters.values())
+        tokens = list(dict.fromkeys(merge_state_names(tokenize(query))))
+        if not tokens or not self._live_docs:
+            return []
+
+        scores: Dict[int, float] = {}
+        matched: Dict[int, int] = {}
+        per_token = sorted((self._token_scores(token) for token in tokens), key=lambda t: len(t[0]))
+
+        for token_scores, impacts in per_token:
+            if len(scores) >= max(limit, MIN_CANDIDATES):
+                for doc in scores:
+                    score = token_scores.get(doc)
+                    if score:
+                        scores[doc] += score
+                        matched[doc] += 1
+                continue
+
+            seeded = 0
+            for score, doc in impacts:
+                if doc in scores:
+                    scores[doc] += score
+                    matched[doc] += 1
+                    continue
+                if seeded >= CANDIDATE_POOL:
+                    continue
+                if has_filters and not self._matches_filters(self._docs[doc], filters):
+                    continue
+                scores[doc] = score
+                matched[doc] = 1
+                seeded += 1
+
+        ranked = heapq.nlargest(limit, scores, key=lambda doc: (matched[doc], scores[doc]))
+        return [
+            {
+                **self._docs[doc],
+                "score": round(scores[doc], 4),
+                "matched_terms": matched[doc]
+            }
+            for doc in ranked
+        ]
+
+# Create a singleton instance
+event_search_index = EventSearchIndex()
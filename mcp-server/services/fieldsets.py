@@ -0,0 +1,56 @@
+"""
+Sparse Fieldsets for MCP Server
+Per-resource field allowlists for the fields= parameter on read endpoints and MCP tools
+"""
+
+from typing import Optional, Tuple, Dict, Any, List
+
+EVENT_FIELDS = (
+    "id", "name", "event_type", "status", "start_date", "end_date",
+    "location", "venue_name", "city", "state", "latitude", "longitude",
+    "max_competitors", "early_bird_price", "regular_price", "description", "created_at",
+)
+
+# Fields each resource may be trimmed to; the first one identifies the row and is always returned
+FIELDSETS: Dict[str, Tuple[str, ...]] = {
+    "events": EVENT_FIELDS,
+    "event_search": EVENT_FIELDS + ("score", "matched_terms"),
+    "events_nearby": EVENT_FIELDS + ("distance_miles",),
+    "standings": (
+        "competitor_id", "rank", "competitor_name", "score", "tie_breaker",
+        "unit", "attempts", "season_points",
+    ),
+    "season_standings": ("competitor_id", "rank", "competitor_name", "points"),
+}
+
+def parse_fields(resource: str, fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+    """
+    Parse a comma-separated fields= value into an ordered, de-duplicated tuple
+    that starts with the resource's key. Returns None (every field) when no
+    fields are requested; raises ValueError naming any field not allowed.
+    """
+    if fields is None or not fields.strip():
+        return None
+    allowed = FIELDSETS[resource]
+    requested = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in requested if name not in allowed]
+    if unknown:
+        raise ValueError(
+            f"Unknown field(s) for {resource}: {', '.join(unknown)}. Allowed: {', '.join(allowed)}"
+        )
+    return tuple(dict.fromkeys([allowed[0], *requested]))
+
+def select_clause(fields: Optional[Tuple[str, ...]]) -> str:
+    """The PostgREST select() projection for parsed fields"""
+    return ",".join(fields) if fields else "*"
+
+def project(record: Optional[Dict[str, Any]], fields: Optional[Tuple[str, ...]]) -> Optional[Dict[str, Any]]:
+    """Trim a record that was built in memory to the requested fields"""
+    if record is None or fields is None:
+        return record
+    return {name: record[name] for name in fields if name in record}
+
+def project_all(records: List[Dict[str, Any]], fields: Optional[Tuple[str, ...]]) -> List[Dict[str, Any]]:
+    if fields is None:
+        return records
+    return [project(record, fields) for record in records]
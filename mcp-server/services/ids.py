@@ -0,0 +1,124 @@
+"""
+ID Generation for MCP Server
+Prefixed, time-sortable ULID identifiers for every entity the server creates
+"""
+
+import os
+import time
+import threading
+from datetime import datetime, timezone
+from typing import Optional, List, Tuple
+
+# Crockford base32: no I, L, O or U, so IDs are unambiguous when read aloud or retyped
+ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+DECODE = {character: value for value, character in enumerate(ALPHABET)}
+
+TIME_BITS = 48
+RANDOM_BITS = 80
+ULID_LENGTH = 26
+
+# Prefixes by entity, so an ID says what it refers to
+PREFIXES = {
+    "events": "evt",
+    "registrations": "reg",
+    "payments": "pay",
+    "event_check_ins": "chk",
+    "competition_results": "res",
+    "support_tickets": "tkt",
+}
+
+# Every 10-bit value as two base32 characters, so encoding takes 13 lookups instead of 26
+PAIRS = [ALPHABET[value >> 5] + ALPHABET[value & 31] for value in range(1024)]
+TIME_SHIFTS = tuple(range(RANDOM_BITS + 40, RANDOM_BITS - 1, -10))
+RANDOM_SHIFTS = tuple(range(RANDOM_BITS - 10, -1, -10))
+
+def _pairs(value: int, shifts: Tuple[int, ...]) -> str:
+    return "".join([PAIRS[(value >> shift) & 1023] for shift in shifts])
+
+def encode(value: int) -> str:
+    """Encode a 128-bit integer as 26 base32 characters; the order of strings matches the order of integers"""
+    return _pairs(value, TIME_SHIFTS) + _pairs(value, RANDOM_SHIFTS)
+
+class IdGenerator:
+    """
+    ULIDs: 48 bits of milliseconds since the epoch followed by 80 random bits.
+
+    Within one millisecond the random part is incremented instead of redrawn,
+    so IDs from one process are strictly increasing and sort in creation
+    order. Processes need no coordination: each starts every millisecond
+    from its own 80-bit random draw, so two workers colliding is as likely
+    as guessing an 80-bit number. If the random part would overflow, the
+    generator borrows the next millisecond.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._last_random = 0
+        self._time_text = ""
+
+    def _next_millisecond(self, now_ms: int) -> None:
+        self._last_ms = now_ms
+        # Drop the top bit so a millisecond has 2^79 increments of headroom
+        self._last_random = int.from_bytes(os.urandom(10), "big") >> 1
+        self._time_text = _pairs(now_ms << RANDOM_BITS, TIME_SHIFTS)
+
+    def _reserve(self, count: int) -> Tuple[int, int, str]:
+        """Reserve count consecutive values; returns the millisecond, first random part and encoded time"""
+        with self._lock:
+            now_ms = time.time_ns() // 1_000_000
+            if now_ms > self._last_ms:
+                self._next_millisecond(now_ms)
+            else:
+                # Same millisecond, or the clock stepped back: stay monotonic
+                self._last_random += 1
+                if (self._last_random + count - 1) >> RANDOM_BITS:
+                    self._next_millisecond(self._last_ms + 1)
+            first = self._last_random
+            self._last_random += count - 1
+            return self._last_ms, first, self._time_text
+
+    def new_int(self) -> int:
+        milliseconds, random_part, _ = self._reserve(1)
+        return (milliseconds << RANDOM_BITS) | random_part
+
+    def new(self, prefix: Optional[str] = None) -> str:
+        """A new ULID, as "<prefix>_<ulid>" when a prefix is given"""
+        _, random_part, time_text = self._reserve(1)
+        ulid = time_text + _pairs(random_part, RANDOM_SHIFTS)
+        return f"{prefix}_{ulid}" if prefix else ulid
+
+    def batch(self, count: int, prefix: Optional[str] = None) -> List[str]:
+        """count increasing IDs under one lock acquisition, for bulk inserts"""
+        _, first, time_text = self._reserve(count)
+        head = f"{prefix}_{time_text}" if prefix else time_text
+        return [head + _pairs(random_part, RANDOM_SHIFTS) for random_part in range(first, first + count)]
+
+def split(entity_id: str) -> Tuple[Optional[str], str]:
+    """Split "<prefix>_<ulid>" into its prefix (None if absent) and ULID"""
+    prefix, _, ulid = entity_id.rpartition("_")
+    return (prefix or None), ulid
+
+def is_ulid(value: str) -> bool:
+    return len(value) == ULID_LENGTH and all(character in DECODE for character in value.upper())
+
+def created_at(entity_id: str) -> Optional[datetime]:
+    """When an ID was generated, or None if it is not a ULID"""
+    _, ulid = split(entity_id)
+    if not is_ulid(ulid):
+        return None
+    milliseconds = 0
+    for character in ulid[:10].upper():
+        milliseconds = milliseconds * 32 + DECODE[character]
+    return datetime.fromtimestamp(milliseconds / 1000, tz=timezone.utc)
+
+def min_id_at(moment: datetime, prefix: Optional[str] = None) -> str:
+    """The smallest ID that can be generated at moment, for keyset range filters on id alone"""
+    ulid = encode(int(moment.timestamp() * 1000) << RANDOM_BITS)
+    return f"{prefix}_{ulid}" if prefix else ulid
+
+# Create a singleton instance
+id_generator = IdGenerator()
+
+def new_id(prefix: Optional[str] = None) -> str:
+    return id_generator.new(prefix)
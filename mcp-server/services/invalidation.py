@@ -0,0 +1,248 @@
+"""
+Invalidation Bus for MCP Server
+Broadcasts writes to every worker on the host over Unix datagram sockets, with shared-memory generation counters
+"""
+
+import os
+import json
+import mmap
+import time
+import socket
+import struct
+import asyncio
+import logging
+import tempfile
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Callable, Hashable, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows: no shared counters or bus, every cache stays worker-local
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+TOPICS = ("events", "registrations", "payments", "check_ins", "results", "tickets")
+TOPIC_SLOTS = {topic: slot for slot, topic in enumerate(TOPICS)}
+
+# Larger messages are sent without their record; receivers still see the generation bump
+MAX_MESSAGE_BYTES = 60 * 1024
+
+INVALIDATION_DIR = os.getenv(
+    "INVALIDATION_BUS_DIR",
+    os.path.join(tempfile.gettempdir(), "car-audio-events-bus")
+)
+
+class GenerationCounters:
+    """
+    One 64-bit counter per topic in a memory-mapped file shared by every
+    worker on the host. Each write bumps its topic; a cache remembers the
+    generation it was filled at and is fresh while that is still current.
+    Checking costs one 8-byte read, with no syscall.
+    """
+
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._local = [0] * len(TOPICS)
+
+    def _open(self) -> Optional[mmap.mmap]:
+        if self._map is None and self.path and fcntl is not None:
+            try:
+                Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+                self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+                size = 8 * len(TOPICS)
+                if os.fstat(self._fd).st_size < size:
+                    # Growing with zeros is idempotent, so racing workers agree
+                    os.ftruncate(self._fd, size)
+                self._map = mmap.mmap(self._fd, size)
+            except OSError as e:
+                logger.warning(f"Shared generation counters unavailable, using worker-local ones: {str(e)}")
+                self.path = None
+        return self._map
+
+    def current(self, topic: str) -> int:
+        shared = self._open()
+        slot = TOPIC_SLOTS[topic]
+        if shared is None:
+            return self._local[slot]
+        return struct.unpack_from("<Q", shared, slot * 8)[0]
+
+    def bump(self, topic: str) -> int:
+        """Advance a topic's generation; returns the new value"""
+        shared = self._open()
+        slot = TOPIC_SLOTS[topic]
+        if shared is None:
+            self._local[slot] += 1
+            return self._local[slot]
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        try:
+            generation = struct.unpack_from("<Q", shared, slot * 8)[0] + 1
+            struct.pack_into("<Q", shared, slot * 8, generation)
+        finally:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return generation
+
+    def snapshot(self) -> Dict[str, int]:
+        return {topic: self.current(topic) for topic in TOPICS}
+
+class GenerationCache:
+    """
+    A small read-through cache whose entries are valid while their topic's
+    generation is unchanged. ttl bounds staleness for writes that bypass
+    this server (e.g. made directly in Supabase).
+    """
+
+    def __init__(self, counters: GenerationCounters, topic: str, ttl: float = 30.0, max_entries: int = 256):
+        self.counters = counters
+        self.topic = topic
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries: Dict[Hashable, Tuple[int, float, Any]] = {}
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == self.counters.current(self.topic) and time.monotonic() < entry[1]:
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, value: Any, generation: int) -> None:
+        """Store a value read at generation (read the generation before querying)"""
+        if len(self._entries) >= self.max_entries:
+            self._entries.pop(next(iter(self._entries)))
+        self._entries[key] = (generation, time.monotonic() + self.ttl, value)
+
+class InvalidationBus:
+    """
+    Every worker binds a Unix datagram socket in a shared directory.
+    publish() bumps the topic's generation and sends the written record to
+    each other worker's socket; receivers run the handlers subscribed to the
+    topic so their in-process caches apply the same change. Delivery is
+    best-effort: a worker that misses a message (full socket buffer, just
+    started) still sees the generation change.
+    """
+
+    def __init__(self, directory: Optional[str] = INVALIDATION_DIR):
+        self.directory = Path(directory) if directory else None
+        self.generations = GenerationCounters(str(self.directory / "generations") if self.directory else None)
+        self.enabled = self.directory is not None and fcntl is not None and hasattr(socket, "AF_UNIX")
+        self.sent = 0
+        self.received = 0
+        self.dropped = 0
+        self._handlers: Dict[str, List[Callable[[str, Optional[Dict[str, Any]]], Any]]] = {}
+        self._sock: Optional[socket.socket] = None
+        self._path: Optional[str] = None
+        self._peers: List[str] = []
+        self._peers_listed_at = 0.0
+
+    def subscribe(self, topic: str, handler: Callable[[str, Optional[Dict[str, Any]]], Any]) -> None:
+        """Run handler(action, record) for writes to topic made by other workers"""
+        self._handlers.setdefault(topic, []).append(handler)
+
+    def start(self) -> None:
+        """Bind this worker's socket and start receiving; call from the event loop"""
+        if not self.enabled or self._sock is not None:
+            return
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._path = str(self.directory / f"worker-{os.getpid()}.sock")
+            if os.path.exists(self._path):
+                os.unlink(self._path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(self._path)
+            sock.setblocking(False)
+        except OSError as e:
+            logger.warning(f"Invalidation bus disabled: {str(e)}")
+            self.enabled = False
+            return
+        self._sock = sock
+        asyncio.get_running_loop().add_reader(sock.fileno(), self._receive)
+        logger.info(f"Invalidation bus listening at {self._path}")
+
+    def close(self) -> None:
+        if self._sock is None:
+            return
+        try:
+            asyncio.get_running_loop().remove_reader(self._sock.fileno())
+        except RuntimeError:
+            pass
+        self._sock.close()
+        self._sock = None
+        if self._path and os.path.exists(self._path):
+            os.unlink(self._path)
+
+    def _peer_paths(self) -> List[str]:
+        # Listing the directory at most once a second keeps publish cheap
+        now = time.monotonic()
+        if now - self._peers_listed_at > 1.0:
+            self._peers = [
+                str(path) for path in self.directory.glob("worker-*.sock") if str(path) != self._path
+            ]
+            self._peers_listed_at = now
+        return self._peers
+
+    def publish(self, topic: str, action: str, record: Optional[Dict[str, Any]] = None) -> int:
+        """Announce a write to every other worker; returns the topic's new generation"""
+        generation = self.generations.bump(topic)
+        if self._sock is None:
+            return generation
+
+        message = {"topic": topic, "action": action, "generation": generation, "record": record}
+        payload = json.dumps(message, default=str).encode()
+        if len(payload) > MAX_MESSAGE_BYTES:
+            payload = json.dumps({**message, "record": None}).encode()
+
+        for peer in list(self._peer_paths()):
+            try:
+                self._sock.sendto(payload, peer)
+                self.sent += 1
+            except (FileNotFoundError, ConnectionRefusedError):
+                # The worker behind this socket is gone
+                self._peers.remove(peer)
+                try:
+                    os.unlink(peer)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                self.dropped += 1
+            except OSError as e:
+                self.dropped += 1
+                logger.warning(f"Could not notify {peer}: {str(e)}")
+        return generation
+
+    def _receive(self) -> None:
+        while True:
+            try:
+                payload = self._sock.recv(MAX_MESSAGE_BYTES + 1024)
+            except (BlockingIOError, OSError):
+                return
+            self.received += 1
+            try:
+                message = json.loads(payload)
+            except ValueError:
+                continue
+            for handler in self._handlers.get(message.get("topic"), []):
+                try:
+                    result = handler(message.get("action"), message.get("record"))
+                    if asyncio.iscoroutine(result):
+                        asyncio.ensure_future(result)
+                except Exception as e:
+                    logger.error(f"Error applying {message.get('topic')} invalidation: {str(e)}")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "enabled": self._sock is not None,
+            "peers": len(self._peer_paths()) if self._sock is not None else 0,
+            "sent": self.sent,
+            "received": self.received,
+            "dropped": self.dropped,
+            "generations": self.generations.snapshot()
+        }
+
+# Create a singleton instance
+invalidation_bus = InvalidationBus(INVALIDATION_DIR if os.getenv("INVALIDATION_BUS", "true").lower() == "true" else None)
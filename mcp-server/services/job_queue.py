@@ -0,0 +1,317 @@
+"""
+Job Queue Service for MCP Server
+Durable SQLite-backed background jobs with retries, backoff and per-type concurrency
+"""
+
+import os
+import json
+import time
+import random
+import socket
+import secrets
+import sqlite3
+import asyncio
+import logging
+from pathlib import Path
+from contextlib import suppress
+from datetime import datetime
+from typing import Optional, List, Dict, Any, Callable, Awaitable
+
+from services.ids import new_id
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_DB = os.getenv(
+    "JOB_QUEUE_DB",
+    str(Path(__file__).resolve().parent.parent / "data" / "jobs.db")
+)
+
+# A running job whose owner stops renewing its lease for this long is requeued
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    job_type TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL,
+    run_at REAL NOT NULL,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, run_at);
+"""
+
+class JobType:
+    """A registered job handler and its limits"""
+
+    def __init__(
+        self,
+        handler: Callable[[Dict[str, Any]], Awaitable[Any]],
+        concurrency: int,
+        max_attempts: int,
+        base_delay: float,
+        max_delay: float,
+        on_failure: Optional[Callable[[Dict[str, Any], str], Awaitable[Any]]] = None
+    ):
+        self.handler = handler
+        self.on_failure = on_failure
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.running = 0
+
+    def backoff(self, attempts: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+
+class JobQueue:
+    """
+    Runs slow side effects after the request has been answered. Jobs are
+    written to SQLite in WAL mode before enqueue returns, so they survive a
+    restart. Several worker processes can share the database: a job is
+    claimed with a conditional update, so only one of them runs it, and the
+    claimant holds a lease it renews while the job runs. Jobs whose owner
+    process has exited or whose lease has lapsed are retried.
+    """
+
+    def __init__(
+        self,
+        db_path: str = JOB_QUEUE_DB,
+        workers: int = 4,
+        poll_interval: float = 5.0,
+        lease_seconds: float = JOB_LEASE_SECONDS
+    ):
+        self.db_path = db_path
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        # The token tells this process apart from an earlier one that had the same PID
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{secrets.token_hex(4)}"
+        self._types: Dict[str, JobType] = {}
+        self._conn: Optional[sqlite3.Connection] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+            self._conn.row_factory = sqlite3.Row
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript(SCHEMA)
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")}
+            for column, column_type in (("owner", "TEXT"), ("lease_until", "REAL")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE jobs ADD COLUMN {column} {column_type}")
+        return self._conn
+
+    def register(
+        self,
+        job_type: str,
+        handler: Callable[[Dict[str, Any]], Awaitable[Any]],
+        concurrency: int = 2,
+        max_attempts: int = 5,
+        base_delay: float = 2.0,
+        max_delay: float = 300.0,
+        on_failure: Optional[Callable[[Dict[str, Any], str], Awaitable[Any]]] = None
+    ) -> None:
+        """Register the handler for a job type, and optionally a callback for jobs that fail permanently"""
+        self._types[job_type] = JobType(handler, concurrency, max_attempts, base_delay, max_delay, on_failure)
+
+    # =====================
+    # Producing and Inspecting
+    # =====================
+
+    def enqueue(self, job_type: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist a job and wake a worker; returns the job"""
+        if job_type not in self._types:
+            raise ValueError(f"Unknown job type {job_type}")
+        now = time.time()
+        job_id = new_id("job")
+        self._db().execute(
+            "INSERT INTO jobs (id, job_type, payload, status, max_attempts, run_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, job_type, json.dumps(payload, default=str), self._types[job_type].max_attempts, now, now, now)
+        )
+        if self._wake:
+            self._wake.set()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """A job's current state"""
+        row = self._db().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row["id"],
+            "job_type": row["job_type"],
+            "status": row["status"],
+            "attempts": row["attempts"],
+            "max_attempts": row["max_attempts"],
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "next_attempt_at": datetime.fromtimestamp(row["run_at"]).isoformat() if row["status"] == "queued" else None,
+            "created_at": datetime.fromtimestamp(row["created_at"]).isoformat(),
+            "updated_at": datetime.fromtimestamp(row["updated_at"]).isoformat()
+        }
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._db().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+    # =====================
+    # Workers
+    # =====================
+
+    def _claim(self) -> Optional[sqlite3.Row]:
+        """Mark the next due job whose type has a free slot as running by this process"""
+        busy = [name for name, job_type in self._types.items() if job_type.running >= job_type.concurrency]
+        types = [name for name in self._types if name not in busy]
+        if not types:
+            return None
+        placeholders = ",".join("?" for _ in types)
+        query = f"SELECT * FROM jobs WHERE status = 'queued' AND run_at <= ? AND job_type IN ({placeholders})"
+        # Another process may claim the row between the select and the update; then try the next one
+        for _ in range(5):
+            row = self._db().execute(query + " ORDER BY run_at LIMIT 1", (time.time(), *types)).fetchone()
+            if row is None:
+                return None
+            now = time.time()
+            claimed = self._db().execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, owner = ?, lease_until = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'queued'",
+                (self.owner, now + self.lease_seconds, now, row["id"])
+            ).rowcount
+            if claimed:
+                self._types[row["job_type"]].running += 1
+                return row
+        return None
+
+    def _owner_alive(self, owner: Optional[str]) -> bool:
+        """Whether a claimant on this host is still running; owners on other hosts are judged by their lease"""
+        parts = (owner or "").rsplit(":", 2)
+        if len(parts) != 3 or parts[0] != socket.gethostname() or not parts[1].isdigit():
+            return True
+        pid = parts[1]
+        if int(pid) == os.getpid():
+            return owner == self.owner
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _reclaim(self) -> int:
+        """Requeue running jobs whose owner has exited or whose lease has lapsed"""
+        now = time.time()
+        requeued = 0
+        for row in self._db().execute("SELECT id, owner, lease_until FROM jobs WHERE status = 'running'").fetchall():
+            if row["owner"] == self.owner:
+                continue
+            if (row["lease_until"] or 0) >= now and self._owner_alive(row["owner"]):
+                continue
+            requeued += self._db().execute(
+                "UPDATE jobs SET status = 'queued', owner = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND status = 'running' AND owner IS ?",
+                (now, row["id"], row["owner"])
+            ).rowcount
+        if requeued:
+            logger.info(f"Requeued {requeued} interrupted jobs")
+        return requeued
+
+    async def _renew_lease(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            self._db().execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND status = 'running' AND owner = ?",
+                (time.time() + self.lease_seconds, job_id, self.owner)
+            )
+
+    def _next_due_in(self) -> float:
+        row = self._db().execute("SELECT MIN(run_at) AS run_at FROM jobs WHERE status = 'queued'").fetchone()
+        if row is None or row["run_at"] is None:
+            return self.poll_interval
+        return min(max(row["run_at"] - time.time(), 0.05), self.poll_interval)
+
+    async def _execute(self, row: sqlite3.Row) -> None:
+        job_type = self._types[row["job_type"]]
+        attempts = row["attempts"] + 1
+        lease = asyncio.create_task(self._renew_lease(row["id"]))
+        try:
+            result = await job_type.handler(json.loads(row["payload"]))
+            self._db().execute(
+                "UPDATE jobs SET status = 'succeeded', result = ?, error = NULL, owner = NULL, lease_until = NULL, updated_at = ? "
+                "WHERE id = ? AND owner = ?",
+                (json.dumps(result, default=str), time.time(), row["id"], self.owner)
+            )
+        except Exception as e:
+            if attempts >= row["max_attempts"]:
+                logger.error(f"Job {row['id']} ({row['job_type']}) failed permanently: {str(e)}")
+                failed = self._db().execute(
+                    "UPDATE jobs SET status = 'failed', error = ?, owner = NULL, lease_until = NULL, updated_at = ? "
+                    "WHERE id = ? AND owner = ?",
+                    (str(e), time.time(), row["id"], self.owner)
+                ).rowcount
+                # A job requeued from under this process after its lease lapsed is not finished yet
+                if failed and job_type.on_failure:
+                    try:
+                        await job_type.on_failure(json.loads(row["payload"]), str(e))
+                    except Exception as callback_error:
+                        logger.error(f"Error handling failure of job {row['id']}: {str(callback_error)}")
+            else:
+                delay = job_type.backoff(attempts)
+                logger.warning(f"Job {row['id']} ({row['job_type']}) attempt {attempts} failed, retrying in {delay:.1f}s: {str(e)}")
+                self._db().execute(
+                    "UPDATE jobs SET status = 'queued', error = ?, run_at = ?, owner = NULL, lease_until = NULL, updated_at = ? "
+                    "WHERE id = ? AND owner = ?",
+                    (str(e), time.time() + delay, time.time(), row["id"], self.owner)
+                )
+        finally:
+            lease.cancel()
+            job_type.running -= 1
+            # A freed type slot may unblock a queued job
+            self._wake.set()
+
+    async def _worker(self) -> None:
+        while True:
+            row = self._claim()
+            if row is None:
+                self._reclaim()
+                self._wake.clear()
+                with suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._wake.wait(), self._next_due_in())
+                continue
+            await self._execute(row)
+
+    def start(self) -> None:
+        """Requeue jobs interrupted by a stopped process and start the workers"""
+        self._wake = asyncio.Event()
+        self._reclaim()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        logger.info(f"Job queue started with {self.workers} workers")
+
+    async def stop(self) -> None:
+        """Stop the workers; jobs they were running are retried once this process has exited"""
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+# Create a singleton instance
+job_queue = JobQueue(workers=int(os.getenv("JOB_QUEUE_WORKERS", "4")))
@@ -0,0 +1,503 @@
+"""
+Leaderboard Service for MCP Server
+Incrementally maintained per-class standings and season points for SPL/SQ results
+"""
+
+import json
+import random
+import asyncio
+import logging
+from datetime import datetime
+from dataclasses import dataclass
+from typing import Optional, List, Dict, Any, Tuple, Callable, Awaitable, Iterator
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class RankingRule:
+    """How a format ranks scores"""
+    unit: str
+    higher_is_better: bool = True
+    # "best" keeps a competitor's best score, "latest" their most recent one
+    counts: str = "best"
+    tie_break_higher_is_better: bool = True
+
+# Ties on score go to the tie-breaker (e.g. a second SPL run or the SQ install
+# score), then to whoever posted the score first
+RANKING_RULES: Dict[str, RankingRule] = {
+    "SPL": RankingRule(unit="dB"),
+    "SQ": RankingRule(unit="points"),
+    "Show": RankingRule(unit="points", counts="latest"),
+}
+
+# Season points awarded by finishing position in each event class
+SEASON_POINTS: List[int] = [25, 20, 16, 13, 11, 10, 9, 8, 7, 6, 5, 4, 3, 2, 1]
+
+class _Node:
+    __slots__ = ("key", "priority", "size", "left", "right")
+
+    def __init__(self, key: Tuple, priority: float):
+        self.key = key
+        self.priority = priority
+        self.size = 1
+        self.left: Optional["_Node"] = None
+        self.right: Optional["_Node"] = None
+
+def _size(node: Optional[_Node]) -> int:
+    return node.size if node else 0
+
+def _update(node: _Node) -> None:
+    node.size = 1 + _size(node.left) + _size(node.right)
+
+class OrderStatisticTree:
+    """
+    Treap of unique keys augmented with subtree sizes, so insert, remove,
+    rank and select all take O(log n) expected time.
+    """
+
+    def __init__(self):
+        self._root: Optional[_Node] = None
+        self._random = random.Random()
+
+    def __len__(self) -> int:
+        return _size(self._root)
+
+    def _split(self, node: Optional[_Node], key: Tuple) -> Tuple[Optional[_Node], Optional[_Node]]:
+        """Split into keys < key and keys >= key"""
+        if node is None:
+            return None, None
+        if node.key < key:
+            node.right, right = self._split(node.right, key)
+            _update(node)
+            return node, right
+        left, node.left = self._split(node.left, key)
+        _update(node)
+        return left, node
+
+    def _merge(self, left: Optional[_Node], right: Optional[_Node]) -> Optional[_Node]:
+        if left is None or right is None:
+            return left or right
+        if left.priority > right.priority:
+            left.right = self._merge(left.right, right)
+            _update(left)
+            return left
+        right.left = self._merge(left, right.left)
+        _update(right)
+        return right
+
+    def _insert(self, node: Optional[_Node], new: _Node) -> _Node:
+        if node is None:
+            return new
+        if new.priority > node.priority:
+            new.left, new.right = self._split(node, new.key)
+            _update(new)
+            return new
+        if new.key < node.key:
+            node.left = self._insert(node.left, new)
+        else:
+            node.right = self._insert(node.right, new)
+        _update(node)
+        return node
+
+    def _remove(self, node: Optional[_Node], key: Tuple) -> Optional[_Node]:
+        if node is None:
+            return None
+        if key < node.key:
+            node.left = self._remove(node.left, key)
+        elif node.key < key:
+            node.right = self._remove(node.right, key)
+        else:
+            return self._merge(node.left, node.right)
+        _update(node)
+        return node
+
+    def insert(self, key: Tuple) -> None:
+        self._root = self._insert(self._root, _Node(key, self._random.random()))
+
+    def remove(self, key: Tuple) -> None:
+        self._root = self._remove(self._root, key)
+
+    def rank(self, key: Tuple) -> int:
+        """Number of keys smaller than key"""
+        node, rank = self._root, 0
+        while node is not None:
+            if node.key < key:
+                rank += _size(node.left) + 1
+                node = node.right
+            else:
+                node = node.left
+        return rank
+
+    def select(self, index: int) -> Tuple:
+        """Key at a 0-based position in sorted order"""
+        node = self._root
+        while node is not None:
+            left_size = _size(node.left)
+            if index < left_size:
+                node = node.left
+            elif index == left_size:
+                return node.key
+            else:
+                index -= left_size + 1
+                node = node.right
+        raise IndexError("OrderStatisticTree index out of range")
+
+    def iter_from(self, index: int) -> Iterator[Tuple]:
+        """Keys in sorted order starting at a 0-based position"""
+        stack: List[_Node] = []
+        node = self._root
+        # Descend to the start position, stacking the nodes that come after it
+        while node is not None:
+            left_size = _size(node.left)
+            if index < left_size:
+                stack.append(node)
+                node = node.left
+            elif index == left_size:
+                stack.append(node)
+                break
+            else:
+                index -= left_size + 1
+                node = node.right
+        while stack:
+            node = stack.pop()
+            yield node.key
+            node = node.right
+            while node is not None:
+                stack.append(node)
+                node = node.left
+
+class SeasonStandings:
+    """Season points per competitor, ranked"""
+
+    def __init__(self, season: str):
+        self.season = season
+        self.points: Dict[str, int] = {}
+        self.names: Dict[str, str] = {}
+        self.tree = OrderStatisticTree()
+
+    def add(self, competitor_id: str, points: int) -> None:
+        if not points:
+            return
+        total = self.points.get(competitor_id, 0)
+        if competitor_id in self.points:
+            self.tree.remove((-total, competitor_id))
+        self.points[competitor_id] = total + points
+        self.tree.insert((-(total + points), competitor_id))
+
+    def standing(self, competitor_id: str) -> Optional[Dict[str, Any]]:
+        total = self.points.get(competitor_id)
+        if total is None:
+            return None
+        return {
+            "rank": self.tree.rank((-total, "")) + 1,
+            "competitor_id": competitor_id,
+            "competitor_name": self.names.get(competitor_id),
+            "points": total
+        }
+
+    def top(self, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        results = []
+        for neg_points, competitor_id in self.tree.iter_from(offset):
+            if len(results) >= limit:
+                break
+            results.append(self.standing(competitor_id))
+        return results
+
+class ClassLeaderboard:
+    """Standings for one class at one event"""
+
+    def __init__(self, event_id: str, class_id: str, score_format: str, season: str):
+        self.event_id = event_id
+        self.class_id = class_id
+        self.format = score_format
+        self.rule = RANKING_RULES.get(score_format, RANKING_RULES["SPL"])
+        self.season = season
+        self.tree = OrderStatisticTree()
+        self.entries: Dict[str, Dict[str, Any]] = {}
+        self.awarded: Dict[str, int] = {}
+
+    def sort_key(self, entry: Dict[str, Any]) -> Tuple:
+        """Ascending key: the best result sorts first"""
+        score = entry["score"] if self.rule.higher_is_better else -entry["score"]
+        tie_breaker = entry.get("tie_breaker")
+        if tie_breaker is None:
+            tie_breaker = float("-inf")
+        elif not self.rule.tie_break_higher_is_better:
+            tie_breaker = -tie_breaker
+        return (-score, -tie_breaker, entry["seq"], entry["competitor_id"])
+
+    def rank_of(self, competitor_id: str) -> Optional[int]:
+        entry = self.entries.get(competitor_id)
+        if entry is None:
+            return None
+        return self.tree.rank(self.sort_key(entry)) + 1
+
+    def standing(self, competitor_id: str) -> Optional[Dict[str, Any]]:
+        entry = self.entries.get(competitor_id)
+        if entry is None:
+            return None
+        return {
+            "rank": self.rank_of(competitor_id),
+            "competitor_id": competitor_id,
+            "competitor_name": entry.get("competitor_name"),
+            "score": entry["score"],
+            "tie_breaker": entry.get("tie_breaker"),
+            "unit": self.rule.unit,
+            "attempts": entry["attempts"],
+            "season_points": self.awarded.get(competitor_id, 0)
+        }
+
+    def top(self, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        results = []
+        for key in self.tree.iter_from(offset):
+            if len(results) >= limit:
+                break
+            results.append(self.standing(key[-1]))
+        return results
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "event_id": self.event_id,
+            "class_id": self.class_id,
+            "format": self.format,
+            "unit": self.rule.unit,
+            "season": self.season,
+            "competitors": len(self.entries)
+        }
+
+class LeaderboardService:
+    """
+    Keeps every class leaderboard in sorted structures that are updated as
+    each score posts, instead of re-sorting all scores per request. Season
+    points are adjusted only for the positions a new score moves.
+    """
+
+    def __init__(
+        self,
+        season_points: Optional[List[int]] = None,
+        results_loader: Optional[Callable[[str], Awaitable[List[Dict[str, Any]]]]] = None,
+        results_writer: Optional[Callable[[Dict[str, Any]], Awaitable[Any]]] = None,
+        event_ids_loader: Optional[Callable[[], Awaitable[List[str]]]] = None
+    ):
+        self.season_points = season_points or SEASON_POINTS
+        self.results_loader = results_loader
+        self.results_writer = results_writer
+        self.event_ids_loader = event_ids_loader
+        self._boards: Dict[Tuple[str, str], ClassLeaderboard] = {}
+        self._event_classes: Dict[str, List[str]] = {}
+        self._seasons: Dict[str, SeasonStandings] = {}
+        self._loaded_events: Dict[str, asyncio.Event] = {}
+        self._all_loaded = False
+        self._seq = 0
+
+    def _season(self, season: str) -> SeasonStandings:
+        standings = self._seasons.get(season)
+        if standings is None:
+            standings = self._seasons[season] = SeasonStandings(season)
+        return standings
+
+    def _points_for(self, position: int) -> int:
+        return self.season_points[position] if position < len(self.season_points) else 0
+
+    def _award(self, board: ClassLeaderboard, first: int, last: int) -> None:
+        """Recompute season points for board positions first..last (0-based, inclusive)"""
+        standings = self._season(board.season)
+        last = min(last, len(self.season_points), len(board.tree) - 1)
+        if first > last:
+            return
+        for position, key in enumerate(board.tree.iter_from(first), start=first):
+            if position > last:
+                break
+            self._set_award(board, standings, key[-1], self._points_for(position))
+
+    def _set_award(self, board: ClassLeaderboard, standings: SeasonStandings, competitor_id: str, points: int) -> None:
+        delta = points - board.awarded.get(competitor_id, 0)
+        if delta:
+            board.awarded[competitor_id] = points
+            standings.add(competitor_id, delta)
+
+    def apply(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply a score to its class leaderboard and return the competitor's standing"""
+        event_id, class_id = str(result["event_id"]), str(result["class_id"])
+        competitor_id = str(result["competitor_id"])
+        board = self._boards.get((event_id, class_id))
+        if board is None:
+            board = ClassLeaderboard(
+                event_id,
+                class_id,
+                result.get("format") or "SPL",
+                result.get("season") or str(datetime.now().year)
+            )
+            self._boards[(event_id, class_id)] = board
+            self._event_classes.setdefault(event_id, []).append(class_id)
+
+        self._seq += 1
+        candidate = {
+            "competitor_id": competitor_id,
+            "competitor_name": result.get("competitor_name"),
+            "score": float(result["score"]),
+            "tie_breaker": float(result["tie_breaker"]) if result.get("tie_breaker") is not None else None,
+            "seq": self._seq
+        }
+        if result.get("competitor_name"):
+            self._season(board.season).names[competitor_id] = result["competitor_name"]
+
+        previous = board.entries.get(competitor_id)
+        old_position = None
+        if previous is not None:
+            candidate["attempts"] = previous["attempts"] + 1
+            keep_previous = board.rule.counts == "best" and board.sort_key(previous) < board.sort_key(candidate)
+            if keep_previous:
+                previous["attempts"] = candidate["attempts"]
+                return board.standing(competitor_id)
+            old_position = board.tree.rank(board.sort_key(previous))
+            board.tree.remove(board.sort_key(previous))
+        else:
+            candidate["attempts"] = 1
+
+        board.entries[competitor_id] = candidate
+        new_key = board.sort_key(candidate)
+        board.tree.insert(new_key)
+        new_position = board.tree.rank(new_key)
+
+        # Only positions between the old and new rank move; a new entry shifts everyone below it
+        if old_position is None:
+            self._award(board, new_position, len(board.tree) - 1)
+        else:
+            self._award(board, min(old_position, new_position), max(old_position, new_position))
+        # The moved competitor may have dropped out of the points positions entirely
+        self._set_award(board, self._season(board.season), competitor_id, self._points_for(new_position))
+        return board.standing(competitor_id)
+
+    def apply_remote(self, action: str, result: Optional[Dict[str, Any]]) -> None:
+        """Apply a score posted on another worker, if this worker has its event loaded"""
+        if action != "created" or not result:
+            return
+        event_id = str(result["event_id"])
+        loaded = self._loaded_events.get(event_id)
+        if loaded is None and self._all_loaded:
+            # Every event with results was loaded, so this is the event's first score
+            loaded = self._loaded_events[event_id] = asyncio.Event()
+            loaded.set()
+        # Unloaded events read the score from the database when first used
+        if loaded is not None and loaded.is_set():
+            self.apply(result)
+
+    async def ensure_loaded(self, event_id: str) -> None:
+        """Load an event's stored results the first time it is used"""
+        loaded = self._loaded_events.get(event_id)
+        if loaded is not None:
+            await loaded.wait()
+            if event_id not in self._loaded_events:
+                # The load failed; try again rather than serve an empty board
+                await self.ensure_loaded(event_id)
+            return
+        loaded = self._loaded_events[event_id] = asyncio.Event()
+        try:
+            results = await self.results_loader(event_id) if self.results_loader else []
+        except Exception as e:
+            logger.error(f"Error loading results for event {event_id}: {str(e)}")
+            # Forget the attempt so the next call retries
+            del self._loaded_events[event_id]
+            raise
+        finally:
+            loaded.set()
+        for result in results:
+            self.apply(result)
+
+    async def ensure_all_loaded(self) -> None:
+        """Load the stored results of every event, so season points cover events not yet viewed"""
+        if self._all_loaded:
+            return
+        event_ids = await self.event_ids_loader() if self.event_ids_loader else []
+        for event_id in event_ids:
+            await self.ensure_loaded(str(event_id))
+        self._all_loaded = True
+
+    async def submit(self, result: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a score and apply it to the standings"""
+        event_id = str(result["event_id"])
+        board = self._boards.get((event_id, str(result["class_id"])))
+        if board and result.get("format") and result["format"] != board.format:
+            raise ValueError(f"Class {result['class_id']} at event {event_id} is scored as {board.format}")
+        if (result.get("format") or "SPL") not in RANKING_RULES:
+            raise ValueError(f"Unknown score format {result['format']}")
+
+        await self.ensure_loaded(event_id)
+        if self.results_writer:
+            await self.results_writer(result)
+        return self.apply(result)
+
+    async def event_standings(
+        self,
+        event_id: str,
+        class_id: Optional[str] = None,
+        limit: int = 10,
+        offset: int = 0,
+        competitor_id: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """Standings for one class, or every class, of an event"""
+        await self.ensure_loaded(event_id)
+        class_ids = [class_id] if class_id else self._event_classes.get(event_id, [])
+        boards = []
+        for cid in class_ids:
+            board = self._boards.get((event_id, cid))
+            if board is None:
+                continue
+            boards.append({
+                **board.summary(),
+                "standings": board.top(limit, offset),
+                "competitor": board.standing(competitor_id) if competitor_id else None
+            })
+        return boards
+
+    async def season_standings(
+        self,
+        season: str,
+        limit: int = 10,
+        offset: int = 0,
+        competitor_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Season points across every event with stored results"""
+        await self.ensure_all_loaded()
+        standings = self._seasons.get(season)
+        if standings is None:
+            return {"season": season, "competitors": 0, "standings": [], "competitor": None}
+        return {
+            "season": season,
+            "competitors": len(standings.points),
+            "standings": standings.top(limit, offset),
+            "competitor": standings.standing(competitor_id) if competitor_id else None
+        }
+
+def result_to_record(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Map a score submission onto a competition_results row"""
+    return {
+        "event_id": result["event_id"],
+        "category": result["class_id"],
+        "score": result["score"],
+        "notes": json.dumps({
+            "competitor_id": result["competitor_id"],
+            "competitor_name": result.get("competitor_name"),
+            "format": result.get("format"),
+            "tie_breaker": result.get("tie_breaker"),
+            "season": result.get("season")
+        })
+    }
+
+def record_to_result(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Inverse of result_to_record"""
+    details = json.loads(record.get("notes") or "{}")
+    return {
+        "event_id": record["event_id"],
+        "class_id": record["category"],
+        "score": record["score"],
+        "competitor_id": details.get("competitor_id") or record.get("user_id") or record["id"],
+        "competitor_name": details.get("competitor_name"),
+        "format": details.get("format"),
+        "tie_breaker": details.get("tie_breaker"),
+        "season": details.get("season")
+    }
+
+# Create a singleton instance
+leaderboard_service = LeaderboardService()
@@ -0,0 +1,165 @@
+"""
+Live Event Feed Service for MCP Server
+Fans out registration, payment and check-in deltas to event-day viewers
+"""
+
+import asyncio
+import logging
+from datetime import datetime
+from contextlib import asynccontextmanager
+from typing import Optional, List, Dict, Any, Set, Tuple, Callable, Awaitable, AsyncIterator
+
+logger = logging.getLogger(__name__)
+
+class EventTopic:
+    """One shared subscription per event: running totals plus subscriber queues"""
+
+    def __init__(self, event_id: str):
+        self.event_id = event_id
+        self.subscribers: Set[asyncio.Queue] = set()
+        self.totals: Dict[str, Any] = {
+            "registrations": 0,
+            "paid": 0,
+            "revenue": 0.0,
+            "checked_in": 0
+        }
+        self.seq = 0
+        self.ready = asyncio.Event()
+        # Subscribers joined or waiting for the snapshot; the topic closes when this drops to zero
+        self.viewers = 0
+        # Deltas published while the snapshot loads, applied on top of it once it lands
+        self.pending: List[Tuple[str, Dict[str, Any]]] = []
+
+    def apply(self, delta_type: str, data: Dict[str, Any]) -> None:
+        """Update the running totals for one delta"""
+        if delta_type == "registration_created":
+            self.totals["registrations"] += 1
+        elif delta_type == "payment_succeeded":
+            self.totals["paid"] += 1
+            self.totals["revenue"] = round(self.totals["revenue"] + float(data.get("amount") or 0), 2)
+        elif delta_type == "checked_in":
+            self.totals["checked_in"] += 1
+        self.seq += 1
+
+    def message(self, delta_type: str, data: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        return {
+            "type": delta_type,
+            "event_id": self.event_id,
+            "seq": self.seq,
+            "at": datetime.now().isoformat(),
+            "data": data or {},
+            "totals": dict(self.totals)
+        }
+
+class EventFeedHub:
+    """
+    Pub/sub hub for live event-day feeds. Write paths publish deltas; every
+    viewer of an event shares one topic, whose totals are loaded once when
+    the first viewer subscribes and then maintained incrementally.
+    """
+
+    def __init__(self, queue_size: int = 256, max_tracked_registrations: int = 100_000):
+        self.queue_size = queue_size
+        self.max_tracked_registrations = max_tracked_registrations
+        self.snapshot_loader: Optional[Callable[[str], Awaitable[Dict[str, Any]]]] = None
+        self._topics: Dict[str, EventTopic] = {}
+        self._registration_events: Dict[str, str] = {}
+
+    def has_viewers(self, event_id: Optional[str] = None) -> bool:
+        if event_id is None:
+            return bool(self._topics)
+        return event_id in self._topics
+
+    def viewer_count(self, event_id: str) -> int:
+        topic = self._topics.get(event_id)
+        return len(topic.subscribers) if topic else 0
+
+    def event_for_registration(self, registration_id: str) -> Optional[str]:
+        """Event ID of a registration seen by this hub, if any"""
+        return self._registration_events.get(registration_id)
+
+    def publish(self, event_id: Optional[str], delta_type: str, data: Optional[Dict[str, Any]] = None) -> None:
+        """Apply a delta to the event's totals and push it to all of its viewers"""
+        if not event_id:
+            return
+        data = data or {}
+        if delta_type == "registration_created" and data.get("registration_id"):
+            self._registration_events[data["registration_id"]] = event_id
+            if len(self._registration_events) > self.max_tracked_registrations:
+                del self._registration_events[next(iter(self._registration_events))]
+
+        topic = self._topics.get(event_id)
+        if topic is None:
+            return
+        if not topic.ready.is_set():
+            # No one is subscribed yet and the snapshot would overwrite the totals
+            topic.pending.append((delta_type, data))
+            return
+
+        topic.apply(delta_type, data)
+        message = topic.message(delta_type, data)
+        for queue in topic.subscribers:
+            if queue.full():
+                # Drop the oldest delta; every message carries totals and seq
+                queue.get_nowait()
+            queue.put_nowait(message)
+
+    async def _load_snapshot(self, topic: EventTopic) -> None:
+        try:
+            if self.snapshot_loader:
+                totals = await self.snapshot_loader(topic.event_id)
+                topic.totals.update(totals)
+        except Exception as e:
+            logger.error(f"Error loading live totals for event {topic.event_id}: {str(e)}")
+        finally:
+            for delta_type, data in topic.pending:
+                topic.apply(delta_type, data)
+            topic.pending.clear()
+            topic.ready.set()
+
+    async def _join(self, event_id: str) -> EventTopic:
+        """The event's topic with its snapshot loaded, counting the caller among its viewers"""
+        while True:
+            topic = self._topics.get(event_id)
+            loading = topic is None
+            if loading:
+                topic = self._topics[event_id] = EventTopic(event_id)
+            topic.viewers += 1
+            try:
+                if loading:
+                    await self._load_snapshot(topic)
+                    logger.info(f"Opened live feed for event {event_id}")
+                else:
+                    await topic.ready.wait()
+            except BaseException:
+                if loading and self._topics.get(event_id) is topic:
+                    # Cancelled mid-load: drop the topic so viewers waiting on it load it again
+                    del self._topics[event_id]
+                self._leave(topic)
+                raise
+            if self._topics.get(event_id) is topic:
+                return topic
+            # The viewer loading this topic was cancelled; start over with a fresh one
+            topic.viewers -= 1
+
+    def _leave(self, topic: EventTopic) -> None:
+        topic.viewers -= 1
+        if not topic.viewers and self._topics.get(topic.event_id) is topic:
+            del self._topics[topic.event_id]
+            logger.info(f"Closed live feed for event {topic.event_id}")
+
+    @asynccontextmanager
+    async def subscribe(self, event_id: str) -> AsyncIterator[asyncio.Queue]:
+        """Subscribe to an event's feed; the queue starts with a snapshot message"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        topic = await self._join(event_id)
+        try:
+            queue.put_nowait(topic.message("snapshot"))
+            topic.subscribers.add(queue)
+            yield queue
+        finally:
+            topic.subscribers.discard(queue)
+            self._leave(topic)
+
+# Create a singleton instance
+event_feed_hub = EventFeedHub()
@@ -0,0 +1,588 @@
+"""
+Memory Store for MCP Server
+Indexed in-memory tables behind a Supabase-compatible query builder, used when no database is configured
+"""
+
+import os
+import json
+import random
+import asyncio
+import logging
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Set, Tuple, Union
+
+from services.ids import PREFIXES, new_id
+
+logger = logging.getLogger(__name__)
+
+@dataclass(frozen=True)
+class TableSpec:
+    """Secondary indexes and column defaults for one table"""
+    # Columns with an equality (hash) index
+    hash_indexes: Tuple[str, ...] = ()
+    # Timestamp or date columns with a sorted index for range filters; values compare as ISO strings
+    sorted_indexes: Tuple[str, ...] = ("created_at",)
+    defaults: Dict[str, Any] = field(default_factory=dict)
+
+TABLE_SPECS: Dict[str, TableSpec] = {
+    "events": TableSpec(hash_indexes=("status", "event_type"), sorted_indexes=("start_date", "created_at")),
+    "registrations": TableSpec(hash_indexes=("event_id", "user_id", "status"), defaults={"status": "pending_payment"}),
+    # There is no processor behind the store, so recorded payments succeed
+    "payments": TableSpec(hash_indexes=("registration_id", "status"), defaults={"status": "succeeded"}),
+    "event_check_ins": TableSpec(hash_indexes=("event_id", "registration_id"), sorted_indexes=("checked_in_at",)),
+    "competition_results": TableSpec(hash_indexes=("event_id",)),
+    "support_tickets": TableSpec(hash_indexes=("status", "user_id"), defaults={"status": "open"}),
+}
+
+RANGE_OPERATORS = ("gt", "gte", "lt", "lte")
+
+class Row:
+    """One stored row: its values in the table's column order"""
+
+    __slots__ = ("id", "seq", "values")
+
+    def __init__(self, row_id: str, seq: int, values: Tuple[Any, ...]):
+        self.id = row_id
+        self.seq = seq
+        self.values = values
+
+def _matches(value: Any, operator: str, operand: Any) -> bool:
+    """Evaluate one filter against a stored value, comparing like Postgres would"""
+    if operator == "in":
+        return value is not None and any(_matches(value, "eq", item) for item in operand)
+    if value is None or operand is None:
+        # Comparisons with NULL are never true
+        return False
+    if isinstance(value, (int, float)) and not isinstance(value, bool) and isinstance(operand, str):
+        try:
+            operand = float(operand)
+        except ValueError:
+            value = str(value)
+    elif isinstance(value, str) and not isinstance(operand, str):
+        operand = str(operand)
+    if operator == "eq":
+        return value == operand
+    if operator == "neq":
+        return value != operand
+    if operator == "gt":
+        return value > operand
+    if operator == "gte":
+        return value >= operand
+    if operator == "lt":
+        return value < operand
+    return value <= operand
+
+class MemoryTable:
+    """
+    Rows keyed by id, with hash indexes for equality filters and sorted
+    (value, seq, id) lists for range filters. A query starts from the
+    smallest candidate set any index offers and checks the remaining
+    filters row by row.
+    """
+
+    def __init__(self, name: str, store: "MemoryStore", spec: Optional[TableSpec] = None):
+        self.name = name
+        self.store = store
+        self.spec = spec or TableSpec()
+        self.columns: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.rows: Dict[str, Row] = {}
+        self._seq = 0
+        self.hash_indexes: Dict[str, Dict[Any, Set[str]]] = {column: {} for column in self.spec.hash_indexes}
+        # The primary key is always sorted-indexed, for paging in id order
+        self.sorted_indexes: Dict[str, List[Tuple[str, int, str]]] = {
+            column: [] for column in ("id",) + self.spec.sorted_indexes
+        }
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def value(self, row: Row, column: str) -> Any:
+        position = self.positions.get(column)
+        if position is None or position >= len(row.values):
+            return None
+        return row.values[position]
+
+    def to_dict(self, row: Row, columns: Optional[List[str]] = None) -> Dict[str, Any]:
+        if columns is None:
+            record = dict(zip(self.columns, row.values))
+            for column in self.columns[len(row.values):]:
+                record[column] = None
+            return record
+        return {column: self.value(row, column) for column in columns}
+
+    # =====================
+    # Writes
+    # =====================
+
+    def _index(self, row: Row, add: bool) -> None:
+        for column, index in self.hash_indexes.items():
+            value = self.value(row, column)
+            if value is None:
+                continue
+            if add:
+                index.setdefault(value, set()).add(row.id)
+            else:
+                bucket = index.get(value)
+                if bucket is not None:
+                    bucket.discard(row.id)
+                    if not bucket:
+                        del index[value]
+        for column, index in self.sorted_indexes.items():
+            value = self.value(row, column)
+            if value is None:
+                continue
+            entry = (str(value), row.seq, row.id)
+            if add:
+                index.insert(bisect_left(index, entry), entry)
+            else:
+                position = bisect_left(index, entry)
+                if position < len(index) and index[position] == entry:
+                    del index[position]
+
+    def _pack(self, record: Dict[str, Any]) -> Tuple[Any, ...]:
+        for column in record:
+            if column not in self.positions:
+                self.positions[column] = len(self.columns)
+                self.columns.append(column)
+        return tuple(record.get(column) for column in self.columns)
+
+    def _prepare(self, record: Dict[str, Any]) -> Row:
+        record = dict(record)
+        for column, default in self.spec.defaults.items():
+            record.setdefault(column, default)
+        record.setdefault("id", new_id(PREFIXES.get(self.name)))
+        record.setdefault("created_at", datetime.now().isoformat())
+        row_id = str(record["id"])
+        if row_id in self.rows:
+            raise ValueError(f'duplicate key value violates unique constraint "{self.name}_pkey"')
+        self._seq += 1
+        row = Row(row_id, self._seq, self._pack(record))
+        self.rows[row_id] = row
+        return row
+
+    def insert(self, record: Dict[str, Any]) -> Row:
+        row = self._prepare(record)
+        self._index(row, add=True)
+        return row
+
+    def bulk_insert(self, records: List[Dict[str, Any]]) -> None:
+        """Insert many rows, then build the indexes once instead of row by row"""
+        rows = [self._prepare(record) for record in records]
+        for column, index in self.hash_indexes.items():
+            for row in rows:
+                value = self.value(row, column)
+                if value is not None:
+                    index.setdefault(value, set()).add(row.id)
+        for column, index in self.sorted_indexes.items():
+            index.extend((str(value), row.seq, row.id) for row in rows if (value := self.value(row, column)) is not None)
+            index.sort()
+
+    def update(self, row: Row, changes: Dict[str, Any]) -> None:
+        self._index(row, add=False)
+        record = self.to_dict(row)
+        record.update(changes)
+        row.values = self._pack(record)
+        self._index(row, add=True)
+
+    # =====================
+    # Query Planning
+    # =====================
+
+    def _resolve(self, row: Row, column: str) -> Any:
+        """A column value, following relation.column filters through <relation>_id and column->>key into JSON"""
+        if "->>" in column:
+            column, key = column.split("->>", 1)
+            document = self._resolve(row, column)
+            return document.get(key) if isinstance(document, dict) else None
+        if "." not in column:
+            return self.value(row, column)
+        relation, related_column = column.split(".", 1)
+        related_table = self.store.tables.get(f"{relation}s")
+        related_row = related_table.rows.get(str(self.value(row, f"{relation}_id"))) if related_table else None
+        return related_table.value(related_row, related_column) if related_row else None
+
+    def _range_bounds(self, column: str, filters: List[Tuple[str, str, Any]]) -> Tuple[int, int]:
+        index = self.sorted_indexes[column]
+        low, high = 0, len(index)
+        for operator, filter_column, operand in filters:
+            if filter_column != column or operator not in RANGE_OPERATORS or operand is None:
+                continue
+            key = str(operand)
+            if operator == "gte":
+                low = max(low, bisect_left(index, (key,)))
+            elif operator == "gt":
+                low = max(low, bisect_right(index, (key, float("inf"))))
+            elif operator == "lt":
+                high = min(high, bisect_left(index, (key,)))
+            else:
+                high = min(high, bisect_right(index, (key, float("inf"))))
+        return low, max(low, high)
+
+    def _candidates(self, filters: List[Tuple[str, str, Any]]) -> Optional[Set[str]]:
+        """Row ids from the most selective usable index, or None to scan every row"""
+        best_size, best = len(self.rows) + 1, None
+        for operator, column, operand in filters:
+            index = self.hash_indexes.get(column)
+            if index is None or operator not in ("eq", "in"):
+                continue
+            buckets = [index.get(operand, ())] if operator == "eq" else [index.get(item, ()) for item in operand]
+            size = sum(len(bucket) for bucket in buckets)
+            if size < best_size:
+                best_size, best = size, ("hash", buckets)
+        for column in self.sorted_indexes:
+            if not any(c == column and op in RANGE_OPERATORS for op, c, _ in filters):
+                continue
+            low, high = self._range_bounds(column, filters)
+            if high - low < best_size:
+                best_size, best = high - low, ("sorted", column, low, high)
+        if best is None:
+            return None
+        if best[0] == "hash":
+            return set().union(*best[1])
+        _, column, low, high = best
+        return {entry[2] for entry in self.sorted_indexes[column][low:high]}
+
+    def _check(self, row: Row, filters: List[Tuple[str, str, Any]]) -> bool:
+        return all(_matches(self._resolve(row, column), operator, operand) for operator, column, operand in filters)
+
+    def query(
+        self,
+        filters: List[Tuple[str, str, Any]],
+        order: Optional[Tuple[str, bool]] = None,
+        offset: int = 0,
+        limit: Optional[int] = None,
+        count: bool = False,
+        then_by: Optional[List[Tuple[str, bool]]] = None
+    ) -> Tuple[List[Row], Optional[int]]:
+        """
+        Matching rows in [offset, offset + limit) and, if count is set, the
+        total number of matches. Ordering by an indexed column walks the
+        index and stops once the page is full, so paging does not sort;
+        then_by tie-breaking columns need a sort.
+        """
+        candidates = self._candidates(filters)
+        end = None if limit is None else offset + limit
+
+        # Walk the order index unless sorting a small candidate set is cheaper
+        walk_index = order is not None and not then_by and order[0] in self.sorted_indexes and (
+            candidates is None or len(candidates) * 16 > len(self.sorted_indexes[order[0]])
+        )
+        if walk_index:
+            column, descending = order
+            index = self.sorted_indexes[column]
+            entries = reversed(index) if descending else iter(index)
+            matched: List[Row] = []
+            total = 0
+            for _, _, row_id in entries:
+                if candidates is not None and row_id not in candidates:
+                    continue
+                row = self.rows[row_id]
+                if not self._check(row, filters):
+                    continue
+                total += 1
+                if end is None or len(matched) < end:
+                    matched.append(row)
+                elif not count:
+                    break
+            if len(index) < len(self.rows):
+                # Rows with NULL in the ordered column are not in the index; Postgres
+                # puts them last ascending and first descending
+                pool = self.rows.values() if candidates is None else (self.rows[row_id] for row_id in candidates)
+                nulls = [row for row in pool if self.value(row, column) is None and self._check(row, filters)]
+                nulls.sort(key=lambda row: row.seq)
+                total += len(nulls)
+                matched = nulls + matched if descending else matched + nulls
+            return matched[offset:end], (total if count else None)
+
+        if candidates is None:
+            rows = list(self.rows.values())
+        else:
+            rows = sorted((self.rows[row_id] for row_id in candidates), key=lambda row: row.seq)
+        if filters:
+            rows = [row for row in rows if self._check(row, filters)]
+        if order is not None:
+            # Stable sorts from the last tie-breaker to the primary column
+            for column, descending in reversed([order, *(then_by or [])]):
+                present = [row for row in rows if self.value(row, column) is not None]
+                missing = [row for row in rows if self.value(row, column) is None]
+                present.sort(key=lambda row: self.value(row, column), reverse=descending)
+                rows = missing + present if descending else present + missing
+        return rows[offset:end], (len(rows) if count else None)
+
+class MemoryResponse:
+    """Mirrors the data/count attributes of a PostgREST API response"""
+
+    def __init__(self, data: List[Dict[str, Any]], count: Optional[int] = None):
+        self.data = data
+        self.count = count
+
+class MemoryQuery:
+    """
+    The subset of the supabase-py query builder SupabaseService uses:
+    select/insert/update, eq/neq/gt/gte/lt/lte/in_ filters, order, range,
+    limit and execute.
+    """
+
+    def __init__(self, table: MemoryTable):
+        self.table = table
+        self._action = "select"
+        self._columns: Optional[List[str]] = None
+        self._count: Optional[str] = None
+        self._payload: Any = None
+        self._filters: List[Tuple[str, str, Any]] = []
+        self._order: Optional[Tuple[str, bool]] = None
+        self._then_by: List[Tuple[str, bool]] = []
+        self._offset = 0
+        self._limit: Optional[int] = None
+
+    def select(self, columns: str = "*", count: Optional[str] = None) -> "MemoryQuery":
+        self._action = "select"
+        names = [column.strip() for column in columns.split(",") if column.strip()]
+        self._columns = None if "*" in names else names
+        self._count = count
+        return self
+
+    def insert(self, data: Union[Dict[str, Any], List[Dict[str, Any]]]) -> "MemoryQuery":
+        self._action = "insert"
+        self._payload = data if isinstance(data, list) else [data]
+        return self
+
+    def update(self, data: Dict[str, Any]) -> "MemoryQuery":
+        self._action = "update"
+        self._payload = data
+        return self
+
+    def _filter(self, operator: str, column: str, value: Any) -> "MemoryQuery":
+        self._filters.append((operator, column, value))
+        return self
+
+    def eq(self, column: str, value: Any) -> "MemoryQuery":
+        return self._filter("eq", column, value)
+
+    def neq(self, column: str, value: Any) -> "MemoryQuery":
+        return self._filter("neq", column, value)
+
+    def gt(self, column: str, value: Any) -> "MemoryQuery":
+        return self._filter("gt", column, value)
+
+    def gte(self, column: str, value: Any) -> "MemoryQuery":
+        return self._filter("gte", column, value)
+
+    def lt(self, column: str, value: Any) -> "MemoryQuery":
+        return self._filter("lt", column, value)
+
+    def lte(self, column: str, value: Any) -> "MemoryQuery":
+        return self._filter("lte", column, value)
+
+    def in_(self, column: str, values: List[Any]) -> "MemoryQuery":
+        return self._filter("in", column, list(values))
+
+    def order(self, column: str, desc: bool = False) -> "MemoryQuery":
+        # Like PostgREST, later calls break ties left by earlier ones
+        if self._order is None:
+            self._order = (column, desc)
+        else:
+            self._then_by.append((column, desc))
+        return self
+
+    def range(self, start: int, end: int) -> "MemoryQuery":
+        self._offset = start
+        self._limit = max(end - start + 1, 0)
+        return self
+
+    def limit(self, size: int) -> "MemoryQuery":
+        self._limit = size
+        return self
+
+    def execute(self) -> MemoryResponse:
+        table = self.table
+        if self._action == "insert":
+            rows = [table.insert(record) for record in self._payload]
+            self.table.store.dirty = True
+            return MemoryResponse([table.to_dict(row) for row in rows])
+
+        if self._action == "update":
+            rows, _ = table.query(self._filters)
+            for row in rows:
+                table.update(row, self._payload)
+            if rows:
+                self.table.store.dirty = True
+            return MemoryResponse([table.to_dict(row) for row in rows])
+
+        rows, count = table.query(self._filters, self._order, self._offset, self._limit, bool(self._count), self._then_by)
+        return MemoryResponse([table.to_dict(row, self._columns) for row in rows], count)
+
+class MemoryStore:
+    """
+    Stands in for the Supabase client when no credentials are configured:
+    store.table(name) returns a query builder, so SupabaseService runs the
+    same code paths against it. Optionally snapshots to a JSON file and
+    reloads it on the next start.
+    """
+
+    def __init__(self, snapshot_path: Optional[str] = None, snapshot_interval: float = 60.0):
+        self.snapshot_path = snapshot_path
+        self.snapshot_interval = snapshot_interval
+        self.tables: Dict[str, MemoryTable] = {}
+        self.dirty = False
+
+    def _table(self, name: str) -> MemoryTable:
+        table = self.tables.get(name)
+        if table is None:
+            table = self.tables[name] = MemoryTable(name, self, TABLE_SPECS.get(name))
+        return table
+
+    def table(self, name: str) -> MemoryQuery:
+        return MemoryQuery(self._table(name))
+
+    def open(self, seed: bool = True) -> None:
+        """Load the snapshot if there is one, otherwise optionally seed demo data"""
+        if self.snapshot_path and Path(self.snapshot_path).exists():
+            self.restore(self.snapshot_path)
+        elif seed:
+            for name, rows in demo_rows().items():
+                self._table(name).bulk_insert(rows)
+            logger.info(f"Seeded the in-memory store with {sum(len(t) for t in self.tables.values())} demo rows")
+
+    # =====================
+    # Snapshots
+    # =====================
+
+    def _serialize(self) -> Dict[str, Any]:
+        return {
+            "saved_at": datetime.now().isoformat(),
+            "tables": {
+                name: {"columns": table.columns, "rows": [list(row.values) for row in table.rows.values()]}
+                for name, table in self.tables.items()
+            }
+        }
+
+    @staticmethod
+    def _write(path: str, snapshot: Dict[str, Any]) -> None:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(snapshot, f, default=str, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    def save(self, path: Optional[str] = None) -> None:
+        """Write every table to a snapshot file atomically"""
+        path = path or self.snapshot_path
+        if not path:
+            return
+        self._write(path, self._serialize())
+        self.dirty = False
+
+    def restore(self, path: str) -> None:
+        with open(path) as f:
+            snapshot = json.load(f)
+        self.tables = {}
+        for name, data in snapshot["tables"].items():
+            self._table(name).bulk_insert([dict(zip(data["columns"], values)) for values in data["rows"]])
+        self.dirty = False
+        logger.info(f"Restored {sum(len(t) for t in self.tables.values())} rows from {path}")
+
+    async def run(self) -> None:
+        """Snapshot changed tables every snapshot_interval; no-op without a snapshot path"""
+        if not self.snapshot_path:
+            return
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            if not self.dirty:
+                continue
+            try:
+                # Serialize on the loop so the copy is consistent, write off it
+                snapshot = self._serialize()
+                self.dirty = False
+                await asyncio.to_thread(self._write, self.snapshot_path, snapshot)
+            except Exception as e:
+                self.dirty = True
+                logger.error(f"Error writing memory store snapshot: {str(e)}")
+
+def demo_rows() -> Dict[str, List[Dict[str, Any]]]:
+    """A deterministic season of past events with registrations, payments and check-ins, plus two upcoming events"""
+    rng = random.Random(42)
+    venues = [("Miami", "FL"), ("Atlanta", "GA"), ("Dallas", "TX"), ("Phoenix", "AZ"), ("Orlando", "FL"), ("Nashville", "TN")]
+    classes = {"SPL": ["spl_street", "spl_trunk", "spl_extreme"], "SQ": ["sq_stock", "sq_modified"], "Show": ["show_car"]}
+    fees = {"spl_street": 35.0, "spl_trunk": 45.0, "spl_extreme": 65.0, "sq_stock": 40.0, "sq_modified": 55.0, "show_car": 30.0}
+    competitors = [f"user_{n:03d}" for n in range(180)]
+    rows: Dict[str, List[Dict[str, Any]]] = {"events": [], "registrations": [], "payments": [], "event_check_ins": []}
+
+    for number in range(12):
+        event_id = f"evt_{number + 1:03d}"
+        event_type = ["SPL", "SQ", "Show"][number % 3]
+        event_day = datetime(2025, 1, 18) + timedelta(days=30 * number)
+        city, state = venues[number % len(venues)]
+        rows["events"].append({
+            "id": event_id,
+            "name": f"{city} {event_type} Showdown",
+            "event_type": event_type,
+            "start_date": event_day.date().isoformat(),
+            "location": f"{city}, {state}",
+            "city": city,
+            "state": state,
+            "max_competitors": 120,
+            "class_fees": {class_id: fees[class_id] for class_id in classes[event_type]},
+            "status": "completed",
+            "created_at": (event_day - timedelta(days=60)).isoformat()
+        })
+        for competitor in rng.sample(competitors, rng.randint(25, 60) + 3 * number):
+            class_id = rng.choice(classes[event_type])
+            registration_id = f"reg_{len(rows['registrations']) + 1:05d}"
+            created_at = event_day - timedelta(days=rng.randint(1, 45), minutes=rng.randint(0, 1439))
+            paid = rng.random() < 0.85
+            rows["registrations"].append({
+                "id": registration_id,
+                "event_id": event_id,
+                "class_id": class_id,
+                "user_id": competitor,
+                "competitor_name": f"Competitor {competitor[5:]}",
+                "status": "confirmed" if paid else rng.choice(["pending_payment", "cancelled"]),
+                "created_at": created_at.isoformat()
+            })
+            if paid:
+                rows["payments"].append({
+                    "id": f"pay_{len(rows['payments']) + 1:05d}",
+                    "registration_id": registration_id,
+                    "amount": fees[class_id],
+                    "payment_method": rng.choice(["stripe", "stripe", "paypal"]),
+                    "status": "succeeded",
+                    "created_at": (created_at + timedelta(minutes=rng.randint(1, 90))).isoformat()
+                })
+                if rng.random() < 0.9:
+                    rows["event_check_ins"].append({
+                        "id": f"chk_{len(rows['event_check_ins']) + 1:05d}",
+                        "registration_id": registration_id,
+                        "event_id": event_id,
+                        "checked_in_at": (event_day + timedelta(hours=8, minutes=rng.randint(0, 240))).isoformat()
+                    })
+
+    today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    for event_id, name, event_type, days_ahead, (city, state) in (
+        ("evt_101", "Bass Championship", "SPL", 45, ("Miami", "FL")),
+        ("evt_102", "SQ Masters", "SQ", 80, ("Atlanta", "GA")),
+    ):
+        rows["events"].append({
+            "id": event_id,
+            "name": name,
+            "event_type": event_type,
+            "start_date": (today + timedelta(days=days_ahead)).date().isoformat(),
+            "location": f"{city}, {state}",
+            "city": city,
+            "state": state,
+            "max_competitors": 100,
+            "class_fees": {class_id: fees[class_id] for class_id in classes[event_type]},
+            "status": "published",
+            "created_at": (today - timedelta(days=30)).isoformat()
+        })
+    return rows
+
+# Create a singleton instance
+memory_store = MemoryStore(
+    snapshot_path=os.getenv("MEMORY_STORE_SNAPSHOT") or None,
+    snapshot_interval=float(os.getenv("MEMORY_STORE_SNAPSHOT_SECONDS", "60"))
+)
@@ -0,0 +1,284 @@
+"""
+Payment Reconciliation for MCP Server
+Streams registrations and succeeded payments page by page and hash-joins them to find mismatches
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Tuple, Callable, Awaitable
+
+import numpy as np
+
+from services.capacity import CONFIRMED_STATUSES
+
+logger = logging.getLogger(__name__)
+
+RECONCILIATION_DIR = os.getenv(
+    "RECONCILIATION_DIR",
+    str(Path(__file__).resolve().parent.parent / "data" / "reconciliation")
+)
+
+# Registration states, stored as one byte per registration
+CONFIRMED, PENDING, OTHER = 1, 2, 3
+
+FINDINGS = ("orphan_payments", "unpaid_confirmed", "amount_drift", "duplicate_payments", "state_mismatch")
+
+# Amounts within a cent are equal
+TOLERANCE = 0.005
+
+def hash_ids(ids: List[Any]) -> np.ndarray:
+    """64-bit keys for registration IDs; a collision needs ~4 billion registrations to become likely"""
+    digests = b"".join(hashlib.blake2b(str(value).encode(), digest_size=8).digest() for value in ids)
+    return np.frombuffer(digests, dtype=np.uint64)
+
+def status_code(status: Optional[str]) -> int:
+    if status in CONFIRMED_STATUSES:
+        return CONFIRMED
+    if status == "pending_payment":
+        return PENDING
+    return OTHER
+
+def event_prices(event: Dict[str, Any]) -> Tuple[Dict[str, float], Tuple[float, ...]]:
+    """Per-class fees and flat prices an event accepts"""
+    class_fees = event.get("class_fees") or {}
+    if isinstance(class_fees, str):
+        class_fees = json.loads(class_fees)
+    flat = tuple(float(event[key]) for key in ("regular_price", "early_bird_price") if event.get(key) is not None)
+    return {str(k): float(v) for k, v in class_fees.items()}, flat
+
+class RegistrationIndex:
+    """
+    Registrations as parallel arrays sorted by hashed ID: 8-byte key, 1-byte
+    state and two float32 acceptable amounts (NaN when unpriced). About 17
+    bytes a registration, so a full season fits in a few megabytes.
+    """
+
+    def __init__(self, keys: np.ndarray, states: np.ndarray, expected: np.ndarray, alternate: np.ndarray):
+        order = np.argsort(keys, kind="stable")
+        self.keys = keys[order]
+        self.states = states[order]
+        self.expected = expected[order]
+        self.alternate = alternate[order]
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def lookup(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions of keys in the index, and which of them were found"""
+        positions = np.searchsorted(self.keys, keys)
+        clipped = np.minimum(positions, max(len(self.keys) - 1, 0))
+        found = (positions < len(self.keys)) & (self.keys[clipped] == keys) if len(self.keys) else np.zeros(len(keys), bool)
+        return clipped, found
+
+class PaymentReconciler:
+    """
+    Checks that every succeeded payment belongs to a confirmed registration
+    and covers its fee exactly once, and that every confirmed registration
+    was paid for.
+
+    Registrations are streamed into a compact RegistrationIndex on every run.
+    Succeeded payments are streamed once: paid counts and totals per
+    registration are kept in a state file with a created_at watermark, so an
+    incremental run only reads payments recorded since the last one and
+    reports payment findings only for the registrations they touched.
+    """
+
+    def __init__(self, state_dir: str = RECONCILIATION_DIR, page_size: int = 1000, max_findings: int = 100):
+        self.state_dir = Path(state_dir)
+        self.page_size = page_size
+        self.max_findings = max_findings
+        # Set by the app: async (table, columns, after, page_size, order, filters) -> the rows after row after
+        self.page_loader: Optional[Callable[..., Awaitable[List[Dict[str, Any]]]]] = None
+
+    async def _pages(self, table: str, columns: str, order: str = "id", filters: Optional[List[Tuple[str, str, Any]]] = None):
+        after = None
+        while True:
+            rows = await self.page_loader(table, columns, after, self.page_size, order, filters)
+            if rows:
+                yield rows
+            if len(rows) < self.page_size:
+                return
+            after = rows[-1]
+
+    # =====================
+    # State
+    # =====================
+
+    def _load_state(self) -> Dict[str, Any]:
+        meta_path = self.state_dir / "state.json"
+        if not meta_path.exists():
+            return {"watermark": None, "watermark_ids": [], "keys": np.zeros(0, np.uint64), "counts": np.zeros(0, np.int32), "totals": np.zeros(0)}
+        meta = json.loads(meta_path.read_text())
+        with np.load(self.state_dir / "paid.npz") as paid:
+            return {**meta, "keys": paid["keys"], "counts": paid["counts"], "totals": paid["totals"]}
+
+    def _save_state(self, watermark: Optional[str], watermark_ids: List[str], keys: np.ndarray, counts: np.ndarray, totals: np.ndarray) -> None:
+        self.state_dir.mkdir(parents=True, exist_ok=True)
+        # Arrays first: a crash between the two writes re-reads payments instead of skipping them
+        tmp = self.state_dir / "paid.tmp.npz"
+        np.savez(tmp, keys=keys, counts=counts, totals=totals)
+        os.replace(tmp, self.state_dir / "paid.npz")
+        meta_tmp = self.state_dir / "state.json.tmp"
+        meta_tmp.write_text(json.dumps({"watermark": watermark, "watermark_ids": watermark_ids}))
+        os.replace(meta_tmp, self.state_dir / "state.json")
+
+    def latest_report(self) -> Optional[Dict[str, Any]]:
+        path = self.state_dir / "latest_report.json"
+        return json.loads(path.read_text()) if path.exists() else None
+
+    # =====================
+    # Reconciliation
+    # =====================
+
+    async def _build_index(self) -> RegistrationIndex:
+        prices: Dict[str, Tuple[Dict[str, float], Tuple[float, ...]]] = {}
+        async for events in self._pages("events", "*"):
+            for event in events:
+                prices[str(event["id"])] = event_prices(event)
+
+        keys, states, expected, alternate = [], [], [], []
+        async for registrations in self._pages("registrations", "id,event_id,class_id,status"):
+            keys.append(hash_ids([r["id"] for r in registrations]))
+            states.append(np.fromiter((status_code(r.get("status")) for r in registrations), np.uint8, len(registrations)))
+            page_expected = np.full(len(registrations), np.nan, np.float32)
+            page_alternate = np.full(len(registrations), np.nan, np.float32)
+            for row, registration in enumerate(registrations):
+                class_fees, flat = prices.get(str(registration.get("event_id")), ({}, ()))
+                fee = class_fees.get(str(registration.get("class_id")))
+                accepted = (fee,) if fee is not None else flat
+                if accepted:
+                    page_expected[row] = accepted[0]
+                    page_alternate[row] = accepted[-1]
+            expected.append(page_expected)
+            alternate.append(page_alternate)
+
+        if not keys:
+            empty = np.zeros(0, np.float32)
+            return RegistrationIndex(np.zeros(0, np.uint64), np.zeros(0, np.uint8), empty, empty)
+        return RegistrationIndex(np.concatenate(keys), np.concatenate(states), np.concatenate(expected), np.concatenate(alternate))
+
+    async def _resolve(self, wanted: Dict[int, List[Dict[str, Any]]]) -> None:
+        """Fill registration_id and event_id into findings known only by key; stops once all are found"""
+        remaining = set(wanted)
+        if not remaining:
+            return
+        async for registrations in self._pages("registrations", "id,event_id,status"):
+            for key, registration in zip(hash_ids([r["id"] for r in registrations]).tolist(), registrations):
+                if key in remaining:
+                    for finding in wanted[key]:
+                        finding.update({
+                            "registration_id": registration["id"],
+                            "event_id": registration.get("event_id"),
+                            "status": registration.get("status")
+                        })
+                    remaining.discard(key)
+            if not remaining:
+                return
+
+    async def run(self, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Reconcile; payload {"full": true} ignores the watermark and rechecks every payment"""
+        if self.page_loader is None:
+            raise RuntimeError("Payment reconciler has no page loader")
+        full = bool((payload or {}).get("full"))
+        started = time.perf_counter()
+        state = {"watermark": None, "watermark_ids": []} if full else self._load_state()
+        index = await self._build_index()
+        size = len(index)
+
+        # Carry paid counts and totals from earlier runs onto this run's index
+        counts = np.zeros(size, np.int32)
+        totals = np.zeros(size)
+        if not full and len(state["keys"]):
+            positions, found = index.lookup(state["keys"])
+            np.add.at(counts, positions[found], state["counts"][found])
+            np.add.at(totals, positions[found], state["totals"][found])
+        touched = np.zeros(size, bool)
+
+        report: Dict[str, Any] = {finding: [] for finding in FINDINGS}
+        totals_found = {finding: 0 for finding in FINDINGS}
+        watermark, watermark_ids = state["watermark"], set(state["watermark_ids"])
+        filters = [("eq", "status", "succeeded")]
+        if watermark:
+            filters.append(("gte", "created_at", watermark))
+        scanned_payments = 0
+
+        async for payments in self._pages("payments", "id,registration_id,amount,created_at", "created_at", filters):
+            if watermark_ids:
+                # Rows at exactly the watermark were seen by the last run
+                payments = [p for p in payments if not (p.get("created_at") == state["watermark"] and p["id"] in watermark_ids)]
+            if not payments:
+                continue
+            scanned_payments += len(payments)
+            keys = hash_ids([p.get("registration_id") for p in payments])
+            amounts = np.array([float(p.get("amount") or 0) for p in payments])
+            positions, found = index.lookup(keys)
+
+            orphans = np.flatnonzero(~found)
+            totals_found["orphan_payments"] += len(orphans)
+            for row in orphans[:self.max_findings - len(report["orphan_payments"])]:
+                payment = payments[row]
+                report["orphan_payments"].append({
+                    "payment_id": payment["id"],
+                    "registration_id": payment.get("registration_id"),
+                    "amount": payment.get("amount")
+                })
+
+            np.add.at(counts, positions[found], 1)
+            np.add.at(totals, positions[found], amounts[found])
+            touched[positions[found]] = True
+
+            last = payments[-1].get("created_at")
+            if last != watermark:
+                watermark, watermark_ids = last, set()
+            watermark_ids.update(p["id"] for p in payments if p.get("created_at") == watermark)
+
+        # Payment findings cover registrations with new payments; unpaid confirmed is a full check
+        paid = counts > 0
+        priced = ~np.isnan(index.expected)
+        matches_fee = (np.abs(totals - index.expected) <= TOLERANCE) | (np.abs(totals - index.alternate) <= TOLERANCE)
+        selections = {
+            "unpaid_confirmed": (index.states == CONFIRMED) & ~paid,
+            "duplicate_payments": touched & (counts > 1),
+            "amount_drift": touched & (counts == 1) & priced & ~matches_fee,
+            "state_mismatch": touched & paid & (index.states != CONFIRMED),
+        }
+        wanted: Dict[int, List[Dict[str, Any]]] = {}
+        for finding, selected in selections.items():
+            rows = np.flatnonzero(selected)
+            totals_found[finding] = len(rows)
+            for row in rows[:self.max_findings]:
+                entry = {"payments": int(counts[row]), "paid": round(float(totals[row]), 2)}
+                if finding == "amount_drift":
+                    entry["expected"] = round(float(index.expected[row]), 2)
+                report[finding].append(entry)
+                wanted.setdefault(int(index.keys[row]), []).append(entry)
+        await self._resolve(wanted)
+
+        self._save_state(watermark, sorted(watermark_ids), index.keys[paid], counts[paid], totals[paid])
+        report = {
+            "mode": "full" if full or not state["watermark"] else "incremental",
+            "finished_at": datetime.now().isoformat(),
+            "duration_ms": round((time.perf_counter() - started) * 1000),
+            "watermark": {"from": state["watermark"], "to": watermark},
+            "scanned": {"registrations": size, "payments": scanned_payments},
+            "counts": totals_found,
+            "truncated": any(totals_found[f] > len(report[f]) for f in FINDINGS),
+            **report
+        }
+        (self.state_dir / "latest_report.json").write_text(json.dumps(report, default=str))
+        logger.info(
+            f"Reconciled {scanned_payments} payments against {size} registrations in {report['duration_ms']} ms: "
+            + ", ".join(f"{finding}={count}" for finding, count in totals_found.items())
+        )
+        return report
+
+# Create a singleton instance
+payment_reconciler = PaymentReconciler(
+    page_size=int(os.getenv("RECONCILIATION_PAGE_SIZE", "1000")),
+    max_findings=int(os.getenv("RECONCILIATION_MAX_FINDINGS", "100"))
+)
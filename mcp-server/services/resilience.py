@@ -0,0 +1,344 @@
+"""
+Resilience Service for MCP Server
+Deadline-budgeted retries, hedged requests and a circuit breaker with stale fallback for database reads
+"""
+
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from contextvars import ContextVar
+from typing import Optional, Dict, Any, Tuple, Callable, Hashable
+
+import httpx
+from postgrest.exceptions import APIError
+
+from services.admission import STREAMING_SUFFIXES
+
+logger = logging.getLogger(__name__)
+
+# Monotonic time by which the current request must be answered
+request_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+# PostgREST/Postgres error codes worth retrying: HTTP-level failures, statement
+# timeouts, serialization failures, deadlocks and connection pool errors
+RETRYABLE_CODES = {
+    "429", "500", "502", "503", "504",
+    "57014", "40001", "40P01",
+    "PGRST000", "PGRST001", "PGRST002", "PGRST003",
+}
+
+class BackendUnavailable(Exception):
+    """Reads are failing fast because the circuit is open and nothing stale is cached"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether a failed read may succeed if tried again"""
+    if isinstance(error, (httpx.TransportError, asyncio.TimeoutError, TimeoutError, ConnectionError)):
+        return True
+    if isinstance(error, APIError):
+        return str(error.code) in RETRYABLE_CODES
+    return False
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive retryable failures. While open,
+    calls are refused; after reset_timeout one probe is let through
+    (half-open), and its outcome closes or re-opens the circuit. A probe
+    that ends without an outcome (cancelled, or out of budget) is abandoned
+    so the next call can probe instead.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probing = False
+
+    def allow(self) -> bool:
+        if self.state == "closed":
+            return True
+        if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+            self.state = "half_open"
+        if self.state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def abandon_probe(self) -> None:
+        if self.state == "half_open":
+            self._probing = False
+
+    def record_success(self) -> None:
+        self.failures = 0
+        self._probing = False
+        if self.state != "closed":
+            logger.info("Database circuit closed")
+        self.state = "closed"
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        self._probing = False
+        if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+            if self.state == "closed":
+                logger.warning(f"Database circuit opened after {self.failures} consecutive failures")
+            self.state = "open"
+            self.opened_at = time.monotonic()
+            self.times_opened += 1
+
+    def retry_after(self) -> int:
+        if self.state != "open":
+            return 1
+        return max(1, int(self.reset_timeout - (time.monotonic() - self.opened_at)) + 1)
+
+class ReadMetrics:
+    """Counters and a window of recent successful latencies for one read operation"""
+
+    def __init__(self, window: int = 512):
+        self.calls = 0
+        self.successes = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.stale_served = 0
+        self.latencies: deque = deque(maxlen=window)
+
+    def percentile(self, fraction: float) -> float:
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "successes": self.successes,
+            "failures": self.failures,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "timeouts": self.timeouts,
+            "rejected": self.rejected,
+            "stale_served": self.stale_served,
+            "latency_ms": {
+                "p50": round(self.percentile(0.5) * 1000, 2),
+                "p95": round(self.percentile(0.95) * 1000, 2),
+                "p99": round(self.percentile(0.99) * 1000, 2)
+            }
+        }
+
+class ResilientReader:
+    """
+    Runs blocking database reads in worker threads under the caller's
+    deadline. Each attempt is hedged: if it has not answered within the
+    operation's observed p95 latency, a second copy is sent and the first
+    success wins. Retryable failures are retried with full-jitter backoff
+    while budget remains. A circuit breaker shared by all reads refuses
+    calls while the database is unhealthy, answering from the last good
+    result of the same read when one is recent enough.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_delay: float = 0.05,
+        max_delay: float = 1.0,
+        default_budget: float = 8.0,
+        hedge_percentile: float = 0.95,
+        min_hedge_samples: int = 20,
+        failure_threshold: int = 5,
+        reset_timeout: float = 10.0,
+        stale_ttl: float = 300.0,
+        max_stale_entries: int = 1024,
+        offload: bool = True
+    ):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.default_budget = default_budget
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_samples = min_hedge_samples
+        self.stale_ttl = stale_ttl
+        self.max_stale_entries = max_stale_entries
+        # Off for the in-memory store, whose calls are instant and not thread-safe
+        self.offload = offload
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.metrics: Dict[str, ReadMetrics] = {}
+        self._stale: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+
+    def remaining(self) -> float:
+        """Seconds left in the current request's budget"""
+        deadline = request_deadline.get()
+        if deadline is None:
+            return self.default_budget
+        return deadline - time.monotonic()
+
+    def _hedge_delay(self, metrics: ReadMetrics) -> Optional[float]:
+        if len(metrics.latencies) < self.min_hedge_samples:
+            return None
+        return metrics.percentile(self.hedge_percentile)
+
+    async def _attempt(self, fn: Callable[[], Any], metrics: ReadMetrics, timeout: float) -> Any:
+        """One attempt, hedged once after the p95 delay; raises asyncio.TimeoutError past timeout"""
+        if not self.offload:
+            return fn()
+
+        started = time.monotonic()
+        hedge_delay = self._hedge_delay(metrics)
+        tasks = [asyncio.ensure_future(asyncio.to_thread(fn))]
+        hedged = False
+        error: Optional[BaseException] = None
+        try:
+            while tasks:
+                elapsed = time.monotonic() - started
+                wait = timeout - elapsed
+                if not hedged and hedge_delay is not None:
+                    wait = min(wait, hedge_delay - elapsed)
+                done, _ = await asyncio.wait(tasks, timeout=max(wait, 0), return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    tasks.remove(task)
+                    if task.exception() is None:
+                        if hedged and task is not first:
+                            metrics.hedge_wins += 1
+                        return task.result()
+                    error = task.exception()
+
+                elapsed = time.monotonic() - started
+                if elapsed >= timeout:
+                    raise asyncio.TimeoutError()
+                if not hedged and hedge_delay is not None and elapsed >= hedge_delay and tasks:
+                    # The first copy is slow; race a second one against it
+                    hedged = True
+                    first = tasks[0]
+                    metrics.hedges += 1
+                    tasks.append(asyncio.ensure_future(asyncio.to_thread(fn)))
+            raise error
+        finally:
+            # Threads cannot be interrupted; their results are discarded
+            for task in tasks:
+                task.cancel()
+
+    def _fallback(self, operation: str, key: Optional[Hashable], metrics: ReadMetrics, error: BaseException) -> Any:
+        """The last good result for this read if recent enough, otherwise re-raise"""
+        entry = self._stale.get(key) if key is not None else None
+        if entry is not None and time.monotonic() - entry[0] <= self.stale_ttl:
+            metrics.stale_served += 1
+            logger.warning(f"Serving stale {operation} result ({time.monotonic() - entry[0]:.0f}s old): {str(error)}")
+            return entry[1]
+        raise error
+
+    async def read(self, operation: str, fn: Callable[[], Any], key: Optional[Hashable] = None) -> Any:
+        """
+        Run a read. key identifies the read for stale fallback; pass None for
+        reads that should never be answered from stale data.
+        """
+        metrics = self.metrics.get(operation)
+        if metrics is None:
+            metrics = self.metrics[operation] = ReadMetrics()
+        metrics.calls += 1
+
+        if not self.breaker.allow():
+            metrics.rejected += 1
+            return self._fallback(operation, key, metrics, BackendUnavailable(
+                "Database temporarily unavailable", self.breaker.retry_after()
+            ))
+        # True while this call holds the half-open probe without having recorded its outcome
+        probing = self.breaker.state == "half_open"
+
+        error: BaseException = asyncio.TimeoutError()
+        try:
+            for attempt in range(1, self.max_attempts + 1):
+                budget = self.remaining()
+                if budget <= 0:
+                    metrics.timeouts += 1
+                    break
+                started = time.monotonic()
+                try:
+                    result = await self._attempt(fn, metrics, budget)
+                except Exception as e:
+                    error = e
+                    if isinstance(e, asyncio.TimeoutError):
+                        metrics.timeouts += 1
+                    probing = False
+                    if not is_retryable(e):
+                        # The database answered; the request itself was bad
+                        self.breaker.record_success()
+                        metrics.failures += 1
+                        raise
+                    self.breaker.record_failure()
+                    if attempt == self.max_attempts:
+                        break
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+                    if delay >= self.remaining() or not self.breaker.allow():
+                        break
+                    probing = self.breaker.state == "half_open"
+                    metrics.retries += 1
+                    await asyncio.sleep(delay)
+                    continue
+
+                probing = False
+                metrics.successes += 1
+                metrics.latencies.append(time.monotonic() - started)
+                self.breaker.record_success()
+                if key is not None:
+                    self._stale[key] = (time.monotonic(), result)
+                    self._stale.move_to_end(key)
+                    if len(self._stale) > self.max_stale_entries:
+                        self._stale.popitem(last=False)
+                return result
+        finally:
+            # Reached with probing still set on cancellation (a BaseException) or when the
+            # budget ran out before an attempt; free the probe so the circuit can recover
+            if probing:
+                self.breaker.abandon_probe()
+
+        metrics.failures += 1
+        return self._fallback(operation, key, metrics, error)
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "circuit": {
+                "state": self.breaker.state,
+                "consecutive_failures": self.breaker.failures,
+                "times_opened": self.breaker.times_opened
+            },
+            "stale_entries": len(self._stale),
+            "operations": {name: metrics.snapshot() for name, metrics in sorted(self.metrics.items())}
+        }
+
+class DeadlineMiddleware:
+    """ASGI middleware giving each HTTP request a deadline that database reads budget against"""
+
+    def __init__(self, app, seconds: float):
+        self.app = app
+        self.seconds = seconds
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path", "").endswith(STREAMING_SUFFIXES):
+            await self.app(scope, receive, send)
+            return
+        token = request_deadline.set(time.monotonic() + self.seconds)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            request_deadline.reset(token)
+
+# Create a singleton instance
+database_reader = ResilientReader(
+    max_attempts=int(os.getenv("DB_READ_MAX_ATTEMPTS", "3")),
+    default_budget=float(os.getenv("REQUEST_DEADLINE_SECONDS", "8")),
+    failure_threshold=int(os.getenv("DB_CIRCUIT_FAILURE_THRESHOLD", "5")),
+    reset_timeout=float(os.getenv("DB_CIRCUIT_RESET_SECONDS", "10")),
+    stale_ttl=float(os.getenv("DB_STALE_SECONDS", "300"))
+)
@@ -5,11 +5,19 @@ Handles all database interactions with Supabase
 
 import os
 import logging
-from typing import Optional, List, Dict, Any
-from datetime import datetime
+from typing import Optional, List, Dict, Any, Tuple
 from supabase import create_client, Client
 from dotenv import load_dotenv
 
+from services.capacity import CONFIRMED_STATUSES
+from services.event_geo import event_geo_index, geocoder
+from services.event_search import event_search_index
+from services.invalidation import GenerationCache, invalidation_bus
+from services.leaderboard import result_to_record, record_to_result
+from services.live_feed import event_feed_hub
+from services.memory_store import memory_store
+from services.resilience import database_reader, request_deadline
+
 load_dotenv()
 
 logger = logging.getLogger(__name__)
@@ -23,11 +31,32 @@ class SupabaseService:
         supabase_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")  # Use service role for server
         
         if not supabase_url or not supabase_key:
-            logger.warning("Supabase credentials not found. Running in mock mode.")
-            self.client = None
+            logger.warning("Supabase credentials not found. Using the in-memory store.")
+            memory_store.open(seed=os.getenv("MEMORY_STORE_SEED", "true").lower() == "true")
+            self.client = memory_store
+            # In-process reads cannot time out and the store is not thread-safe
+            database_reader.offload = False
         else:
             self.client: Client = create_client(supabase_url, supabase_key)
             logger.info("Supabase client initialized successfully")
+        
+        # Event listings are cached until any worker writes an event
+        self.events_cache = GenerationCache(
+            invalidation_bus.generations, "events", ttl=float(os.getenv("EVENT_CACHE_SECONDS", "30"))
+        )
+        # Writes made by other workers update this worker's indexes and feeds the same way
+        invalidation_bus.subscribe("events", self._event_written)
+        invalidation_bus.subscribe("registrations", self._registration_written)
+        invalidation_bus.subscribe("payments", self._payment_written)
+        invalidation_bus.subscribe("check_ins", self._check_in_written)
+    
+    async def _read(self, operation: str, query, cache_key=None):
+        """
+        Execute a read query with retries, hedging and the circuit breaker.
+        cache_key names the read for stale fallback while the database is down;
+        leave it None where a stale answer could cause a wrong write.
+        """
+        return await database_reader.read(operation, query.execute, cache_key)
     
     # =====================
     # Event Operations
@@ -35,48 +64,64 @@ class SupabaseService:
     
     async def create_event(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new event in the database"""
-        if not self.client:
-            return self._mock_event_response(event_data)
-        
+        # Geocode once at write time so proximity queries never have to
+        event_data = geocoder.with_coordinates(event_data)
         try:
             response = self.client.table('events').insert(event_data).execute()
-            return response.data[0] if response.data else None
+            event = response.data[0] if response.data else None
         except Exception as e:
             logger.error(f"Error creating event: {str(e)}")
             raise
+        
+        if event:
+            self._event_written("created", event)
+            invalidation_bus.publish("events", "created", event)
+        return event
+    
+    def _event_written(self, action: str, event: Optional[Dict[str, Any]]) -> None:
+        """Bring this worker's search and geo indexes up to date with a written event"""
+        if event:
+            event_search_index.upsert(event)
+            event_geo_index.upsert(event)
     
     async def get_events(
         self,
         status: Optional[str] = None,
         event_type: Optional[str] = None,
-        limit: int = 10
+        limit: int = 10,
+        offset: int = 0,
+        columns: str = '*'
     ) -> List[Dict[str, Any]]:
-        """Fetch events from database with filters"""
-        if not self.client:
-            return self._mock_events_list()
+        """Fetch events from database with filters, projected to columns"""
+        cache_key = (status, event_type, limit, offset, columns)
+        cached = self.events_cache.get(cache_key)
+        if cached is not None:
+            return list(cached)
         
         try:
-            query = self.client.table('events').select('*')
+            # Read the generation first so a write racing this query leaves the entry stale, not wrong
+            generation = invalidation_bus.generations.current("events")
+            query = self.client.table('events').select(columns)
             
             if status:
                 query = query.eq('status', status)
             if event_type:
                 query = query.eq('event_type', event_type)
             
-            query = query.limit(limit)
-            response = query.execute()
-            return response.data
+            query = query.range(offset, offset + limit - 1)
+            response = await self._read('get_events', query, ('events', *cache_key))
+            self.events_cache.put(cache_key, response.data, generation)
+            return list(response.data)
         except Exception as e:
             logger.error(f"Error fetching events: {str(e)}")
             raise
     
-    async def get_event_by_id(self, event_id: str) -> Optional[Dict[str, Any]]:
-        """Get a specific event by ID"""
-        if not self.client:
-            return self._mock_event_by_id(event_id)
-        
+    async def get_event_by_id(self, event_id: str, columns: str = '*') -> Optional[Dict[str, Any]]:
+        """Get a specific event by ID, projected to columns"""
         try:
-            response = self.client.table('events').select('*').eq('id', event_id).execute()
+            response = await self._read(
+                'get_event_by_id', self.client.table('events').select(columns).eq('id', event_id), ('event', event_id, columns)
+            )
             return response.data[0] if response.data else None
         except Exception as e:
             logger.error(f"Error fetching event {event_id}: {str(e)}")
@@ -88,28 +133,74 @@ class SupabaseService:
     
     async def create_registration(self, registration_data: Dict[str, Any]) -> Dict[str, Any]:
         """Create a new registration"""
-        if not self.client:
-            return self._mock_registration_response(registration_data)
-        
         try:
             response = self.client.table('registrations').insert(registration_data).execute()
-            return response.data[0] if response.data else None
+            registration = response.data[0] if response.data else None
         except Exception as e:
             logger.error(f"Error creating registration: {str(e)}")
             raise
+        
+        if registration:
+            self._registration_written("created", registration)
+            invalidation_bus.publish("registrations", "created", registration)
+        return registration
+    
+    def _registration_written(self, action: str, registration: Optional[Dict[str, Any]]) -> None:
+        """Push a new registration to this worker's live feed viewers"""
+        if action == "created" and registration:
+            event_feed_hub.publish(registration.get("event_id"), "registration_created", {
+                "registration_id": registration.get("id"),
+                "competitor_name": registration.get("competitor_name"),
+                "class_id": registration.get("class_id")
+            })
+    
+    async def update_registration_status(self, registration_id: str, status: str) -> Optional[Dict[str, Any]]:
+        """Set a registration's status"""
+        try:
+            response = self.client.table('registrations').update({'status': status}).eq('id', registration_id).execute()
+            registration = response.data[0] if response.data else None
+        except Exception as e:
+            logger.error(f"Error updating registration status: {str(e)}")
+            raise
+        
+        if registration:
+            invalidation_bus.publish("registrations", "updated", registration)
+        return registration
+    
+    async def get_event_capacity(self, event_id: str) -> Dict[str, Any]:
+        """Get an event's competitor limits and the slots already confirmed"""
+        try:
+            event = await self._read('get_event_by_id', self.client.table('events').select('*').eq('id', event_id), ('event', event_id, '*'))
+            event = event.data[0] if event.data else {}
+            # Never stale: holds are decided from these counts
+            registrations = (await self._read('get_confirmed_registrations', self.client.table('registrations').select('class_id').eq(
+                'event_id', event_id
+            ).in_('status', list(CONFIRMED_STATUSES)))).data or []
+            
+            by_class: Dict[str, int] = {}
+            for registration in registrations:
+                if registration.get('class_id'):
+                    by_class[registration['class_id']] = by_class.get(registration['class_id'], 0) + 1
+            return {
+                "max_competitors": event.get('max_competitors') or event.get('max_participants'),
+                "class_limits": event.get('class_limits') or {},
+                "confirmed": len(registrations),
+                "confirmed_by_class": by_class
+            }
+        except Exception as e:
+            logger.error(f"Error fetching capacity for event {event_id}: {str(e)}")
+            raise
     
     async def get_registrations(
         self,
         event_id: Optional[str] = None,
         user_id: Optional[str] = None,
-        status: Optional[str] = None
+        status: Optional[str] = None,
+        columns: str = '*'
     ) -> List[Dict[str, Any]]:
-        """Fetch registrations with filters"""
-        if not self.client:
-            return self._mock_registrations_list()
-        
+        """Fetch registrations with filters, projected to columns"""
         try:
-            query = self.client.table('registrations').select('*')
+            query = self.client.table('registrations').select(columns)
             
             if event_id:
                 query = query.eq('event_id', event_id)
@@ -118,7 +209,7 @@ class SupabaseService:
             if status:
                 query = query.eq('status', status)
             
-            response = query.execute()
+            response = await self._read('get_registrations', query, ('registrations', event_id, user_id, status, columns))
             return response.data
         except Exception as e:
             logger.error(f"Error fetching registrations: {str(e)}")
@@ -135,9 +226,6 @@ class SupabaseService:
         end_date: Optional[str] = None
     ) -> Dict[str, Any]:
         """Get analytics data for events"""
-        if not self.client:
-            return self._mock_analytics_data()
-        
         try:
             # This would typically involve complex queries or calling stored procedures
             # For now, we'll do basic aggregations
@@ -170,7 +258,7 @@ class SupabaseService:
             if end_date:
                 query = query.lte('created_at', end_date)
             
-            response = query.execute()
+            response = await self._read('registration_stats', query, ('registration_stats', event_id, start_date, end_date))
             
             return {
                 "total": response.count if hasattr(response, 'count') else len(response.data),
@@ -191,15 +279,19 @@ class SupabaseService:
             query = self.client.table('payments').select('amount, status, payment_method')
             
             if event_id:
-                # Join with registrations to filter by event
-                query = query.eq('registration.event_id', event_id)
+                # payments has no event_id; filter on the event's registration IDs
+                registrations = await self._read(
+                    'revenue_stats', self.client.table('registrations').select('id').eq('event_id', event_id),
+                    ('event_registration_ids', event_id)
+                )
+                query = query.in_('registration_id', [r['id'] for r in registrations.data or []])
             if start_date:
                 query = query.gte('created_at', start_date)
             if end_date:
                 query = query.lte('created_at', end_date)
             
             query = query.eq('status', 'succeeded')
-            response = query.execute()
+            response = await self._read('revenue_stats', query, ('revenue_stats', event_id, start_date, end_date))
             
             total_revenue = sum(p['amount'] for p in response.data) if response.data else 0
             
@@ -229,7 +321,7 @@ class SupabaseService:
             if end_date:
                 query = query.lte('checked_in_at', end_date)
             
-            response = query.execute()
+            response = await self._read('attendance_stats', query, ('attendance_stats', event_id, start_date, end_date))
             
             return {
                 "total_checked_in": response.count if hasattr(response, 'count') else len(response.data),
@@ -239,128 +331,279 @@ class SupabaseService:
             logger.error(f"Error getting attendance stats: {str(e)}")
             return {"total_checked_in": 0, "data": []}
     
+    async def get_analytics_rows(
+        self,
+        table: str,
+        columns: str = '*',
+        page_size: int = 1000
+    ) -> List[Dict[str, Any]]:
+        """Read a whole table for the analytics engine, one page at a time"""
+        # A full load outlives any one request, so each page gets the default budget
+        deadline = request_deadline.set(None)
+        try:
+            rows: List[Dict[str, Any]] = []
+            offset = 0
+            while True:
+                # Not stale-cached: the engine keeps its last load if a refresh fails
+                response = await self._read(
+                    'analytics_rows', self.client.table(table).select(columns).order('id').range(offset, offset + page_size - 1)
+                )
+                rows.extend(response.data)
+                if len(response.data) < page_size:
+                    return rows
+                offset += page_size
+        except Exception as e:
+            logger.error(f"Error reading {table} for analytics: {str(e)}")
+            raise
+        finally:
+            request_deadline.reset(deadline)
+    
+    async def get_page(
+        self,
+        table: str,
+        columns: str = '*',
+        after: Optional[Dict[str, Any]] = None,
+        page_size: int = 1000,
+        order: str = 'id',
+        filters: Optional[List[Tuple[str, str, Any]]] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Read the page of a table that follows the row after, for jobs that
+        stream whole tables. Rows are ordered by order then id, which is
+        unique, and paged by key rather than offset, so rows sharing an order
+        value are neither skipped nor read twice. columns must include the
+        order column and id.
+        """
+        order_columns = [order] if order == 'id' else [order, 'id']
+
+        async def fetch(conditions: List[Tuple[str, str, Any]], limit: int) -> List[Dict[str, Any]]:
+            query = self.client.table(table).select(columns)
+            for operator, column, value in [*(filters or []), *conditions]:
+                query = getattr(query, operator)(column, value)
+            for column in order_columns:
+                query = query.order(column)
+            response = await self._read('get_page', query.limit(limit))
+            return response.data or []
+
+        try:
+            if after is None:
+                return await fetch([], page_size)
+            if order == 'id':
+                return await fetch([('gt', 'id', after['id'])], page_size)
+            # (order, id) > (last order, last id): the rest of the last row's tie, then later values
+            rows = await fetch([('eq', order, after[order]), ('gt', 'id', after['id'])], page_size)
+            if len(rows) < page_size:
+                rows += await fetch([('gt', order, after[order])], page_size - len(rows))
+            return rows
+        except Exception as e:
+            logger.error(f"Error reading page of {table} after {after.get('id') if after else None}: {str(e)}")
+            raise
+    
     # =====================
     # Payment Operations
     # =====================
     
     async def create_payment_record(self, payment_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Create a payment record"""
-        if not self.client:
-            return self._mock_payment_response(payment_data)
-        
+        """
+        Create a payment record. A metadata idempotency_key makes retries safe:
+        if a payment with that key exists it is returned instead of inserting another.
+        """
+        idempotency_key = (payment_data.get('metadata') or {}).get('idempotency_key')
         try:
+            if idempotency_key:
+                existing = await self._read(
+                    'create_payment_record',
+                    self.client.table('payments').select('*').eq('metadata->>idempotency_key', idempotency_key)
+                )
+                if existing.data:
+                    return existing.data[0]
             response = self.client.table('payments').insert(payment_data).execute()
-            return response.data[0] if response.data else None
+            payment = response.data[0] if response.data else None
         except Exception as e:
             logger.error(f"Error creating payment record: {str(e)}")
             raise
+        
+        if payment:
+            await self._payment_written("created", payment)
+            invalidation_bus.publish("payments", "created", payment)
+        return payment
+    
+    async def _payment_written(self, action: str, payment: Optional[Dict[str, Any]]) -> None:
+        """Push a succeeded payment to this worker's live feed viewers"""
+        if action == "created" and payment and payment.get("status") == "succeeded" and event_feed_hub.has_viewers():
+            event_id = await self.get_registration_event_id(payment.get("registration_id"))
+            event_feed_hub.publish(event_id, "payment_succeeded", {
+                "payment_id": payment.get("id"),
+                "registration_id": payment.get("registration_id"),
+                "amount": payment.get("amount")
+            })
+    
+    async def get_registration_event_id(self, registration_id: Optional[str]) -> Optional[str]:
+        """Resolve the event of a registration, preferring the live feed's cache"""
+        if not registration_id:
+            return None
+        event_id = event_feed_hub.event_for_registration(registration_id)
+        if event_id:
+            return event_id
+        
+        try:
+            response = await self._read(
+                'get_registration_event_id',
+                self.client.table('registrations').select('event_id').eq('id', registration_id),
+                ('registration_event', registration_id)
+            )
+            return response.data[0]['event_id'] if response.data else None
+        except Exception as e:
+            logger.error(f"Error resolving event for registration {registration_id}: {str(e)}")
+            return None
+    
+    # =====================
+    # Check-in Operations
+    # =====================
+    
+    async def create_check_in(self, check_in_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Record a competitor check-in"""
+        try:
+            response = self.client.table('event_check_ins').insert(check_in_data).execute()
+            check_in = response.data[0] if response.data else None
+        except Exception as e:
+            logger.error(f"Error creating check-in: {str(e)}")
+            raise
+        
+        if check_in:
+            self.on_check_in_recorded(check_in)
+            invalidation_bus.publish("check_ins", "created", check_in)
+        return check_in
+    
+    async def sync_check_ins(self, check_ins: List[Dict[str, Any]]) -> int:
+        """
+        Insert check-ins recorded at the gate, skipping any already stored and
+        repeat check-ins of the same registration; returns how many were inserted
+        """
+        registration_ids = list({check_in['registration_id'] for check_in in check_ins})
+        try:
+            existing = await self._read(
+                'sync_check_ins',
+                self.client.table('event_check_ins').select('id,event_id,registration_id').in_('registration_id', registration_ids)
+            )
+            stored_ids = {row['id'] for row in existing.data or []}
+            checked_in = {(row['event_id'], row['registration_id']) for row in existing.data or []}
+
+            rows = []
+            for check_in in check_ins:
+                key = (check_in['event_id'], check_in['registration_id'])
+                if check_in['id'] in stored_ids or key in checked_in:
+                    continue
+                checked_in.add(key)
+                rows.append(check_in)
+            if rows:
+                self.client.table('event_check_ins').insert(rows).execute()
+        except Exception as e:
+            logger.error(f"Error syncing check-ins: {str(e)}")
+            raise
+
+        if rows:
+            # Workers already heard about each check-in at the gate; this only moves analytics on
+            invalidation_bus.publish("check_ins", "synced")
+        return len(rows)
+
+    def on_check_in_recorded(self, check_in: Dict[str, Any]) -> None:
+        """Push a check-in recorded by this worker to its live feed viewers"""
+        event_feed_hub.publish(check_in.get("event_id"), "checked_in", {
+            "registration_id": check_in.get("registration_id"),
+            "checked_in_at": check_in.get("checked_in_at")
+        })
+
+    def _check_in_written(self, action: str, check_in: Optional[Dict[str, Any]]) -> None:
+        """Push a check-in recorded by another worker to this worker's live feed viewers"""
+        if action == "created" and check_in:
+            self.on_check_in_recorded(check_in)
+    
+    async def get_event_live_totals(self, event_id: str) -> Dict[str, Any]:
+        """Get the running totals a live event feed starts from"""
+        try:
+            registrations = await self._read(
+                'live_totals', self.client.table('registrations').select('id', count='exact').eq('event_id', event_id),
+                ('live_registrations', event_id)
+            )
+            registration_ids = [r['id'] for r in registrations.data or []]
+            payments = []
+            if registration_ids:
+                payments = (await self._read('live_totals', self.client.table('payments').select('amount').in_(
+                    'registration_id', registration_ids
+                ).eq('status', 'succeeded'), ('live_payments', event_id))).data or []
+            check_ins = await self._read(
+                'live_totals', self.client.table('event_check_ins').select('id', count='exact').eq('event_id', event_id),
+                ('live_check_ins', event_id)
+            )
+            
+            return {
+                "registrations": registrations.count if registrations.count is not None else len(registration_ids),
+                "paid": len(payments),
+                "revenue": round(sum(float(p['amount']) for p in payments), 2),
+                "checked_in": check_ins.count if check_ins.count is not None else len(check_ins.data or [])
+            }
+        except Exception as e:
+            logger.error(f"Error fetching live totals for event {event_id}: {str(e)}")
+            raise
     
     # =====================
-    # Support Operations
+    # Results Operations
     # =====================
     
-    async def create_support_ticket(self, ticket_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Create a support ticket"""
-        if not self.client:
-            return self._mock_ticket_response(ticket_data)
+    async def create_competition_result(self, result_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Store a competitor's score for an event class"""
+        try:
+            response = self.client.table('competition_results').insert(result_to_record(result_data)).execute()
+            record = response.data[0] if response.data else None
+        except Exception as e:
+            logger.error(f"Error creating competition result: {str(e)}")
+            raise
         
+        # Other workers apply the submission itself to their leaderboards
+        invalidation_bus.publish("results", "created", result_data)
+        return record
+    
+    async def get_competition_results(self, event_id: str) -> List[Dict[str, Any]]:
+        """Get every stored score for an event, oldest first"""
         try:
-            response = self.client.table('support_tickets').insert(ticket_data).execute()
-            return response.data[0] if response.data else None
+            response = await self._read('get_competition_results', self.client.table('competition_results').select('*').eq(
+                'event_id', event_id
+            ).order('created_at'), ('competition_results', event_id))
+            return [record_to_result(record) for record in response.data or []]
         except Exception as e:
-            logger.error(f"Error creating support ticket: {str(e)}")
+            logger.error(f"Error fetching competition results: {str(e)}")
+            raise
+    
+    async def get_results_event_ids(self) -> List[str]:
+        """Get the IDs of every event with stored scores"""
+        try:
+            response = await self._read(
+                'get_results_event_ids',
+                self.client.table('competition_results').select('event_id'),
+                ('competition_results_events',)
+            )
+            return sorted({str(record['event_id']) for record in response.data or []})
+        except Exception as e:
+            logger.error(f"Error fetching events with results: {str(e)}")
             raise
     
     # =====================
-    # Mock Responses
+    # Support Operations
     # =====================
     
-    def _mock_event_response(self, event_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Return mock event response"""
-        return {
-            "id": f"evt_mock_{datetime.now().timestamp()}",
-            **event_data,
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        }
-    
-    def _mock_events_list(self) -> List[Dict[str, Any]]:
-        """Return mock events list"""
-        return [
-            {
-                "id": "evt_001",
-                "name": "Mock Bass Championship",
-                "event_type": "SPL",
-                "start_date": "2025-06-15",
-                "location": "Miami, FL",
-                "status": "published"
-            },
-            {
-                "id": "evt_002",
-                "name": "Mock SQ Masters",
-                "event_type": "SQ",
-                "start_date": "2025-07-20",
-                "location": "Atlanta, GA",
-                "status": "published"
-            }
-        ]
-    
-    def _mock_event_by_id(self, event_id: str) -> Dict[str, Any]:
-        """Return mock event by ID"""
-        return {
-            "id": event_id,
-            "name": "Mock Event",
-            "event_type": "SPL",
-            "start_date": "2025-06-15",
-            "location": "Mock City, ST",
-            "status": "published"
-        }
-    
-    def _mock_registration_response(self, registration_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Return mock registration response"""
-        return {
-            "id": f"reg_mock_{datetime.now().timestamp()}",
-            **registration_data,
-            "status": "pending_payment",
-            "created_at": datetime.now().isoformat()
-        }
-    
-    def _mock_registrations_list(self) -> List[Dict[str, Any]]:
-        """Return mock registrations list"""
-        return [
-            {
-                "id": "reg_001",
-                "event_id": "evt_001",
-                "competitor_name": "John Doe",
-                "status": "confirmed"
-            }
-        ]
-    
-    def _mock_analytics_data(self) -> Dict[str, Any]:
-        """Return mock analytics data"""
-        return {
-            "registrations": {"total": 156, "data": []},
-            "revenue": {"total": 15600.00, "transaction_count": 156, "data": []},
-            "attendance": {"total_checked_in": 145, "data": []}
-        }
-    
-    def _mock_payment_response(self, payment_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Return mock payment response"""
-        return {
-            "id": f"pay_mock_{datetime.now().timestamp()}",
-            **payment_data,
-            "status": "succeeded",
-            "processed_at": datetime.now().isoformat()
-        }
-    
-    def _mock_ticket_response(self, ticket_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Return mock ticket response"""
-        return {
-            "id": f"tkt_mock_{datetime.now().timestamp()}",
-            **ticket_data,
-            "status": "open",
-            "created_at": datetime.now().isoformat()
-        }
+    async def create_support_ticket(self, ticket_data: Dict[str, Any]) -> Dict[str, Any]:
+        """Create a support ticket"""
+        try:
+            response = self.client.table('support_tickets').insert(ticket_data).execute()
+            ticket = response.data[0] if response.data else None
+        except Exception as e:
+            logger.error(f"Error creating support ticket: {str(e)}")
+            raise
+        
+        if ticket:
+            invalidation_bus.publish("tickets", "created", ticket)
+        return ticket
 
 # Create a singleton instance
 supabase_service = SupabaseService()
\ No newline at end of file
@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+from services import analytics_engine as engine_module
+from services.analytics_engine import AnalyticsEngine, latest_growth
+
+@pytest.fixture
+def engine():
+    """Two registrations and a $25 payment every day of the first half of 2025, checked in on the same day"""
+    days = np.arange(np.datetime64("2025-01-01"), np.datetime64("2025-07-01"))
+    registrations, payments, check_ins = [], [], []
+    for i, day in enumerate(days):
+        for slot in range(2):
+            registration_id = f"reg_{i}_{slot}"
+            created_at = f"{day}T{9 + slot * 6:02d}:30:00"
+            registrations.append({
+                "id": registration_id,
+                "event_id": "evt_a" if i % 2 else "evt_b",
+                "class_id": "spl",
+                "user_id": f"user_{i % 40}",
+                "status": "confirmed",
+                "created_at": created_at
+            })
+            check_ins.append({"registration_id": registration_id, "event_id": registrations[-1]["event_id"], "checked_in_at": created_at})
+        payments.append({
+            "registration_id": f"reg_{i}_0",
+            "amount": 25.0,
+            "payment_method": "card",
+            "status": "succeeded" if i % 10 else "failed",
+            "created_at": f"{day}T10:00:00"
+        })
+    engine = AnalyticsEngine()
+    engine.load({"events": [], "registrations": registrations, "payments": payments, "event_check_ins": check_ins})
+    return engine
+
+@pytest.mark.parametrize("granularity", ["day", "week", "month"])
+@pytest.mark.parametrize("event_id", [None, "evt_a"])
+@pytest.mark.parametrize("start_date,end_date", [
+    (None, None),
+    ("2025-03-15", "2025-04-10"),
+    ("2025-03-01", "2025-06-30"),
+    ("2025-02-03T12:00:00", "2025-02-03"),
+])
+def test_trend_adds_up_to_totals(engine, granularity, event_id, start_date, end_date):
+    trends = engine.trends(granularity, event_id, start_date, end_date)
+    totals = engine.breakdown(event_id, start_date, end_date)
+    assert sum(bucket["count"] for bucket in trends["registrations"]) == totals["registrations"]["total"]
+    assert sum(bucket["total"] for bucket in trends["revenue"]) == pytest.approx(totals["revenue"]["total"])
+    assert sum(bucket["count"] for bucket in trends["check_ins"]) == totals["attendance"]["total_attendees"]
+
+def test_clipped_edge_buckets_are_partial(engine):
+    trend = engine.trends("month", None, "2025-03-15", "2025-05-10")["registrations"]
+    assert [bucket["period"] for bucket in trend] == ["2025-03", "2025-04", "2025-05"]
+    assert [bucket["partial"] for bucket in trend] == [True, False, True]
+    assert [bucket["count"] for bucket in trend] == [34, 60, 20]
+    # Same daily rate throughout, so prorated growth matches that of the whole months
+    whole = {bucket["period"]: bucket["growth"] for bucket in engine.trends("month")["registrations"]}
+    assert trend[0]["growth"] == whole["2025-03"]
+    assert trend[2]["growth"] == whole["2025-05"]
+    assert latest_growth(trend) == trend[1]["growth"]
+
+def test_week_cut_by_end_date_is_not_headline(engine):
+    trend = engine.trends("week", None, "2025-03-01", "2025-06-30")["registrations"]
+    assert trend[-1]["period"] == "2025-06-30"
+    assert trend[-1]["partial"] and trend[-1]["count"] == 2
+    assert latest_growth(trend) == trend[-2]["growth"]
+
+def test_bucket_in_progress_is_prorated(engine, monkeypatch):
+    monkeypatch.setattr(engine_module.time, "time", lambda: float(np.datetime64("2025-06-16T00:00:00").astype("datetime64[s]").astype(np.int64)))
+    trend = engine.trends("month")["registrations"]
+    # June holds 30 days of rows, but only half of it has elapsed
+    assert trend[-1]["partial"]
+    assert not trend[-2]["partial"]
+    assert latest_growth(trend) == trend[-2]["growth"]
+
+def test_empty_range(engine):
+    trends = engine.trends("month", None, "2024-01-01", "2024-06-30")
+    assert trends["registrations"] == []
+    assert latest_growth(trends["registrations"]) is None
@@ -0,0 +1,142 @@
+import asyncio
+
+import pytest
+
+from services.capacity import CapacityService
+
+def make_service(max_competitors=3, class_limits=None, hold_seconds=900.0, events=None):
+    """A service over one event, recording the registration statuses it writes"""
+    written = []
+    loads = []
+
+    async def loader(event_id):
+        loads.append(event_id)
+        return {"max_competitors": max_competitors, "class_limits": class_limits or {}, "confirmed": 0}
+
+    async def writer(registration_id, status):
+        written.append((registration_id, status))
+
+    async def resolver(registration_id):
+        return (events or {}).get(registration_id)
+
+    service = CapacityService(hold_seconds=hold_seconds, snapshot_loader=loader, status_writer=writer, event_resolver=resolver)
+    return service, written, loads
+
+async def register(service, registration_id, class_id=None, event_id="evt_1"):
+    view = await service.reserve(event_id, class_id)
+    service.bind(view["reservation_id"], registration_id)
+    return view
+
+def test_concurrent_reserves_never_oversell():
+    async def scenario():
+        service, _, loads = make_service(max_competitors=3)
+        views = await asyncio.gather(*(service.reserve("evt_1") for _ in range(10)))
+        assert [view["status"] for view in views].count("held") == 3
+        assert [view.get("waitlist_position") for view in views if view["status"] == "waitlisted"] == list(range(1, 8))
+        # Concurrent first uses share one snapshot load
+        assert loads == ["evt_1"]
+        status = await service.status("evt_1")
+        assert (status["held"], status["waitlisted"], status["remaining"]) == (3, 7, 0)
+
+    asyncio.run(scenario())
+
+def test_full_class_waitlists_and_waitlist_is_first_come():
+    async def scenario():
+        service, _, _ = make_service(max_competitors=10, class_limits={"spl": 1})
+        assert (await service.reserve("evt_1", "spl"))["status"] == "held"
+        assert (await service.reserve("evt_1", "spl"))["status"] == "waitlisted"
+        # The waitlist is first come, first served across classes
+        assert (await service.reserve("evt_1", "sq"))["status"] == "waitlisted"
+
+    asyncio.run(scenario())
+
+def test_payment_start_and_confirm_are_idempotent():
+    async def scenario():
+        service, written, _ = make_service(max_competitors=1)
+        await register(service, "reg_a")
+        assert await service.start_payment("reg_a") == "started"
+        assert await service.start_payment("reg_a") == "in_progress"
+        assert await service.confirm("reg_a")
+        assert await service.confirm("reg_a")
+        assert await service.start_payment("reg_a") == "confirmed"
+        status = await service.status("evt_1")
+        assert (status["confirmed"], status["held"], status["remaining"]) == (1, 0, 0)
+        assert written == [("reg_a", "confirmed")]
+
+    asyncio.run(scenario())
+
+def test_failed_payment_releases_slot_to_waitlist():
+    async def scenario():
+        service, written, _ = make_service(max_competitors=1)
+        await register(service, "reg_a")
+        assert (await register(service, "reg_b"))["status"] == "waitlisted"
+        assert await service.start_payment("reg_b") == "unavailable"
+        assert await service.start_payment("reg_a") == "started"
+        await service.fail_payment("reg_a")
+        assert written == [("reg_a", "payment_failed"), ("reg_b", "pending_payment")]
+        assert (await service.status("evt_1", "reg_b"))["reservation"]["status"] == "held"
+        # Repeated failure reports change nothing
+        await service.fail_payment("reg_a")
+        assert len(written) == 2
+
+    asyncio.run(scenario())
+
+def test_failure_after_confirm_rolls_back():
+    async def scenario():
+        service, written, _ = make_service(max_competitors=1)
+        await register(service, "reg_a")
+        await register(service, "reg_b")
+        await service.start_payment("reg_a")
+        await service.confirm("reg_a")
+        await service.fail_payment("reg_a")
+        status = await service.status("evt_1", "reg_b")
+        assert status["confirmed"] == 0
+        assert status["reservation"]["status"] == "held"
+        assert written[-2:] == [("reg_a", "payment_failed"), ("reg_b", "pending_payment")]
+
+    asyncio.run(scenario())
+
+def test_lapsed_holds_expire_but_paying_holds_do_not():
+    async def scenario():
+        service, _, _ = make_service(max_competitors=2, hold_seconds=0.0)
+        await register(service, "reg_a")
+        await register(service, "reg_b")
+        await register(service, "reg_c")
+        await service.start_payment("reg_a")
+        updates = service.expire()
+        assert ("reg_b", "expired") in updates
+        assert ("reg_a", "expired") not in updates
+        assert ("reg_c", "pending_payment") in updates
+
+    asyncio.run(scenario())
+
+def test_payment_without_hold_takes_free_slot():
+    async def scenario():
+        service, _, _ = make_service(max_competitors=1, events={"reg_x": "evt_1", "reg_y": "evt_1"})
+        results = await asyncio.gather(service.start_payment("reg_x"), service.start_payment("reg_x"))
+        assert sorted(results) == ["in_progress", "started"]
+        assert await service.start_payment("reg_y") == "unavailable"
+        # Unknown registrations have nothing to enforce against
+        assert await service.start_payment("reg_unknown") == "started"
+
+    asyncio.run(scenario())
+
+def test_failed_snapshot_load_is_retried():
+    async def scenario():
+        service, _, _ = make_service()
+        attempts = []
+
+        async def flaky(event_id):
+            attempts.append(event_id)
+            if len(attempts) == 1:
+                raise ConnectionError("database unavailable")
+            return {"max_competitors": 1}
+
+        service.snapshot_loader = flaky
+        with pytest.raises(ConnectionError):
+            await service.reserve("evt_1")
+        assert (await service.reserve("evt_1"))["status"] == "held"
+        assert (await service.reserve("evt_1"))["status"] == "waitlisted"
+        assert len(attempts) == 2
+
+    asyncio.run(scenario())
@@ -0,0 +1,56 @@
+import pytest
+
+from services.event_search import EventSearchIndex
+
+EVENTS = [
+    {"id": "evt_1", "name": "Desert Bass Showdown", "location": "Albuquerque, NM", "event_type": "SPL", "status": "upcoming", "start_date": "2025-05-01"},
+    {"id": "evt_2", "name": "Carolina Crank", "location": "Raleigh, NC", "event_type": "SPL", "status": "upcoming", "start_date": "2025-06-01"},
+    {"id": "evt_3", "name": "Low Country Sound Off", "location": "Charleston, SC", "event_type": "SQ", "status": "completed", "start_date": "2025-03-01"},
+    {"id": "evt_4", "name": "Empire Slam", "location": "Buffalo, New York", "event_type": "SPL", "status": "upcoming", "start_date": "2025-07-01"},
+    {"id": "evt_5", "name": "Gulf Coast Bass Bash", "location": "Miami, FL", "event_type": "SPL", "status": "upcoming", "start_date": "2025-08-01",
+     "description": "Bass race and install competition"},
+    {"id": "evt_6", "name": "Atlanta Sound Quality Finals", "location": "Atlanta, GA", "event_type": "SQ", "status": "upcoming", "start_date": "2025-09-01"},
+]
+
+@pytest.fixture
+def index():
+    index = EventSearchIndex()
+    for event in EVENTS:
+        index.upsert(event)
+    return index
+
+def ids(results):
+    return [result["id"] for result in results]
+
+@pytest.mark.parametrize("query,expected", [
+    ("new mexico", ["evt_1"]),
+    ("north carolina", ["evt_2"]),
+    ("south carolina", ["evt_3"]),
+    ("new york", ["evt_4"]),
+    ("florida", ["evt_5"]),
+    ("mexico", []),
+    ("dakota", []),
+])
+def test_state_names(index, query, expected):
+    assert ids(index.search(query)) == expected
+
+def test_prefix_and_typo_matches(index):
+    assert set(ids(index.search("bas"))) == {"evt_1", "evt_5"}
+    assert ids(index.search("Atlnta")) == ["evt_6"]
+
+def test_more_matched_terms_rank_first(index):
+    results = index.search("bass miami")
+    assert ids(results)[0] == "evt_5"
+    assert results[0]["matched_terms"] == 2
+
+def test_filters(index):
+    assert ids(index.search("sound", event_type="SQ", status="upcoming")) == ["evt_6"]
+    assert ids(index.search("bass", start_after="2025-06-01")) == ["evt_5"]
+
+def test_upsert_replaces_and_remove_drops(index):
+    index.upsert({**EVENTS[0], "name": "Desert Treble Clash"})
+    assert ids(index.search("treble")) == ["evt_1"]
+    assert "evt_1" not in ids(index.search("showdown"))
+    index.remove("evt_1")
+    assert index.search("treble") == []
+    assert len(index) == len(EVENTS) - 1
@@ -0,0 +1,135 @@
+import asyncio
+import subprocess
+import sys
+import time
+
+from services.job_queue import JobQueue
+
+async def noop(payload):
+    return payload
+
+def make_queue(db_path, **kwargs):
+    queue = JobQueue(db_path=str(db_path), **kwargs)
+    queue.register("noop", noop, concurrency=1000, max_attempts=3, base_delay=0.01, max_delay=0.01)
+    return queue
+
+def insert_running(queue, job_id, owner, lease_until):
+    now = time.time()
+    queue._db().execute(
+        "INSERT INTO jobs (id, job_type, payload, status, attempts, max_attempts, run_at, created_at, updated_at, owner, lease_until) "
+        "VALUES (?, 'noop', '{}', 'running', 1, 3, ?, ?, ?, ?, ?)",
+        (job_id, now, now, now, owner, lease_until)
+    )
+
+def dead_pid():
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+def test_each_job_is_claimed_by_one_process(tmp_path):
+    first, second = make_queue(tmp_path / "jobs.db"), make_queue(tmp_path / "jobs.db")
+    job_ids = {first.enqueue("noop", {"n": n})["id"] for n in range(50)}
+    claimed = []
+    while True:
+        rows = [queue._claim() for queue in (first, second, second, first)]
+        rows = [row for row in rows if row is not None]
+        if not rows:
+            break
+        claimed.extend(row["id"] for row in rows)
+    assert sorted(claimed) == sorted(job_ids)
+    owners = {row["owner"] for row in first._db().execute("SELECT owner FROM jobs")}
+    assert owners == {first.owner, second.owner}
+
+def test_claim_skips_a_row_taken_in_between(tmp_path, monkeypatch):
+    first, second = make_queue(tmp_path / "jobs.db"), make_queue(tmp_path / "jobs.db")
+    job_ids = {first.enqueue("noop", {"n": n})["id"] for n in range(2)}
+    connection, taken = first._db(), []
+
+    class Racing:
+        """The first process's connection, with the second process claiming just before its first update"""
+
+        def execute(self, sql, parameters=()):
+            if sql.startswith("UPDATE") and not taken:
+                taken.append(second._claim()["id"])
+            return connection.execute(sql, parameters)
+
+    monkeypatch.setattr(first, "_db", Racing)
+    row = first._claim()
+    assert {row["id"], taken[0]} == job_ids
+
+def test_reclaim_requeues_only_abandoned_jobs(tmp_path):
+    queue = make_queue(tmp_path / "jobs.db")
+    host = queue.owner.split(":")[0]
+    now = time.time()
+    insert_running(queue, "job_dead", f"{host}:{dead_pid()}:abcd", now + 600)
+    insert_running(queue, "job_lapsed", "elsewhere:123:abcd", now - 1)
+    insert_running(queue, "job_leased", "elsewhere:123:abcd", now + 600)
+    insert_running(queue, "job_mine", queue.owner, now - 1)
+    assert queue._reclaim() == 2
+    statuses = {row["id"]: row["status"] for row in queue._db().execute("SELECT id, status FROM jobs")}
+    assert statuses == {"job_dead": "queued", "job_lapsed": "queued", "job_leased": "running", "job_mine": "running"}
+
+def test_jobs_retry_then_fail_permanently(tmp_path):
+    async def scenario():
+        queue = JobQueue(db_path=str(tmp_path / "jobs.db"), workers=2, poll_interval=0.05)
+        calls, failures = {"flaky": 0}, []
+
+        async def flaky(payload):
+            calls["flaky"] += 1
+            if calls["flaky"] < 2:
+                raise RuntimeError("transient")
+            return {"ok": True}
+
+        async def broken(payload):
+            raise RuntimeError("permanent")
+
+        async def on_failure(payload, error):
+            failures.append((payload, error))
+
+        queue.register("flaky", flaky, max_attempts=3, base_delay=0.01, max_delay=0.01)
+        queue.register("broken", broken, max_attempts=2, base_delay=0.01, max_delay=0.01, on_failure=on_failure)
+        queue.start()
+        try:
+            flaky_job = queue.enqueue("flaky", {})["id"]
+            broken_job = queue.enqueue("broken", {"n": 1})["id"]
+            for _ in range(200):
+                if {queue.get(flaky_job)["status"], queue.get(broken_job)["status"]} <= {"succeeded", "failed"}:
+                    break
+                await asyncio.sleep(0.01)
+            assert queue.get(flaky_job)["status"] == "succeeded"
+            assert queue.get(flaky_job)["result"] == {"ok": True}
+            assert queue.get(broken_job)["status"] == "failed"
+            assert queue.get(broken_job)["attempts"] == 2
+            assert failures == [({"n": 1}, "permanent")]
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+
+def test_result_of_a_reclaimed_job_is_discarded(tmp_path):
+    async def scenario():
+        first, second = make_queue(tmp_path / "jobs.db"), make_queue(tmp_path / "jobs.db")
+        failures = []
+
+        async def failing(payload):
+            # The lease lapses while the job runs and another process takes it over
+            first._db().execute("UPDATE jobs SET lease_until = 0")
+            second._reclaim()
+            second._claim()
+            raise RuntimeError("too late")
+
+        async def on_failure(payload, error):
+            failures.append(error)
+
+        first.register("failing", failing, max_attempts=1, on_failure=on_failure)
+        second.register("failing", failing, max_attempts=1, on_failure=on_failure)
+        first._wake = asyncio.Event()
+        job_id = first.enqueue("failing", {})["id"]
+        await first._execute(first._claim())
+        job = second.get(job_id)
+        assert job["status"] == "running"
+        assert failures == []
+        owner = second._db().execute("SELECT owner FROM jobs WHERE id = ?", (job_id,)).fetchone()["owner"]
+        assert owner == second.owner
+
+    asyncio.run(scenario())
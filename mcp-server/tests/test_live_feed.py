@@ -0,0 +1,73 @@
+import asyncio
+
+from services.live_feed import EventFeedHub
+
+SNAPSHOT = {"registrations": 10, "paid": 2, "revenue": 100.0, "checked_in": 3}
+
+def make_hub():
+    """A hub whose snapshot loads block until the returned event is set"""
+    hub, released, loads = EventFeedHub(), asyncio.Event(), []
+
+    async def loader(event_id):
+        loads.append(event_id)
+        await released.wait()
+        return dict(SNAPSHOT)
+
+    hub.snapshot_loader = loader
+    return hub, released, loads
+
+async def first_message(hub, event_id="evt_1"):
+    async with hub.subscribe(event_id) as queue:
+        return await queue.get()
+
+def test_deltas_published_during_load_are_applied_on_top_of_snapshot():
+    async def scenario():
+        hub, released, _ = make_hub()
+        viewer = asyncio.create_task(first_message(hub))
+        await asyncio.sleep(0)
+        hub.publish("evt_1", "checked_in")
+        hub.publish("evt_1", "payment_succeeded", {"amount": 25})
+        released.set()
+        snapshot = await viewer
+        assert snapshot["totals"] == {"registrations": 10, "paid": 3, "revenue": 125.0, "checked_in": 4}
+        assert snapshot["seq"] == 2
+        assert not hub.has_viewers()
+
+    asyncio.run(scenario())
+
+def test_cancelled_loader_hands_the_load_to_a_waiting_viewer():
+    async def scenario():
+        hub, released, loads = make_hub()
+        loader = asyncio.create_task(first_message(hub))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(first_message(hub))
+        await asyncio.sleep(0)
+        loader.cancel()
+        await asyncio.sleep(0)
+        await asyncio.sleep(0)
+        # The waiter reloads into a fresh, registered topic
+        assert hub.has_viewers("evt_1")
+        assert len(loads) == 2
+        released.set()
+        snapshot = await waiter
+        assert snapshot["totals"] == SNAPSHOT
+        assert not hub.has_viewers()
+
+    asyncio.run(scenario())
+
+def test_cancelled_waiter_leaves_the_loading_topic_open():
+    async def scenario():
+        hub, released, loads = make_hub()
+        loader = asyncio.create_task(first_message(hub))
+        await asyncio.sleep(0)
+        waiter = asyncio.create_task(first_message(hub))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        await asyncio.sleep(0)
+        assert hub.has_viewers("evt_1")
+        released.set()
+        assert (await loader)["totals"] == SNAPSHOT
+        assert len(loads) == 1
+        assert not hub.has_viewers()
+
+    asyncio.run(scenario())
@@ -0,0 +1,131 @@
+import asyncio
+import random
+
+import pytest
+
+from services.memory_store import MemoryStore, _matches
+from services.supabase_service import supabase_service
+
+STATUSES = ["confirmed", "pending_payment", "cancelled", None]
+
+@pytest.fixture
+def store():
+    """An empty store with 300 registrations across five events, some without a timestamp or status"""
+    store = MemoryStore()
+    rng = random.Random(7)
+    records = []
+    for n in range(300):
+        records.append({
+            "id": f"reg_{n:04d}",
+            "event_id": f"evt_{rng.randrange(5)}",
+            "status": rng.choice(STATUSES),
+            "amount": rng.randrange(20, 80),
+            "created_at": None if n % 25 == 0 else f"2025-03-{1 + n % 28:02d}T{n % 24:02d}:{n % 60:02d}:{n % 59:02d}",
+            "metadata": {"source": rng.choice(["web", "gate"])}
+        })
+    store._table("registrations").bulk_insert(records)
+    return store
+
+def reference(store, filters, order=None):
+    """The same query by brute force: filter every row, then sort like Postgres (NULLs last ascending)"""
+    table = store.tables["registrations"]
+    rows = [table.to_dict(row) for row in sorted(table.rows.values(), key=lambda row: row.seq)]
+    rows = [row for row in rows if all(_matches(row.get(column), operator, operand) for operator, column, operand in filters)]
+    if order is not None:
+        column, descending = order
+        present = sorted((row for row in rows if row[column] is not None), key=lambda row: row[column], reverse=descending)
+        missing = [row for row in rows if row[column] is None]
+        rows = missing + present if descending else present + missing
+    return rows
+
+FILTER_SETS = [
+    [],
+    [("eq", "event_id", "evt_2")],
+    [("eq", "status", "confirmed"), ("gte", "amount", 50)],
+    [("in", "status", ["confirmed", "cancelled"]), ("eq", "event_id", "evt_1")],
+    [("gte", "created_at", "2025-03-10"), ("lt", "created_at", "2025-03-20")],
+    [("gt", "created_at", "2025-03-27"), ("neq", "status", "cancelled")],
+    [("eq", "event_id", "evt_4"), ("lte", "created_at", "2025-03-05")],
+    [("eq", "event_id", "evt_missing")],
+]
+
+@pytest.mark.parametrize("filters", FILTER_SETS)
+@pytest.mark.parametrize("order", [None, ("created_at", False), ("created_at", True), ("amount", False), ("id", True)])
+def test_query_matches_brute_force(store, filters, order):
+    query = store.table("registrations").select("*", count="exact")
+    for operator, column, operand in filters:
+        query = getattr(query, "in_" if operator == "in" else operator)(column, operand)
+    if order is not None:
+        query = query.order(order[0], desc=order[1])
+    expected = reference(store, filters, order)
+
+    everything = query.execute()
+    assert everything.count == len(expected)
+    if order is None:
+        assert sorted(row["id"] for row in everything.data) == sorted(row["id"] for row in expected)
+    else:
+        # Rows tied on the order column may come back in either order
+        assert [row[order[0]] for row in everything.data] == [row[order[0]] for row in expected]
+
+    if order is not None:
+        page = query.range(10, 19).execute()
+        assert [row[order[0]] for row in page.data] == [row[order[0]] for row in expected[10:20]]
+        assert page.count == len(expected)
+
+def test_order_then_by_breaks_ties(store):
+    rows = store.table("registrations").select("event_id,id").order("event_id").order("id", desc=True).execute().data
+    expected = sorted(rows, key=lambda row: row["id"], reverse=True)
+    expected.sort(key=lambda row: row["event_id"])
+    assert rows == expected
+
+def test_json_and_projection(store):
+    rows = store.table("registrations").select("id,metadata").eq("metadata->>source", "gate").execute().data
+    assert rows and all(row["metadata"]["source"] == "gate" for row in rows)
+    assert all(set(row) == {"id", "metadata"} for row in rows)
+    assert len(rows) == len(reference(store, [])) - len(
+        store.table("registrations").select("id").eq("metadata->>source", "web").execute().data
+    )
+
+def test_update_moves_rows_between_indexes(store):
+    confirmed = store.table("registrations").select("id").eq("status", "confirmed").execute().data
+    store.table("registrations").update({"status": "cancelled", "created_at": "2026-01-01T00:00:00"}).eq("status", "confirmed").execute()
+    assert store.table("registrations").select("id").eq("status", "confirmed").execute().data == []
+    moved = store.table("registrations").select("id").gte("created_at", "2026-01-01").execute().data
+    assert sorted(row["id"] for row in moved) == sorted(row["id"] for row in confirmed)
+
+def test_duplicate_id_is_rejected(store):
+    with pytest.raises(ValueError):
+        store.table("registrations").insert({"id": "reg_0001"}).execute()
+
+def test_snapshot_round_trip(store, tmp_path):
+    path = str(tmp_path / "store.json")
+    store.save(path)
+    restored = MemoryStore()
+    restored.restore(path)
+    for filters in FILTER_SETS:
+        query = restored.table("registrations").select("*")
+        for operator, column, operand in filters:
+            query = getattr(query, "in_" if operator == "in" else operator)(column, operand)
+        assert sorted(row["id"] for row in query.execute().data) == sorted(row["id"] for row in reference(store, filters))
+
+@pytest.mark.parametrize("page_size", [1, 4, 7, 1000])
+def test_keyset_pages_cover_ties_once(store, monkeypatch, page_size):
+    # 60 distinct amounts over 300 rows, so paging by amount crosses many ties
+    monkeypatch.setattr(supabase_service, "client", store)
+
+    async def read_all(order):
+        seen, after = [], None
+        while True:
+            rows = await supabase_service.get_page("registrations", "id,amount,event_id", after, page_size, order, [("neq", "event_id", "evt_0")])
+            if not rows:
+                return seen
+            seen.extend(rows)
+            after = rows[-1]
+
+    for order in ("id", "amount"):
+        rows = asyncio.run(read_all(order))
+        expected = reference(store, [("neq", "event_id", "evt_0")])
+        assert sorted(row["id"] for row in rows) == sorted(row["id"] for row in expected)
+        assert len({row["id"] for row in rows}) == len(rows)
+        keys = [(row[order], row["id"]) for row in rows]
+        assert keys == sorted(keys)
@@ -0,0 +1,101 @@
+import asyncio
+import time
+
+import pytest
+
+from services.resilience import BackendUnavailable, ResilientReader
+
+def make_reader(**kwargs):
+    options = {"base_delay": 0.001, "max_delay": 0.001, "failure_threshold": 3, "reset_timeout": 0.05, "offload": False}
+    return ResilientReader(**{**options, **kwargs})
+
+def flaky(failures, error=ConnectionError):
+    """A read that raises error for its first failures calls, then answers"""
+    calls = []
+
+    def read():
+        calls.append(time.monotonic())
+        if len(calls) <= failures:
+            raise error("database unavailable")
+        return "rows"
+
+    return read, calls
+
+def test_retryable_failures_are_retried():
+    reader = make_reader()
+    read, calls = flaky(2)
+    assert asyncio.run(reader.read("op", read)) == "rows"
+    assert len(calls) == 3
+    assert reader.metrics["op"].retries == 2
+    assert reader.breaker.state == "closed"
+
+def test_other_errors_fail_at_once():
+    reader = make_reader()
+    read, calls = flaky(5, ValueError)
+    with pytest.raises(ValueError):
+        asyncio.run(reader.read("op", read))
+    assert len(calls) == 1
+    assert reader.breaker.failures == 0
+
+def test_open_circuit_serves_stale_or_refuses():
+    reader = make_reader(max_attempts=1)
+    assert asyncio.run(reader.read("op", lambda: "fresh", key="k")) == "fresh"
+    read, _ = flaky(100)
+    for _ in range(3):
+        assert asyncio.run(reader.read("op", read, key="k")) == "fresh"
+    assert reader.breaker.state == "open"
+    # Refused without calling the database
+    assert asyncio.run(reader.read("op", lambda: pytest.fail("called while open"), key="k")) == "fresh"
+    with pytest.raises(BackendUnavailable):
+        asyncio.run(reader.read("op", lambda: "unused"))
+
+def test_probe_closes_the_circuit():
+    reader = make_reader(max_attempts=1)
+    read, _ = flaky(3)
+    for _ in range(3):
+        with pytest.raises(ConnectionError):
+            asyncio.run(reader.read("op", read))
+    assert reader.breaker.state == "open"
+    time.sleep(0.06)
+    assert asyncio.run(reader.read("op", read)) == "rows"
+    assert reader.breaker.state == "closed"
+
+def test_cancelled_probe_is_abandoned():
+    async def scenario():
+        reader = make_reader(max_attempts=1, offload=True)
+        read, _ = flaky(3)
+        for _ in range(3):
+            with pytest.raises(ConnectionError):
+                await reader.read("op", read)
+        await asyncio.sleep(0.06)
+        probe = asyncio.create_task(reader.read("op", lambda: time.sleep(0.2) or "slow"))
+        await asyncio.sleep(0.01)
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert reader.breaker.state == "half_open"
+        # The next read may probe instead of being refused forever
+        assert await reader.read("op", lambda: "rows") == "rows"
+        assert reader.breaker.state == "closed"
+
+    asyncio.run(scenario())
+
+def test_slow_attempt_is_hedged():
+    async def scenario():
+        reader = make_reader(offload=True, min_hedge_samples=5)
+        for _ in range(5):
+            await reader.read("op", lambda: "warm")
+        calls = []
+
+        def read():
+            calls.append(None)
+            if len(calls) == 1:
+                time.sleep(0.3)
+                return "slow"
+            return "fast"
+
+        assert await reader.read("op", read) == "fast"
+        assert reader.metrics["op"].hedges == 1
+        assert reader.metrics["op"].hedge_wins == 1
+
+    asyncio.run(scenario())
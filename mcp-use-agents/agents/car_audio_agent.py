@@ -4,14 +4,19 @@ AI agent that can interact with the Car Audio Events platform
 """
 
 import asyncio
+import json
 import os
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 from dotenv import load_dotenv
 from langchain_openai import ChatOpenAI
 from langchain_anthropic import ChatAnthropic
 from mcp_use import MCPAgent, MCPClient
 import logging
 
+from agents.lazy_servers import register_lazy_servers
+from agents.parallel_tools import PARALLEL_TOOL_INSTRUCTIONS, ParallelToolLimiter
+from agents.context_compaction import ContextCompactor, ContextManagedMCPAgent
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -19,6 +24,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Name of the Car Audio Events API server in MCP configurations
+API_SERVER_NAME = "car-audio-api"
+
+# Tool profiles published by the MCP server at /mcp/{profile},
+# with the auxiliary MCP servers each profile is allowed to use
+TOOL_PROFILES: Dict[str, List[str]] = {
+    "events": [API_SERVER_NAME],
+    "analytics": [API_SERVER_NAME],
+    "support": [API_SERVER_NAME, "playwright"],
+}
+
 class CarAudioEventsAgent:
     """
     AI Agent for Car Audio Events Platform
@@ -31,7 +47,13 @@ class CarAudioEventsAgent:
         model: Optional[str] = None,
         config_file: Optional[str] = None,
         max_steps: int = 30,
-        use_server_manager: bool = True
+        use_server_manager: bool = True,
+        tool_profile: Optional[str] = None,
+        lazy_servers: bool = True,
+        idle_timeout: float = 300.0,
+        max_parallel_tools: int = 4,
+        keep_recent_steps: int = 2,
+        token_budget: Optional[int] = 200_000
     ):
         """
         Initialize the Car Audio Events Agent
@@ -42,6 +64,12 @@ class CarAudioEventsAgent:
             config_file: Path to MCP configuration file
             max_steps: Maximum steps for agent execution
             use_server_manager: Enable dynamic server selection
+            tool_profile: Restrict tools to a server profile ("events", "analytics", "support")
+            lazy_servers: Spawn command-based MCP servers only when one of their tools is called
+            idle_timeout: Seconds before an idle lazily spawned server is shut down
+            max_parallel_tools: Most tool calls from one LLM turn run at once (1 runs them one by one)
+            keep_recent_steps: Tool-calling steps whose results the LLM sees in full; older ones are compacted
+            token_budget: Most tokens one run may use (None for no limit)
         """
         # Load environment variables
         load_dotenv()
@@ -58,22 +86,43 @@ class CarAudioEventsAgent:
         
         # Load MCP configuration
         if config_file:
-            self.client = MCPClient.from_config_file(config_file)
+            with open(config_file) as f:
+                config = json.load(f)
         else:
             # Use default configuration
             config = self._get_default_config()
-            self.client = MCPClient.from_dict(config)
+        
+        if tool_profile:
+            config = self._apply_tool_profile(config, tool_profile)
+        self.tool_profile = tool_profile
+        self.client = MCPClient.from_dict(config)
+        
+        # Advertise cached manifests for stdio servers instead of launching them up front
+        self.lazy_servers = register_lazy_servers(self.client, idle_timeout) if lazy_servers else {}
+        self._sessions_ready = False
+        
+        # Tool calls the model requests together run concurrently, up to the limit
+        self.tool_limiter = ParallelToolLimiter(max_parallel_tools, server_resolver=self._server_for_connection)
+        self.client.add_middleware(self.tool_limiter)
+        
+        # Older tool results reach the LLM as summaries it can expand, within a per-run token budget
+        self.context = ContextCompactor(keep_recent_steps=keep_recent_steps, token_budget=token_budget)
         
         # Create agent
-        self.agent = MCPAgent(
+        self.agent = ContextManagedMCPAgent(
             llm=self.llm,
             client=self.client,
             max_steps=max_steps,
             use_server_manager=use_server_manager,
-            verbose=True
+            additional_instructions=PARALLEL_TOOL_INSTRUCTIONS if max_parallel_tools > 1 else None,
+            verbose=True,
+            compactor=self.context
         )
         
-        logger.info(f"Car Audio Events Agent initialized with {llm_provider} ({model})")
+        logger.info(
+            f"Car Audio Events Agent initialized with {llm_provider} ({model})"
+            + (f", tool profile '{tool_profile}'" if tool_profile else "")
+        )
     
     def _get_default_config(self) -> Dict[str, Any]:
         """Get default MCP configuration"""
@@ -88,6 +137,43 @@ class CarAudioEventsAgent:
             }
         }
     
+    def _apply_tool_profile(self, config: Dict[str, Any], tool_profile: str) -> Dict[str, Any]:
+        """Point the API server at its profile endpoint and drop servers the profile doesn't use"""
+        if tool_profile not in TOOL_PROFILES:
+            raise ValueError(f"Unsupported tool profile: {tool_profile}")
+        
+        allowed_servers = TOOL_PROFILES[tool_profile]
+        servers = {
+            name: dict(server)
+            for name, server in config.get("mcpServers", {}).items()
+            if name in allowed_servers
+        }
+        
+        api_server = servers.get(API_SERVER_NAME)
+        if api_server and "url" in api_server:
+            api_server["url"] = f"{api_server['url'].rstrip('/')}/{tool_profile}"
+        
+        return {**config, "mcpServers": servers}
+    
+    def _server_for_connection(self, connection_id: str) -> Optional[str]:
+        """Name of the server whose connector has this middleware connection ID"""
+        for name, session in self.client.sessions.items():
+            if session.connector.public_identifier == connection_id:
+                return name
+        return None
+    
+    async def _ensure_sessions(self):
+        """Connect eager servers and load the tool manifests of lazy ones"""
+        if self._sessions_ready:
+            return
+        
+        for name in self.client.get_server_names():
+            if name in self.lazy_servers:
+                await self.client.sessions[name].initialize()
+            elif name not in self.client.sessions:
+                await self.client.create_session(name)
+        self._sessions_ready = True
+    
     async def run(self, query: str, max_steps: Optional[int] = None) -> str:
         """
         Run the agent with a query
@@ -101,6 +187,7 @@ class CarAudioEventsAgent:
         """
         try:
             logger.info(f"Running query: {query}")
+            await self._ensure_sessions()
             result = await self.agent.run(query, max_steps=max_steps)
             logger.info("Query completed successfully")
             return result
@@ -108,40 +195,106 @@ class CarAudioEventsAgent:
             logger.error(f"Error running query: {str(e)}")
             raise
     
-    async def stream(self, query: str):
+    async def stream(self, query: str, max_steps: Optional[int] = None):
         """
         Stream agent output for real-time feedback
         
         Args:
             query: The task or question for the agent
+            max_steps: Override default max_steps
             
         Yields:
-            Chunks of agent output
+            A line per tool call as it completes, then the final result
         """
         try:
             logger.info(f"Streaming query: {query}")
-            async for chunk in self.agent.astream(query):
-                if "messages" in chunk:
-                    yield chunk["messages"]
-                if "output" in chunk:
-                    yield f"\n\nFinal Result: {chunk['output']}"
+            await self._ensure_sessions()
+            async for item in self.agent.stream(query, max_steps=max_steps):
+                # Tool calls arrive as (action, observation) pairs, the answer as a string
+                if isinstance(item, tuple):
+                    action, observation = item
+                    yield f"[{action.tool}] {observation}\n"
+                else:
+                    yield f"\n\nFinal Result: {item}"
         except Exception as e:
             logger.error(f"Error streaming query: {str(e)}")
             raise
     
+    async def stream_events(self, query: str, max_steps: Optional[int] = None):
+        """
+        Stream token deltas and tool activity as they happen
+        
+        Args:
+            query: The task or question for the agent
+            max_steps: Override default max_steps
+            
+        Yields:
+            Event dicts with a "type" of "token", "tool_start", "tool_end", "trace" or "final"
+        """
+        try:
+            logger.info(f"Streaming events for query: {query}")
+            await self._ensure_sessions()
+            answer = []
+            async for event in self.agent.stream_events(query, max_steps=max_steps):
+                kind = event.get("event")
+                data = event.get("data", {})
+                if kind == "on_chat_model_stream":
+                    delta = _chunk_text(data.get("chunk"))
+                    if delta:
+                        answer.append(delta)
+                        yield {"type": "token", "delta": delta}
+                elif kind == "on_tool_start":
+                    # Text generated before a tool call is reasoning, not the answer
+                    answer.clear()
+                    # Calls from one turn overlap, so their events interleave; run_id pairs start with end
+                    yield {"type": "tool_start", "tool": event.get("name"), "id": event.get("run_id"), "input": data.get("input")}
+                elif kind == "on_tool_end":
+                    yield {"type": "tool_end", "tool": event.get("name"), "id": event.get("run_id"), "output": _chunk_text(data.get("output"))}
+            yield {"type": "trace", **(self.run_trace() or {})}
+            yield {"type": "final", "output": "".join(answer)}
+        except Exception as e:
+            logger.error(f"Error streaming events: {str(e)}")
+            raise
+    
+    def tool_stats(self) -> Dict[str, Any]:
+        """Tool calls made, errors, and the most that ran at once"""
+        return self.tool_limiter.snapshot()
+    
+    def run_trace(self) -> Optional[Dict[str, Any]]:
+        """Per-step tokens and latency of the last run, with what compaction saved and the budget used"""
+        return self.context.last_trace
+    
+    def reset(self):
+        """Clear conversation history so the agent can be reused for an unrelated query"""
+        self.agent.clear_conversation_history()
+        self.context.reset()
+    
     async def close(self):
         """Clean up resources"""
         if self.client.sessions:
             await self.client.close_all_sessions()
             logger.info("All sessions closed")
 
+def _chunk_text(chunk: Any) -> str:
+    """Extract plain text from a LangChain message chunk, tool output or content block list"""
+    content = getattr(chunk, "content", chunk)
+    if content is None:
+        return ""
+    if isinstance(content, list):
+        return "".join(
+            block.get("text", "") if isinstance(block, dict) else str(block)
+            for block in content
+        )
+    return content if isinstance(content, str) else str(content)
+
 # Specialized agent functions
 
 async def create_event_agent():
     """Create an agent specialized for event management"""
     agent = CarAudioEventsAgent(
         llm_provider="openai",
-        config_file="configs/car_audio_mcp.json"
+        config_file="configs/car_audio_mcp.json",
+        tool_profile="events"
     )
     return agent
 
@@ -150,7 +303,8 @@ async def create_analytics_agent():
     agent = CarAudioEventsAgent(
         llm_provider="openai",
         model="gpt-4o",
-        config_file="configs/car_audio_mcp.json"
+        config_file="configs/car_audio_mcp.json",
+        tool_profile="analytics"
     )
     return agent
 
@@ -159,7 +313,8 @@ async def create_support_agent():
     agent = CarAudioEventsAgent(
         llm_provider="anthropic",
         model="claude-3-5-sonnet-20240620",
-        config_file="configs/car_audio_mcp.json"
+        config_file="configs/car_audio_mcp.json",
+        tool_profile="support"
     )
     return agent
 
@@ -0,0 +1,309 @@
+"""
+Context compaction
+Keeps recent agent steps verbatim, swaps older tool outputs for structured
+summaries backed by a local result store, and enforces a per-run token budget
+"""
+
+import json
+import time
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any, List, Tuple
+from langchain.agents import create_agent
+from langchain.agents.middleware import AgentMiddleware, ModelCallLimitMiddleware, ModelRequest, ModelResponse
+from langchain_core.messages import AIMessage, SystemMessage, ToolMessage
+from langchain_core.messages.utils import count_tokens_approximately
+from langchain_core.tools import BaseTool, StructuredTool
+from mcp_use import MCPAgent
+from mcp_use.agents.middleware import tool_error_handler
+
+logger = logging.getLogger(__name__)
+
+FETCH_TOOL_NAME = "fetch_tool_result"
+
+# Keys and list IDs shown per level of a summary
+MAX_SUMMARY_KEYS = 12
+MAX_SUMMARY_IDS = 10
+MAX_SUMMARY_TEXT = 80
+
+WRAP_UP_INSTRUCTIONS = (
+    "This run is close to its token budget. Do not call more tools; "
+    "answer now with what you have."
+)
+
+def _text(content: Any) -> str:
+    if isinstance(content, list):
+        return "".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in content)
+    return content if isinstance(content, str) else str(content)
+
+def _total(steps: List[Dict[str, Any]], key: str) -> Optional[int]:
+    """Sum of a usage figure over the steps, None when the provider never reported it"""
+    values = [step[key] for step in steps if step[key] is not None]
+    return sum(values) if values else None
+
+def summarize(value: Any, depth: int = 2) -> Any:
+    """A small structural outline of a JSON value: keys, list sizes, fields and IDs, clipped strings"""
+    if isinstance(value, dict):
+        if depth <= 0:
+            return f"{{{len(value)} keys}}"
+        outline = {key: summarize(item, depth - 1) for key, item in list(value.items())[:MAX_SUMMARY_KEYS]}
+        if len(value) > MAX_SUMMARY_KEYS:
+            outline["..."] = f"{len(value) - MAX_SUMMARY_KEYS} more keys"
+        return outline
+    if isinstance(value, list):
+        outline: Dict[str, Any] = {"items": len(value)}
+        records = [item for item in value if isinstance(item, dict)]
+        if records:
+            outline["fields"] = list(records[0])[:MAX_SUMMARY_KEYS]
+            ids = [record.get("id") for record in records if record.get("id") is not None]
+            if ids:
+                outline["ids"] = ids[:MAX_SUMMARY_IDS] + (["..."] if len(ids) > MAX_SUMMARY_IDS else [])
+        elif value and depth > 0:
+            outline["first"] = summarize(value[0], depth - 1)
+        return outline
+    if isinstance(value, str) and len(value) > MAX_SUMMARY_TEXT:
+        return value[:MAX_SUMMARY_TEXT] + "..."
+    return value
+
+class ResultStore:
+    """Full tool outputs by reference, most recently used kept; identical outputs share a reference"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._results: "OrderedDict[str, str]" = OrderedDict()
+        self._refs: Dict[str, str] = {}
+        self._next = 1
+
+    def put(self, content: str) -> str:
+        digest = hashlib.sha256(content.encode()).hexdigest()
+        ref = self._refs.get(digest)
+        if ref is None or ref not in self._results:
+            ref = f"r{self._next}"
+            self._next += 1
+            self._refs[digest] = ref
+            self._results[ref] = content
+            if len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+        self._results.move_to_end(ref)
+        return ref
+
+    def get(self, ref: str) -> Optional[str]:
+        return self._results.get(ref)
+
+    def clear(self) -> None:
+        self._results.clear()
+        self._refs.clear()
+
+class ContextCompactor(AgentMiddleware):
+    """
+    Agent middleware that rewrites what each model call sees; the agent's
+    own state keeps every message in full.
+
+    Tool results from the last keep_recent_steps steps are sent verbatim.
+    Older results longer than min_chars are replaced by a structured
+    outline plus a reference into the ResultStore, which the model can
+    re-read with the fetch_tool_result tool. A result is compacted the same
+    way on every later call, so the prompt prefix stays stable.
+
+    token_budget caps the tokens a run may spend (input plus output, from
+    the provider's usage figures when reported). When the next call would
+    not fit even with every tool result compacted, the run ends with a
+    message saying so; when it gets close, the model is told to answer
+    without further tool calls. Each run's trace records the tokens every
+    call would have sent, what it did send, and how long it took.
+    """
+
+    def __init__(self, keep_recent_steps: int = 2, token_budget: Optional[int] = None, min_chars: int = 800):
+        super().__init__()
+        self.keep_recent_steps = keep_recent_steps
+        self.token_budget = token_budget
+        self.min_chars = min_chars
+        self.store = ResultStore()
+        self.tools = [self._fetch_tool()]
+        # tool_call_id -> compacted content, so a message compacts identically on every call
+        self._compacted: Dict[str, str] = {}
+        self.trace: Dict[str, Any] = self._new_trace()
+        self.last_trace: Optional[Dict[str, Any]] = None
+
+    def _new_trace(self) -> Dict[str, Any]:
+        return {"steps": [], "started": time.monotonic(), "used_tokens": 0, "budget_exhausted": False}
+
+    def _fetch_tool(self) -> BaseTool:
+        async def fetch_tool_result(ref: str, path: str = "", max_chars: int = 4000) -> str:
+            content = self.store.get(ref)
+            if content is None:
+                return f"No stored result {ref}; call the original tool again."
+            if path:
+                try:
+                    value = json.loads(content)
+                    for part in path.split("."):
+                        value = value[int(part)] if isinstance(value, list) else value[part]
+                except (ValueError, KeyError, IndexError, TypeError):
+                    return f"Path {path!r} not found in {ref}."
+                content = value if isinstance(value, str) else json.dumps(value)
+            if len(content) > max_chars:
+                return content[:max_chars] + f"\n[truncated: {len(content) - max_chars} more chars; narrow with path]"
+            return content
+
+        return StructuredTool.from_function(
+            coroutine=fetch_tool_result,
+            name=FETCH_TOOL_NAME,
+            description=(
+                "Re-read the full output of an earlier tool call that was compacted. "
+                "ref is the reference shown in the compacted result; path optionally selects "
+                "part of a JSON result with dot notation, e.g. \"events.0\" or \"analytics.revenue\"."
+            )
+        )
+
+    # =====================
+    # Compaction
+    # =====================
+
+    def _compact(self, message: ToolMessage) -> ToolMessage:
+        compacted = self._compacted.get(message.tool_call_id)
+        if compacted is None:
+            content = _text(message.content)
+            if len(content) < self.min_chars:
+                return message
+            ref = self.store.put(content)
+            try:
+                outline = json.dumps(summarize(json.loads(content)), default=str)
+            except ValueError:
+                outline = content[:200] + "..."
+            compacted = (
+                f"[Compacted output of {message.name or 'tool'}: {len(content)} chars stored as {ref}; "
+                f"call {FETCH_TOOL_NAME}(ref=\"{ref}\") to read it again]\n{outline}"
+            )
+            self._compacted[message.tool_call_id] = compacted
+        return message.model_copy(update={"content": compacted})
+
+    def _compacted_messages(self, messages: List[Any], keep_recent_steps: int) -> Tuple[List[Any], int]:
+        """Messages with tool results older than the last keep_recent_steps steps compacted, and how many were"""
+        boundary = len(messages)
+        steps = 0
+        for position in range(len(messages) - 1, -1, -1):
+            if steps >= keep_recent_steps:
+                break
+            if isinstance(messages[position], AIMessage) and messages[position].tool_calls:
+                steps += 1
+                boundary = position
+        if steps < keep_recent_steps:
+            boundary = 0
+
+        result, count = [], 0
+        for position, message in enumerate(messages):
+            if position < boundary and isinstance(message, ToolMessage):
+                compacted = self._compact(message)
+                count += compacted is not message
+                message = compacted
+            result.append(message)
+        return result, count
+
+    def _count(self, request: ModelRequest, messages: List[Any]) -> int:
+        system = [request.system_message] if request.system_message else []
+        return count_tokens_approximately(system + messages)
+
+    # =====================
+    # Middleware hooks
+    # =====================
+
+    async def abefore_agent(self, state, runtime) -> None:
+        self.trace = self._new_trace()
+        return None
+
+    async def aafter_agent(self, state, runtime) -> None:
+        steps = self.trace["steps"]
+        full = sum(step["tokens_full"] for step in steps)
+        sent = sum(step["tokens_sent"] for step in steps)
+        self.last_trace = {
+            "steps": steps,
+            "model_calls": len(steps),
+            "tokens_full": full,
+            "tokens_sent": sent,
+            "tokens_saved": full - sent,
+            "input_tokens": _total(steps, "input_tokens"),
+            "output_tokens": _total(steps, "output_tokens"),
+            "token_budget": self.token_budget,
+            "used_tokens": self.trace["used_tokens"],
+            "budget_exhausted": self.trace["budget_exhausted"],
+            "model_latency_ms": round(sum(step["latency_ms"] for step in steps), 1),
+            "duration_ms": round((time.monotonic() - self.trace["started"]) * 1000, 1)
+        }
+        logger.info(
+            f"Run used {self.last_trace['used_tokens']} tokens over {len(steps)} model calls; "
+            f"compaction sent {sent} of {full} estimated prompt tokens"
+        )
+        return None
+
+    async def awrap_model_call(self, request: ModelRequest, handler) -> Any:
+        tokens_full = self._count(request, request.messages)
+        messages, compacted = self._compacted_messages(request.messages, self.keep_recent_steps)
+        tokens_sent = self._count(request, messages)
+
+        remaining = self.token_budget - self.trace["used_tokens"] if self.token_budget else None
+        if remaining is not None and tokens_sent > remaining:
+            # Over budget: compact everything but the step the model is answering
+            messages, compacted = self._compacted_messages(request.messages, 1)
+            tokens_sent = self._count(request, messages)
+            if tokens_sent > remaining:
+                self.trace["budget_exhausted"] = True
+                logger.warning(f"Token budget of {self.token_budget} exhausted after {len(self.trace['steps'])} model calls")
+                return AIMessage(content=(
+                    f"Stopping: this run has used {self.trace['used_tokens']} of its {self.token_budget} token budget "
+                    f"and the next step needs about {tokens_sent} more."
+                ))
+
+        overrides: Dict[str, Any] = {"messages": messages}
+        if remaining is not None and tokens_sent * 2 > remaining and request.system_message is not None:
+            overrides["system_message"] = SystemMessage(content=f"{_text(request.system_message.content)}\n\n{WRAP_UP_INSTRUCTIONS}")
+
+        started = time.monotonic()
+        response = await handler(request.override(**overrides))
+        latency_ms = (time.monotonic() - started) * 1000
+
+        replies = response.result if isinstance(response, ModelResponse) else [response]
+        usage = next((reply.usage_metadata for reply in replies if getattr(reply, "usage_metadata", None)), None)
+        input_tokens = usage.get("input_tokens") if usage else None
+        output_tokens = usage.get("output_tokens") if usage else None
+        if input_tokens is None:
+            output_tokens = count_tokens_approximately([reply for reply in replies if isinstance(reply, AIMessage)])
+        self.trace["used_tokens"] += (input_tokens if input_tokens is not None else tokens_sent) + (output_tokens or 0)
+        self.trace["steps"].append({
+            "step": len(self.trace["steps"]) + 1,
+            "messages": len(messages),
+            "compacted_results": compacted,
+            "tokens_full": tokens_full,
+            "tokens_sent": tokens_sent,
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "latency_ms": round(latency_ms, 1)
+        })
+        return response
+
+    def reset(self) -> None:
+        """Forget stored results, for when the conversation they belong to is cleared"""
+        self.store.clear()
+        self._compacted.clear()
+
+class ContextManagedMCPAgent(MCPAgent):
+    """MCPAgent whose agent graph also runs a ContextCompactor and offers its fetch tool"""
+
+    def __init__(self, *args, compactor: ContextCompactor, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compactor = compactor
+
+    def _create_agent(self):
+        # Mirrors MCPAgent._create_agent from mcp-use 1.7.1 (pinned exactly in requirements.txt, since
+        # MCPAgent takes no middleware of its own) with the compactor outermost; create_agent registers its fetch tool
+        middleware: List[Any] = [self.compactor]
+        if self.retry_on_error:
+            middleware.append(tool_error_handler)
+        middleware.append(ModelCallLimitMiddleware(run_limit=self.max_steps))
+        return create_agent(
+            model=self.llm,
+            tools=self._tools,
+            system_prompt=self._system_message or "You are a helpful assistant",
+            middleware=middleware,
+            debug=self.verbose
+        ).with_config({"recursion_limit": self.recursion_limit})
@@ -0,0 +1,240 @@
+"""
+Lazy stdio MCP servers
+Advertises cached tool manifests for command-based MCP servers and only
+spawns the server process when one of its tools is actually invoked
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import time
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any, List
+from mcp.types import Tool
+from mcp_use import MCPClient, MCPSession
+from mcp_use.connectors import StdioConnector
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MANIFEST_CACHE = os.getenv(
+    "MCP_TOOL_MANIFEST_CACHE",
+    str(Path.home() / ".cache" / "car-audio-events" / "mcp_tool_manifests.json")
+)
+
+class ToolManifestCache:
+    """JSON file cache of tool manifests, keyed by server name and launch config"""
+
+    def __init__(self, path: str = DEFAULT_MANIFEST_CACHE):
+        self.path = Path(path)
+        self._manifests: Dict[str, Dict[str, Any]] = {}
+        try:
+            with open(self.path) as f:
+                self._manifests = json.load(f)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable tool manifest cache {self.path}: {str(e)}")
+
+    @staticmethod
+    def fingerprint(server_config: Dict[str, Any]) -> str:
+        """Hash the parts of a server config that affect its tool list"""
+        launch = {key: server_config.get(key) for key in ("command", "args", "env")}
+        return hashlib.sha256(json.dumps(launch, sort_keys=True).encode()).hexdigest()[:16]
+
+    def get(self, server_name: str, fingerprint: str) -> Optional[List[Dict[str, Any]]]:
+        """Get the cached tools for a server, or None if missing or stale"""
+        entry = self._manifests.get(server_name)
+        if not entry or entry.get("fingerprint") != fingerprint:
+            return None
+        return entry["tools"]
+
+    def put(self, server_name: str, fingerprint: str, tools: List[Dict[str, Any]]) -> None:
+        """Store the tools for a server and persist the cache"""
+        self._manifests[server_name] = {
+            "fingerprint": fingerprint,
+            "tools": tools,
+            "updated_at": time.time()
+        }
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_suffix(".tmp")
+            with open(tmp_path, "w") as f:
+                json.dump(self._manifests, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write tool manifest cache {self.path}: {str(e)}")
+
+class LazyStdioConnector(StdioConnector):
+    """
+    Stdio connector that serves tools from a cached manifest and spawns
+    the server process on the first tool call. The process is shut down
+    again after it has been idle for idle_timeout seconds.
+    """
+
+    def __init__(
+        self,
+        server_name: str,
+        server_config: Dict[str, Any],
+        manifest_cache: ToolManifestCache,
+        idle_timeout: float = 300.0
+    ):
+        super().__init__(
+            command=server_config["command"],
+            args=server_config.get("args", []),
+            env=server_config.get("env")
+        )
+        self.server_name = server_name
+        self.manifest_cache = manifest_cache
+        self.fingerprint = manifest_cache.fingerprint(server_config)
+        self.idle_timeout = idle_timeout
+        self._spawned = False
+        self._session_info: Optional[Dict[str, Any]] = None
+        self._spawn_lock = asyncio.Lock()
+        self._in_flight = 0
+        self._last_used = 0.0
+        self._reaper: Optional[asyncio.Task] = None
+
+    @property
+    def spawned(self) -> bool:
+        """Whether the server process is currently running"""
+        return self._spawned
+
+    def _cached_tools(self) -> Optional[List[Tool]]:
+        manifest = self.manifest_cache.get(self.server_name, self.fingerprint)
+        if manifest is None:
+            return None
+        return [Tool.model_validate(tool) for tool in manifest]
+
+    async def connect(self) -> None:
+        """Connect only if there is no cached manifest to advertise"""
+        if self._spawned or self._cached_tools() is not None:
+            return
+        await self._spawn()
+
+    async def initialize(self) -> Optional[Dict[str, Any]]:
+        """Load tools from the manifest cache, falling back to the live server"""
+        if not self._spawned:
+            cached_tools = self._cached_tools()
+            if cached_tools is not None:
+                self._tools = cached_tools
+                self._resources = []
+                self._prompts = []
+                logger.info(f"Advertising {len(cached_tools)} cached tools for '{self.server_name}' without spawning")
+                return None
+            await self._spawn()
+        return self._session_info
+
+    async def _spawn(self) -> None:
+        """Start and initialize the server process, refresh its manifest and start the idle reaper"""
+        async with self._spawn_lock:
+            if self._spawned:
+                return
+            started = time.monotonic()
+            await super().connect()
+            self._session_info = await super().initialize()
+            self._spawned = True
+            self._last_used = time.monotonic()
+            logger.info(f"Spawned MCP server '{self.server_name}' in {time.monotonic() - started:.2f}s")
+
+            self.manifest_cache.put(
+                self.server_name,
+                self.fingerprint,
+                [tool.model_dump(mode="json", exclude_none=True) for tool in self._tools or []]
+            )
+            if self.idle_timeout > 0 and (self._reaper is None or self._reaper.done()):
+                self._reaper = asyncio.create_task(self._reap_when_idle())
+
+    async def _reap_when_idle(self) -> None:
+        """Shut the server process down once it has been idle long enough"""
+        while self._spawned:
+            idle_for = time.monotonic() - self._last_used
+            if self._in_flight == 0 and idle_for >= self.idle_timeout:
+                logger.info(f"Shutting down idle MCP server '{self.server_name}' after {idle_for:.0f}s")
+                await self._shutdown()
+                return
+            await asyncio.sleep(max(self.idle_timeout - idle_for, 1.0))
+
+    async def _shutdown(self) -> None:
+        """Stop the server process but keep advertising its tools"""
+        async with self._spawn_lock:
+            if not self._spawned:
+                return
+            tools = self._tools
+            await super().disconnect()
+            self._spawned = False
+            self._tools = tools
+            self._resources = []
+            self._prompts = []
+
+    async def call_tool(self, name: str, arguments: Dict[str, Any], *args, **kwargs):
+        """Spawn the server if needed, then call the tool"""
+        self._in_flight += 1
+        try:
+            if not self._spawned:
+                await self._spawn()
+            return await super().call_tool(name, arguments, *args, **kwargs)
+        finally:
+            self._in_flight -= 1
+            self._last_used = time.monotonic()
+
+    async def list_tools(self) -> List[Tool]:
+        """List tools without spawning the server"""
+        if not self._spawned:
+            return list(self._tools or self._cached_tools() or [])
+        return await super().list_tools()
+
+    async def list_resources(self):
+        """Resources are only available while the server is running"""
+        if not self._spawned:
+            return []
+        return await super().list_resources()
+
+    async def list_prompts(self):
+        """Prompts are only available while the server is running"""
+        if not self._spawned:
+            return []
+        return await super().list_prompts()
+
+    async def disconnect(self) -> None:
+        """Stop the idle reaper and the server process"""
+        if self._reaper and not self._reaper.done():
+            self._reaper.cancel()
+        self._reaper = None
+        if self._spawned:
+            await super().disconnect()
+            self._spawned = False
+
+def register_lazy_servers(
+    client: MCPClient,
+    idle_timeout: float = 300.0,
+    manifest_cache: Optional[ToolManifestCache] = None
+) -> Dict[str, LazyStdioConnector]:
+    """
+    Register every command-based server in the client config as a lazy session.
+    URL-based servers are left for the client to connect normally.
+
+    Args:
+        client: MCP client whose config lists the servers
+        idle_timeout: Seconds of inactivity before a spawned server is shut down
+        manifest_cache: Cache of tool manifests (defaults to DEFAULT_MANIFEST_CACHE)
+
+    Returns:
+        Lazy connectors by server name
+    """
+    manifest_cache = manifest_cache or ToolManifestCache()
+    connectors = {}
+
+    for name, server_config in client.config.get("mcpServers", {}).items():
+        if "command" not in server_config:
+            continue
+        connector = LazyStdioConnector(name, server_config, manifest_cache, idle_timeout)
+        client.sessions[name] = MCPSession(connector)
+        if name not in client.active_sessions:
+            client.active_sessions.append(name)
+        connectors[name] = connector
+
+    if connectors:
+        logger.info(f"Registered lazy MCP servers: {', '.join(connectors)}")
+    return connectors
@@ -0,0 +1,102 @@
+"""
+Parallel tool calls
+Bounds how many MCP tool calls from one LLM turn run at once, per agent
+and per server, and keeps statistics on the fan-out
+"""
+
+import asyncio
+import time
+from typing import Optional, Dict, Any, Callable
+from mcp_use.client.middleware import Middleware, MiddlewareContext
+from mcp_use.client.middleware.middleware import NextFunctionT
+
+# Servers whose tools share state between calls (one browser page), so calls run one at a time
+SERIAL_SERVERS: Dict[str, int] = {"playwright": 1}
+
+# Appended to the system prompt so the model batches calls it can batch
+PARALLEL_TOOL_INSTRUCTIONS = (
+    "When you need several tool calls whose inputs do not depend on each other's results "
+    "(for example analytics for three events, or creating SPL, SQ and Show classes), "
+    "request them together in a single turn; they are executed concurrently."
+)
+
+class ParallelToolLimiter(Middleware):
+    """
+    MCP client middleware that caps concurrent tool calls.
+
+    The agent graph dispatches every tool call of one LLM turn as its own
+    task and appends the results to the conversation in the order the model
+    requested them, so the calls overlap and the turn takes about as long as
+    its slowest call. This middleware bounds that fan-out: at most
+    max_parallel calls are in flight across all servers, and servers listed
+    in server_limits get their own, lower cap. A failing call raises only in
+    its own task; the agent reports it to the model as that call's result.
+    """
+
+    def __init__(
+        self,
+        max_parallel: int = 4,
+        server_limits: Optional[Dict[str, int]] = None,
+        server_resolver: Optional[Callable[[str], Optional[str]]] = None
+    ):
+        """
+        Args:
+            max_parallel: Most tool calls in flight at once
+            server_limits: Lower caps by server name
+            server_resolver: Maps a middleware connection ID to a server name
+        """
+        self.max_parallel = max(1, max_parallel)
+        self.server_limits = dict(SERIAL_SERVERS if server_limits is None else server_limits)
+        self.server_resolver = server_resolver
+        self._slots = asyncio.Semaphore(self.max_parallel)
+        self._server_slots: Dict[str, asyncio.Semaphore] = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.calls = 0
+        self.errors = 0
+        self.queued_seconds = 0.0
+
+    def _server_slot(self, connection_id: str) -> Optional[asyncio.Semaphore]:
+        server = self.server_resolver(connection_id) if self.server_resolver else None
+        limit = self.server_limits.get(server) if server else None
+        if limit is None:
+            return None
+        if server not in self._server_slots:
+            self._server_slots[server] = asyncio.Semaphore(max(1, limit))
+        return self._server_slots[server]
+
+    async def on_call_tool(self, context: MiddlewareContext, call_next: NextFunctionT) -> Any:
+        server_slot = self._server_slot(context.connection_id)
+        queued_at = time.monotonic()
+        if server_slot is not None:
+            await server_slot.acquire()
+        try:
+            async with self._slots:
+                self.queued_seconds += time.monotonic() - queued_at
+                self.calls += 1
+                self.in_flight += 1
+                self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+                try:
+                    result = await call_next(context)
+                    if getattr(result, "isError", False):
+                        self.errors += 1
+                    return result
+                except Exception:
+                    self.errors += 1
+                    raise
+                finally:
+                    self.in_flight -= 1
+        finally:
+            if server_slot is not None:
+                server_slot.release()
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "max_parallel": self.max_parallel,
+            "server_limits": self.server_limits,
+            "calls": self.calls,
+            "errors": self.errors,
+            "in_flight": self.in_flight,
+            "peak_in_flight": self.peak_in_flight,
+            "queued_seconds": round(self.queued_seconds, 3)
+        }
@@ -111,6 +111,7 @@ async def example_complex_workflow():
             "5. Set up a support FAQ for common competitor questions"
         )
         print(f"Workflow Result: {result}\n")
+        print(f"Tool calls: {agent.tool_stats()}\n")
     finally:
         await agent.close()
 